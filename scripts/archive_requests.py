@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Backfill and compact the request history archive
+Usage: python3 archive_requests.py [--dest URL] [--segments N] [--batch-rows ROWS]
+                                   [--include-pending] [--compact] [--since TIME] [--until TIME]
+
+Copies the rows still in EC2ApprovalRequests to the archive that the
+ArchiveRequests function fills from TTL deletes (see the layer's
+request_archive module). PENDING rows are skipped by default: their final
+status is archived when TTL deletes them, and a PENDING copy would sit in a
+different partition than the decided one.
+
+--compact merges each partition's part files into one instead. The stream
+writes one small file per partition per batch; compacting daily keeps
+year-long reads to a few hundred files.
+
+URL is a local directory or s3://bucket/prefix (default: $ARCHIVE_URL).
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import boto3
+
+from dynamodb_scan import parallel_scan_pages
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'layer', 'python'))
+
+import request_archive
+
+TABLE_NAME = os.environ.get('DYNAMODB_TABLE', 'EC2ApprovalRequests')
+REGION = os.environ.get('AWS_REGION', 'ap-southeast-5')
+
+# Rows buffered before they are written as one part file per partition
+DEFAULT_BATCH_ROWS = 50000
+
+def parse_time(value):
+    """Parse a Unix timestamp or ISO date/time (local time) for --since/--until"""
+    if value.isdigit():
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time '{value}', use YYYY-MM-DD[ HH:MM[:SS]] or a Unix timestamp")
+
+def backfill(dest, segments, batch_rows, include_pending):
+    """Scan the table and archive its rows in batches"""
+    table = boto3.resource('dynamodb', region_name=REGION).Table(TABLE_NAME)
+    scan_kwargs = {}
+    if not include_pending:
+        scan_kwargs = {
+            'FilterExpression': '#status <> :pending',
+            'ExpressionAttributeNames': {'#status': 'status'},
+            'ExpressionAttributeValues': {':pending': 'PENDING'}
+        }
+
+    buffer = []
+    archived = files = 0
+    pages = parallel_scan_pages(table, segments, table_factory=(lambda: table) if segments == 1 else None,
+                                **scan_kwargs)
+    for _, items, _ in pages:
+        buffer.extend(items)
+        if len(buffer) >= batch_rows:
+            files += len(request_archive.write(dest, buffer))
+            archived += len(buffer)
+            print(f"Archived {archived} rows")
+            buffer = []
+    if buffer:
+        files += len(request_archive.write(dest, buffer))
+        archived += len(buffer)
+    return archived, files
+
+def compact(dest, since=None, until=None):
+    """Merge the part files of every partition that has more than one"""
+    merged = rows = 0
+    for name, keys in request_archive.partitions(dest, since, until):
+        if len(keys) < 2:
+            continue
+        rows += request_archive.compact(dest, name, keys)
+        merged += len(keys)
+        print(f"  {name}: {len(keys)} files merged")
+    return merged, rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill or compact the EC2 approval request archive')
+    parser.add_argument('--dest', default=request_archive.ARCHIVE_URL,
+                        help='Archive root: local directory or s3://bucket/prefix (default: $ARCHIVE_URL)')
+    parser.add_argument('--segments', type=int, default=1, help='Parallel scan segments (default: 1)')
+    parser.add_argument('--batch-rows', type=int, default=DEFAULT_BATCH_ROWS,
+                        help=f'Rows per batch of part files (default: {DEFAULT_BATCH_ROWS})')
+    parser.add_argument('--include-pending', action='store_true', help='Also archive rows still PENDING')
+    parser.add_argument('--compact', action='store_true', help='Merge part files per partition instead of backfilling')
+    parser.add_argument('--since', type=parse_time, help='Only compact partitions from this day on')
+    parser.add_argument('--until', type=parse_time, help='Only compact partitions up to this day')
+    args = parser.parse_args()
+
+    if not args.dest:
+        parser.error('--dest or ARCHIVE_URL is required')
+
+    started = time.time()
+    if args.compact:
+        merged, rows = compact(args.dest, args.since, args.until)
+        print(f"Compacted {merged} part files ({rows} rows) in {time.time() - started:.1f}s")
+    else:
+        archived, files = backfill(args.dest, args.segments, args.batch_rows, args.include_pending)
+        print(f"Archived {archived} requests from {TABLE_NAME} to {args.dest} "
+              f"({files} part files) in {time.time() - started:.1f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Shared DynamoDB read helpers for the utility scripts.
+
+A single Scan or Query call returns at most 1 MB of data. These helpers
+follow LastEvaluatedKey until the table is exhausted and yield items as
+pages arrive, so callers never hold more than they choose to keep.
+Scans can optionally be split into parallel segments (Segment /
+TotalSegments), one worker thread per segment.
+"""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+# Pages buffered per segment before workers wait for the consumer
+PAGES_PER_SEGMENT = 2
+
+def scan_pages(table, segment=None, total_segments=None, start_key=None, **scan_kwargs):
+    """
+    Scan a table (or one segment of it) page by page.
+
+    Args:
+        table: boto3 DynamoDB Table resource
+        segment: Segment number for a parallel scan (optional)
+        total_segments: Total number of segments for a parallel scan (optional)
+        start_key: ExclusiveStartKey to resume from (optional)
+        **scan_kwargs: Extra arguments passed to table.scan()
+
+    Yields:
+        Tuple of (items, last_evaluated_key). last_evaluated_key is None on
+        the final page.
+    """
+    kwargs = dict(scan_kwargs)
+    if total_segments and total_segments > 1:
+        kwargs["Segment"] = segment
+        kwargs["TotalSegments"] = total_segments
+
+    while True:
+        if start_key:
+            kwargs["ExclusiveStartKey"] = start_key
+        response = table.scan(**kwargs)
+        start_key = response.get("LastEvaluatedKey")
+        yield response.get("Items", []), start_key
+        if not start_key:
+            return
+
+def query_pages(table, start_key=None, **query_kwargs):
+    """
+    Query a table or index page by page.
+
+    Yields:
+        Tuple of (items, last_evaluated_key), as for scan_pages()
+    """
+    kwargs = dict(query_kwargs)
+    while True:
+        if start_key:
+            kwargs["ExclusiveStartKey"] = start_key
+        response = table.query(**kwargs)
+        start_key = response.get("LastEvaluatedKey")
+        yield response.get("Items", []), start_key
+        if not start_key:
+            return
+
+def query_items(table, **query_kwargs):
+    """Yield every item matched by a query, following pagination"""
+    for items, _ in query_pages(table, **query_kwargs):
+        yield from items
+
+def scan_items(table, segments=1, table_factory=None, **scan_kwargs):
+    """
+    Yield every item in a table, following pagination.
+
+    With segments > 1 the table is scanned as a DynamoDB parallel scan, one
+    worker thread per segment. Items are yielded as soon as any segment
+    returns a page; ordering across segments is not defined.
+
+    Args:
+        table: boto3 DynamoDB Table resource
+        segments: Number of parallel scan segments (default: 1)
+        table_factory: Callable returning a Table for a worker thread.
+            Defaults to a fresh session per thread, since boto3 resources
+            must not be shared across threads.
+        **scan_kwargs: Extra arguments passed to table.scan()
+    """
+    if segments <= 1:
+        for items, _ in scan_pages(table, **scan_kwargs):
+            yield from items
+        return
+
+    for _, items, _ in parallel_scan_pages(table, segments, table_factory=table_factory, **scan_kwargs):
+        yield from items
+
+def parallel_scan_pages(table, segments, start_keys=None, skip_segments=(), table_factory=None, **scan_kwargs):
+    """
+    Run a parallel scan and yield pages from all segments as they arrive.
+
+    Args:
+        table: boto3 DynamoDB Table resource
+        segments: Total number of scan segments
+        start_keys: Optional dict of {segment: ExclusiveStartKey} to resume
+            from. Segments missing from the dict start at the beginning.
+        skip_segments: Segments already read to the end, e.g. on resume
+        table_factory: See scan_items()
+        **scan_kwargs: Extra arguments passed to table.scan()
+
+    Yields:
+        Tuple of (segment, items, last_evaluated_key). last_evaluated_key is
+        None on the final page of a segment.
+    """
+    factory = table_factory or (lambda: thread_table(table))
+    start_keys = start_keys or {}
+    active = [segment for segment in range(segments) if segment not in skip_segments]
+    pages = queue.Queue(maxsize=segments * PAGES_PER_SEGMENT)
+    stop = threading.Event()
+    done = object()
+
+    def put(value):
+        # Give up if the consumer has stopped reading
+        while not stop.is_set():
+            try:
+                pages.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker(segment):
+        try:
+            segment_table = factory()
+            for items, key in scan_pages(segment_table, segment, segments,
+                                         start_key=start_keys.get(segment), **scan_kwargs):
+                if not put((segment, items, key)):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    if not active:
+        return
+
+    with ThreadPoolExecutor(max_workers=len(active)) as pool:
+        for segment in active:
+            pool.submit(worker, segment)
+
+        try:
+            remaining = len(active)
+            while remaining:
+                page = pages.get()
+                if page is done:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield page
+        finally:
+            stop.set()
+
+def thread_table(table):
+    """Build a Table resource for the same table on a new session"""
+    session = boto3.session.Session(region_name=table.meta.client.meta.region_name)
+    return session.resource("dynamodb").Table(table.name)
@@ -0,0 +1,185 @@
+"""
+Region / account / table targets for the utility scripts.
+
+A target is written REGION[/TABLE][@PROFILE]:
+    ap-southeast-5                        the default table in that region
+    us-east-1/EC2ApprovalRequests-prod    another table name
+    eu-west-1@prod-viewer                 credentials of an AWS profile, e.g.
+                                          one with role_arn in another account
+
+Each target has its own boto3 session and one DynamoDB resource whose
+connection pool is shared by every request to that target. Targets are read
+concurrently, one worker thread each, so the time to read all of them
+follows the slowest target rather than their sum. A target that fails is
+reported in an errors dict and the others carry on.
+
+Environment Variables:
+    DYNAMODB_TARGETS: Comma-separated default targets
+    AWS_REGION: Region of the default target (default: ap-southeast-5)
+    DYNAMODB_TABLE: Table of the default target (default: EC2ApprovalRequests)
+"""
+
+import heapq
+import os
+import queue
+import threading
+
+import boto3
+from botocore.config import Config
+
+DEFAULT_REGION = os.environ.get('AWS_REGION', 'ap-southeast-5')
+DEFAULT_TABLE = os.environ.get('DYNAMODB_TABLE', 'EC2ApprovalRequests')
+
+# Connections per target, enough for a parallel scan's segments
+MAX_POOL = 25
+
+# Pages buffered per target before its worker waits for the consumer
+PAGES_PER_TARGET = 4
+
+class Target:
+    """One table in one region, read with one set of credentials"""
+
+    def __init__(self, region=DEFAULT_REGION, table_name=DEFAULT_TABLE, profile=None):
+        self.region = region
+        self.table_name = table_name
+        self.profile = profile
+        self.name = f"{region}/{table_name}" + (f"@{profile}" if profile else '')
+        self._table = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec):
+        """Build a target from REGION[/TABLE][@PROFILE]"""
+        spec, _, profile = spec.strip().partition('@')
+        region, _, table_name = spec.partition('/')
+        if not region:
+            raise ValueError(f"invalid target '{spec}', use REGION[/TABLE][@PROFILE]")
+        return cls(region, table_name or DEFAULT_TABLE, profile or None)
+
+    def new_table(self):
+        """A Table resource on a new session, for a thread of its own"""
+        session = boto3.session.Session(profile_name=self.profile, region_name=self.region)
+        return session.resource('dynamodb', config=Config(max_pool_connections=MAX_POOL)).Table(self.table_name)
+
+    @property
+    def table(self):
+        """The target's Table resource, built on first use"""
+        with self._lock:
+            if self._table is None:
+                self._table = self.new_table()
+        return self._table
+
+def parse_targets(specs=None):
+    """
+    Targets from command-line specs, else DYNAMODB_TARGETS, else the default
+    table in AWS_REGION.
+    """
+    if not specs:
+        specs = [spec for spec in os.environ.get('DYNAMODB_TARGETS', '').split(',') if spec.strip()]
+    targets = [Target.parse(spec) for spec in specs] or [Target()]
+    names = [target.name for target in targets]
+    if len(set(names)) != len(names):
+        raise ValueError(f"duplicate targets: {', '.join(names)}")
+    return targets
+
+def _feed(targets, outs, produce, errors):
+    """
+    Run produce(target, put) for every target on its own thread.
+
+    Each worker puts into its own entry of outs (queues may be shared) and
+    ends with None. Returns an Event that makes workers give up once set.
+    """
+    stop = threading.Event()
+
+    def worker(target, out):
+        def put(value):
+            # Give up if the consumer has stopped reading
+            while not stop.is_set():
+                try:
+                    out.put(value, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            produce(target, put)
+        except Exception as e:
+            errors[target.name] = e
+        finally:
+            put(None)
+
+    for target, out in zip(targets, outs):
+        threading.Thread(target=worker, args=(target, out), daemon=True).start()
+    return stop
+
+def merge_streams(targets, pages, key, errors):
+    """
+    Merge every target's rows, newest first, as they arrive.
+
+    A streaming k-way merge (heapq.merge) over one bounded queue per target:
+    each target is read on its own thread and at most PAGES_PER_TARGET of
+    its pages wait in memory.
+
+    Args:
+        targets: Targets to read
+        pages: pages(target) -> iterable of row lists, each target's rows
+            newest first within and across pages
+        key: Sort key of a row, e.g. its timestamp
+        errors: Dict filled with {target name: exception} for targets that
+            failed; their rows up to the failure are still merged
+
+    Yields:
+        (target, row), ordered by key descending across all targets
+    """
+    def produce(target, put):
+        for rows in pages(target):
+            if rows and not put(rows):
+                return
+
+    queues = [queue.Queue(maxsize=PAGES_PER_TARGET) for _ in targets]
+    stop = _feed(targets, queues, produce, errors)
+
+    def drain(target, out):
+        while True:
+            rows = out.get()
+            if rows is None:
+                return
+            for row in rows:
+                yield target, row
+
+    try:
+        yield from heapq.merge(*(drain(target, out) for target, out in zip(targets, queues)),
+                               key=lambda pair: key(pair[1]), reverse=True)
+    finally:
+        stop.set()
+
+def fan_in(targets, pages, errors):
+    """
+    Yield every target's pages in arrival order.
+
+    Args:
+        targets: Targets to read
+        pages: pages(target) -> iterable of item lists
+        errors: Filled with {target name: exception}, as for merge_streams()
+
+    Yields:
+        (target, items)
+    """
+    def produce(target, put):
+        for items in pages(target):
+            if not put((target, items)):
+                return
+
+    combined = queue.Queue(maxsize=PAGES_PER_TARGET * len(targets))
+    stop = _feed(targets, [combined] * len(targets), produce, errors)
+    try:
+        remaining = len(targets)
+        while remaining:
+            value = combined.get()
+            if value is None:
+                remaining -= 1
+            else:
+                yield value
+    finally:
+        stop.set()
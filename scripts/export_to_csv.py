@@ -1,22 +1,38 @@
 #!/usr/bin/env python3
 """
 Export EC2 Approval Requests to CSV
-Usage: python3 export_to_csv.py [output_file.csv]
+Usage: python3 export_to_csv.py [output_file.csv] [--segments N] [--stream]
+                                [--chunk-size ROWS] [--resume]
+                                [--archive URL [--since TIME] [--until TIME] [--status STATUS] [--user EMAIL]]
+                                [--target REGION[/TABLE][@PROFILE] ...]
+
+--target (repeatable, default $DYNAMODB_TARGETS or the table in $AWS_REGION)
+scans several regions, tables or accounts at once into one file, with a
+target column naming each row's source (see dynamodb_targets.py).
+
+--archive exports from the history archive (see the layer's
+request_archive module) instead of scanning the table. Only the day and
+status partitions matching the filters are read.
 """
 
-import boto3
+import argparse
 import csv
-import sys
+import heapq
+import itertools
+import json
 import os
+import shutil
+import sys
 from datetime import datetime
 from decimal import Decimal
 
-# Initialize DynamoDB
-TABLE_NAME = os.environ.get('DYNAMODB_TABLE', 'EC2ApprovalRequests')
-REGION = os.environ.get('AWS_REGION', 'ap-southeast-5')
+from dynamodb_scan import parallel_scan_pages
+from dynamodb_targets import fan_in, parse_targets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'layer', 'python'))
 
-dynamodb = boto3.resource('dynamodb', region_name=REGION)
-table = dynamodb.Table(TABLE_NAME)
+import request_archive
 
 def decimal_to_int(obj):
     """Convert Decimal to int"""
@@ -24,66 +40,289 @@ def decimal_to_int(obj):
         return int(obj)
     return obj
 
+def parse_time(value):
+    """Parse a Unix timestamp or ISO date/time (local time) for --since/--until"""
+    if value.isdigit():
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time '{value}', use YYYY-MM-DD[ HH:MM[:SS]] or a Unix timestamp")
+
 def format_timestamp(ts):
     """Format Unix timestamp to readable date"""
     if ts:
         return datetime.fromtimestamp(decimal_to_int(ts)).strftime('%Y-%m-%d %H:%M:%S')
     return ''
 
-def export_to_csv(filename='ec2_requests.csv'):
-    """Export all requests to CSV"""
-    response = table.scan()
-    items = response['Items']
-    
-    # Sort by timestamp (newest first)
-    items.sort(key=lambda x: decimal_to_int(x.get('timestamp', 0)), reverse=True)
-    
-    # Define CSV columns in logical order
-    fieldnames = [
-        'requestId',
-        'requestDate',
-        'status',
-        'requesterEmail',
-        'instanceName',
-        'instanceType',
-        'subnetId',
-        'securityGroupIds',
-        'amiId',
-        'ebsVolumeSize',
-        'ebsVolumeType',
-        'privateIpAddress',
-        'approverEmail',
-        'approvalDate',
-        'instanceId',
-        'executionArn'
-    ]
+# Define CSV columns in logical order
+FIELDNAMES = [
+    'requestId',
+    'requestDate',
+    'status',
+    'requesterEmail',
+    'instanceName',
+    'instanceType',
+    'subnetId',
+    'securityGroupIds',
+    'amiId',
+    'ebsVolumeSize',
+    'ebsVolumeType',
+    'privateIpAddress',
+    'approverEmail',
+    'approvalDate',
+    'instanceId',
+    'executionArn'
+]
+
+# Rows held in memory before a sorted export spills to disk
+DEFAULT_CHUNK_SIZE = 10000
+
+def item_to_row(item):
+    """Convert a DynamoDB item to a CSV row"""
+    row = {
+        'requestId': item.get('requestId', ''),
+        'requestDate': item.get('requestDate', format_timestamp(item.get('timestamp'))),
+        'status': item.get('status', ''),
+        'requesterEmail': item.get('requesterEmail', ''),
+        'instanceName': item.get('instanceName', ''),
+        'instanceType': item.get('instanceType', ''),
+        'subnetId': item.get('subnetId', ''),
+        'securityGroupIds': ', '.join(item.get('securityGroupIds', [])),
+        'amiId': item.get('amiId', ''),
+        'ebsVolumeSize': decimal_to_int(item.get('ebsVolumeSize')) if item.get('ebsVolumeSize') else '',
+        'ebsVolumeType': item.get('ebsVolumeType', ''),
+        'privateIpAddress': item.get('privateIpAddress', ''),
+        'approverEmail': item.get('approverEmail', ''),
+        'approvalDate': item.get('approvalDate', format_timestamp(item.get('approvalTimestamp'))),
+        'instanceId': ', '.join(item.get('instanceIds') or [item.get('instanceId', '')]),
+        'executionArn': item.get('executionArn', '')
+    }
+    if 'target' in item:
+        row['target'] = item['target']
+    return row
+
+def load_checkpoint(path):
+    """Load export progress, or None if there is no checkpoint"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    state['keys'] = {int(segment): key for segment, key in state['keys'].items()}
+    return state
+
+def save_checkpoint(path, state):
+    """Atomically persist export progress"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, default=decimal_to_int)
+    os.replace(tmp_path, path)
+
+def read_pages(state, target):
+    """
+    Scan the target's table from the checkpointed position.
+
+    Each page advances the in-memory checkpoint; callers decide when the
+    data it covers is safely on disk and the checkpoint can be saved.
+    """
+    segments = state['segments']
+    pages = parallel_scan_pages(
+        target.table,
+        segments,
+        start_keys=state['keys'],
+        skip_segments=state['done'],
+        table_factory=(lambda: target.table) if segments == 1 else target.new_table
+    )
+    for segment, items, key in pages:
+        if key:
+            state['keys'][segment] = key
+        else:
+            state['keys'].pop(segment, None)
+            state['done'].append(segment)
+        yield items
+
+def read_targets(targets, segments, errors):
+    """
+    Scan every target at once and yield pages as they arrive.
+
+    Items are tagged with their target's name. A target that fails is
+    recorded in errors; pages it returned before failing are kept.
+    """
+    def pages(target):
+        factory = (lambda: target.table) if segments == 1 else target.new_table
+        for _, items, _ in parallel_scan_pages(target.table, segments, table_factory=factory):
+            yield items
+
+    for target, items in fan_in(targets, pages, errors):
+        for item in items:
+            item['target'] = target.name
+        yield items
+
+def export_stream(filename, state, checkpoint_file, pages, fieldnames):
+    """Write rows in scan order as each page arrives"""
+    if state['rows']:
+        # Drop anything written after the last checkpoint
+        os.truncate(filename, state['offset'])
+        mode = 'a'
+    else:
+        mode = 'w'
     
-    with open(filename, 'w', newline='') as csvfile:
+    with open(filename, mode, newline='') as csvfile:
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
+        if mode == 'w':
+            writer.writeheader()
         
+        for items in pages:
+            for item in items:
+                writer.writerow(item_to_row(item))
+            csvfile.flush()
+            state['rows'] += len(items)
+            state['offset'] = os.path.getsize(filename)
+            if checkpoint_file:
+                save_checkpoint(checkpoint_file, state)
+
+def spill_chunk(rows, parts_dir, index):
+    """Sort a chunk newest first and write it to a spill file"""
+    rows.sort(key=lambda row: row[0], reverse=True)
+    path = os.path.join(parts_dir, f"chunk-{index:05d}.csv")
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+    return path
+
+def read_chunk(path):
+    """Read spilled rows back with their numeric sort key"""
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            row[0] = int(row[0])
+            yield row
+
+def export_sorted(filename, state, checkpoint_file, chunk_size, pages, fieldnames):
+    """
+    Write rows newest first using an external merge sort.
+
+    At most chunk_size rows are held in memory. Full chunks are sorted and
+    spilled to disk, then all chunks are merged into the output file.
+    """
+    parts_dir = f"{filename}.parts"
+    os.makedirs(parts_dir, exist_ok=True)
+    buffer = []
+    
+    for items in pages:
         for item in items:
-            row = {
-                'requestId': item.get('requestId', ''),
-                'requestDate': item.get('requestDate', format_timestamp(item.get('timestamp'))),
-                'status': item.get('status', ''),
-                'requesterEmail': item.get('requesterEmail', ''),
-                'instanceName': item.get('instanceName', ''),
-                'instanceType': item.get('instanceType', ''),
-                'subnetId': item.get('subnetId', ''),
-                'securityGroupIds': ', '.join(item.get('securityGroupIds', [])),
-                'amiId': item.get('amiId', ''),
-                'ebsVolumeSize': decimal_to_int(item.get('ebsVolumeSize')) if item.get('ebsVolumeSize') else '',
-                'ebsVolumeType': item.get('ebsVolumeType', ''),
-                'privateIpAddress': item.get('privateIpAddress', ''),
-                'approverEmail': item.get('approverEmail', ''),
-                'approvalDate': item.get('approvalDate', format_timestamp(item.get('approvalTimestamp'))),
-                'instanceId': item.get('instanceId', ''),
-                'executionArn': item.get('executionArn', '')
-            }
-            writer.writerow(row)
-    
-    print(f"✅ Exported {len(items)} requests to {filename}")
+            row = item_to_row(item)
+            buffer.append([decimal_to_int(item.get('timestamp', 0))] + [row[f] for f in fieldnames])
+        if len(buffer) >= chunk_size:
+            state['chunks'].append(spill_chunk(buffer, parts_dir, len(state['chunks'])))
+            state['rows'] += len(buffer)
+            buffer = []
+            if checkpoint_file:
+                save_checkpoint(checkpoint_file, state)
+    
+    if buffer and state['chunks']:
+        state['chunks'].append(spill_chunk(buffer, parts_dir, len(state['chunks'])))
+        state['rows'] += len(buffer)
+        buffer = []
+    
+    with open(filename, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(fieldnames)
+        
+        if state['chunks']:
+            chunks = [read_chunk(path) for path in state['chunks']]
+            rows = heapq.merge(*chunks, key=lambda row: row[0], reverse=True)
+        else:
+            # Everything fit in one chunk, no need to touch disk
+            buffer.sort(key=lambda row: row[0], reverse=True)
+            state['rows'] += len(buffer)
+            rows = buffer
+        
+        for row in rows:
+            writer.writerow(row[1:])
+    
+    shutil.rmtree(parts_dir, ignore_errors=True)
+
+def export_to_csv(filename='ec2_requests.csv', segments=1, stream=False,
+                  chunk_size=DEFAULT_CHUNK_SIZE, resume=False, targets=None):
+    """
+    Export all requests to CSV.
+    
+    By default rows are sorted newest first with a bounded-memory external
+    sort. With stream=True rows are written in scan order as pages arrive.
+    Progress is checkpointed to <filename>.checkpoint so an interrupted
+    export can be continued with resume=True.
+    
+    With several targets every table is scanned concurrently into the same
+    sort or stream, and a target column is added. Such exports are not
+    checkpointed; a target that fails is reported and the file holds the
+    rows read from it before the failure.
+    """
+    targets = targets or parse_targets()
+    if len(targets) > 1 and resume:
+        raise ValueError("--resume applies to single-target exports only")
+    checkpoint_file = f"{filename}.checkpoint" if len(targets) == 1 else None
+    state = load_checkpoint(checkpoint_file) if resume else None
+    
+    if state and (state['segments'] != segments or state['stream'] != stream):
+        raise ValueError("Checkpoint was written with different --segments/--stream options")
+    if state:
+        print(f"Resuming export after {state['rows']} rows")
+    else:
+        shutil.rmtree(f"{filename}.parts", ignore_errors=True)
+        state = {
+            'segments': segments,
+            'stream': stream,
+            'keys': {},
+            'done': [],
+            'rows': 0,
+            'offset': 0,
+            'chunks': []
+        }
+    
+    errors = {}
+    if len(targets) == 1:
+        pages, fieldnames = read_pages(state, targets[0]), FIELDNAMES
+    else:
+        pages, fieldnames = read_targets(targets, segments, errors), FIELDNAMES + ['target']
+    
+    if stream:
+        export_stream(filename, state, checkpoint_file, pages, fieldnames)
+    else:
+        export_sorted(filename, state, checkpoint_file, chunk_size, pages, fieldnames)
+    
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    
+    print_summary(filename, state['rows'])
+    for name, error in errors.items():
+        print(f"⚠️  {name} failed, only rows read before the error were exported: {str(error)}")
+
+def export_archive(filename, root, stream=False, since=None, until=None, status=None, email=None):
+    """
+    Export requests from the history archive.
+    
+    The archive yields partitions newest day first, so sorting newest first
+    only holds one day of rows in memory. With stream=True rows are written
+    in the order they are read.
+    """
+    rows = request_archive.read(root, since, until, [status] if status else None, email)
+    if not stream:
+        days = itertools.groupby(rows, key=lambda row: request_archive.day(row.get('timestamp')))
+        rows = (row for _, group in days
+                for row in sorted(group, key=lambda row: row.get('timestamp', 0), reverse=True))
+    
+    count = 0
+    with open(filename, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(item_to_row(row))
+            count += 1
+    
+    print_summary(filename, count)
+
+def print_summary(filename, rows):
+    """Print the row count and column layout of a finished export"""
+    print(f"✅ Exported {rows} requests to {filename}")
     print(f"\nColumns (in order):")
     print("1. Request Info: requestId, requestDate, status")
     print("2. Requester: requesterEmail")
@@ -93,14 +332,44 @@ def export_to_csv(filename='ec2_requests.csv'):
     print("6. Technical: executionArn")
 
 if __name__ == '__main__':
-    filename = sys.argv[1] if len(sys.argv) > 1 else 'ec2_requests.csv'
+    parser = argparse.ArgumentParser(description='Export EC2 Approval Requests to CSV')
+    parser.add_argument('filename', nargs='?', default='ec2_requests.csv', help='Output CSV file')
+    parser.add_argument('--segments', type=int, default=1, help='Parallel scan segments (default: 1)')
+    parser.add_argument('--stream', action='store_true', help='Write rows in scan order as pages arrive (unsorted)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'Rows held in memory per sort chunk (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted export from its checkpoint')
+    parser.add_argument('--archive', metavar='URL',
+                        help='Export from the history archive (directory or s3://bucket/prefix) instead of the table')
+    parser.add_argument('--since', type=parse_time, help='With --archive: only requests submitted at or after this time')
+    parser.add_argument('--until', type=parse_time, help='With --archive: only requests submitted at or before this time')
+    parser.add_argument('--status', help='With --archive: only requests with this status')
+    parser.add_argument('--user', help='With --archive: only requests by this requester email')
+    parser.add_argument('--target', action='append', metavar='REGION[/TABLE][@PROFILE]',
+                        help='Table to export; repeat to merge several regions or accounts '
+                             '(default: $DYNAMODB_TARGETS or the table in $AWS_REGION)')
+    
+    args = parser.parse_args()
+    if not args.archive and (args.since or args.until or args.status or args.user):
+        parser.error('--since, --until, --status and --user require --archive')
+    if args.archive and (args.resume or args.target):
+        parser.error('--resume and --target apply to table exports only')
+    try:
+        targets = parse_targets(args.target)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.resume and len(targets) > 1:
+        parser.error('--resume applies to single-target exports only')
     
     try:
-        export_to_csv(filename)
+        if args.archive:
+            export_archive(args.filename, args.archive, args.stream, args.since, args.until, args.status, args.user)
+        else:
+            export_to_csv(args.filename, args.segments, args.stream, args.chunk_size, args.resume, targets)
     except Exception as e:
         print(f"Error: {str(e)}")
         print("\nMake sure:")
-        print(f"1. DynamoDB table '{TABLE_NAME}' exists")
+        print(f"1. DynamoDB tables exist: {', '.join(target.name for target in targets)}")
         print("2. You have AWS credentials configured")
         print("3. You have permissions to read from DynamoDB")
-        print(f"\nSet DYNAMODB_TABLE environment variable if using a different table name")
+        print("\nSet DYNAMODB_TABLE environment variable or pass --target if using a different table name")
@@ -0,0 +1,2074 @@
+#!/usr/bin/env python3
+"""
+Local end-to-end load test of the approval workflow
+Usage: python3 load_test.py [--requests N] [--concurrency N] [--mix approve=80,reject=15,timeout=5]
+       python3 load_test.py --mode export [--rows N] [--segments 1,2,4,8] [--latency-ms MS]
+       python3 load_test.py --mode memory [--rows N] [--chunk-sizes 1000,10000]
+       python3 load_test.py --mode resume [--rows N] [--segments N] [--kill-after PAGES]
+       python3 load_test.py --mode targets [--rows N] [--target-latencies 20,50,100,200] [--fail-after PAGES]
+       python3 load_test.py --mode reconcile [--rows N] [--workers 10,32] [--describe-rate N] [--latency-ms MS]
+       python3 load_test.py --mode archive [--days N] [--per-day N]
+       python3 load_test.py --mode micro
+
+Drives synthetic requests through the handlers in src/lambda/ without
+touching AWS. RequestStarter submits them, a small in-process interpreter
+runs EC2ApprovalDemo-SIMPLE.json, and a simulated approver approves, rejects
+or lets each request time out. The executions then go on through LaunchEC2,
+CheckInstanceReadiness and FinalizeRequest. Changes to the requests table
+are fed to AggregateStats the way its DynamoDB Stream trigger would.
+
+The AWS services are in-memory stand-ins installed behind aws_clients:
+    DynamoDB        tables built from infrastructure/dynamodb/*-table-definition.json,
+                    with the condition and update expressions the layer uses
+    Step Functions  executions run by the interpreter (Task, Pass, Choice,
+                    Wait, Succeed, Fail; Catch but not Retry; Wait states
+                    do not sleep)
+    SES             keeps the emails; approval links are read back from them
+    EC2             launches instances that report running on the next
+                    status poll and status ok on the one after
+    SSM             resolves every AMI alias to one image
+
+Every call is counted, and --latency-ms adds a fixed delay to each to model
+network round trips. The report gives throughput, latency percentiles per
+handler and state, AWS calls per request, and whether every request ended
+with the status its simulated approver chose. With --duplicates, a share of
+the submissions is sent again with the same Idempotency-Key, first to the
+warm container and then as if to a new one, and the report shows what a
+duplicate costs. With --status-reads it compares the read units of listing
+each final status by scanning the requests table against querying the
+shards of StatusIndex, as view_dynamodb_logs.py does. With --digest,
+SendApprovalEmail stages each request for SendApprovalDigest, which is run
+until every approver's digest has gone out; --approvers spreads the
+requests over several approvers and --ses-rate caps SES sends per second.
+--approval-batch sends the decisions to POST /approval/batch instead of
+one link at a time. With --auto-approve, RequestStarter sends the requests
+its policy matches to EC2ApprovalDemo-EXPRESS.json, whose executions run
+as soon as they start, and the report gives how many took that fast path
+and their end-to-end latency.
+
+--mode runs one of the utility scripts against the DynamoDB stand-in
+instead, over --rows rows of seeded request history:
+    export          export_to_csv.py once per --segments count, timed
+    memory          a sorted export per --chunk-sizes value, each in a new
+                    process, and how much its peak RSS grew
+    resume          an export SIGKILLed after --kill-after scan pages, then
+                    run with --resume and compared with an uninterrupted
+                    export, both sorted and streamed
+    targets         view_dynamodb_logs.py and export_to_csv.py over several
+                    targets with different page latencies, one of them
+                    denied part way; checks the merged order, that every
+                    healthy row arrives and that only the failure is reported
+    reconcile       ReconcilePending over the history's stale PENDING rows,
+                    whose executions succeeded, failed, still run, no longer
+                    exist or were Express runs, once per --workers count;
+                    checks every repaired status and runs it a second time
+    archive         --days of --per-day requests archived with request_archive
+                    as ArchiveRequests writes them, then year, requester,
+                    status and month reads, before and after
+                    archive_requests.py --compact
+
+--mode micro times small pieces of the handlers in this process instead:
+    emails          rendering and sending each email template, locally and
+                    as an SES templated send, and the size of each payload
+    policy          matching requests against the --auto-approve policy
+    rate limit      taking a token, and rejecting from the container cache
+    metrics         the handler duration decorator, a stage record, and
+                    importing the module
+
+Rate limiting is off unless RATE_LIMIT_BURST is set, since the synthetic
+traffic comes from a few requesters. Needs botocore for its ClientError.
+"""
+
+import argparse
+import bisect
+import contextlib
+import copy
+import csv
+import glob
+import importlib
+import io
+import itertools
+import json
+import math
+import multiprocessing
+import operator
+import os
+import random
+import re
+import secrets
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import uuid
+import zlib
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'src', 'lambda'), os.path.join(ROOT, 'src', 'layer', 'python')]
+
+STATE_MACHINE_ARN = 'arn:aws:states:local:000000000000:stateMachine:EC2ApprovalDemo'
+DEFINITION = os.path.join(ROOT, 'src', 'stepfunctions', 'EC2ApprovalDemo-SIMPLE.json')
+EXPRESS_STATE_MACHINE_ARN = 'arn:aws:states:local:000000000000:stateMachine:EC2ApprovalDemo-Express'
+EXPRESS_DEFINITION = os.path.join(ROOT, 'src', 'stepfunctions', 'EC2ApprovalDemo-EXPRESS.json')
+
+# Policy for --auto-approve: single small instances from the synthetic domain
+AUTO_APPROVAL_POLICY = [{
+    'name': 'load-small',
+    'instanceTypes': ['t3.micro', 't3.small'],
+    'maxEbsVolumeSize': 30,
+    'requesterDomains': ['example.com'],
+    'maxInstances': 1
+}]
+
+# Configuration the handlers read at import; real environment variables win
+LOCAL_ENV = {
+    'STATE_MACHINE_ARN': STATE_MACHINE_ARN,
+    'FROM_EMAIL': 'noreply@example.com',
+    'APPROVAL_BASE_URL': 'https://approvals.example.com',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'RATE_LIMIT_BURST': '0'
+}
+
+HANDLERS = [
+    'RequestStarter',
+    'ResolveAMI',
+    'SendApprovalEmail',
+    'SendApprovalDigest',
+    'ApprovalHandler',
+    'LaunchEC2',
+    'CheckInstanceReadiness',
+    'FinalizeRequest',
+    'AggregateStats'
+]
+
+# Simulated account inventory
+VPC_ID = 'vpc-0load'
+SECURITY_GROUP = 'sg-0load'
+SUBNETS = [
+    ('subnet-0load1', 'us-east-1a', '10.0.1.0/24'),
+    ('subnet-0load2', 'us-east-1b', '10.0.2.0/24'),
+    ('subnet-0load3', 'us-east-1c', '10.0.3.0/24')
+]
+INSTANCE_TYPES = {'t3.micro': 2, 't3.small': 2, 't3.medium': 2, 'm5.large': 2, 'm5.xlarge': 4}
+ALIAS_AMI = 'ami-0a1a5a1a5a1a5a1a5'
+FLEET_SIZES = (2, 3, 5)
+
+# Records delivered to AggregateStats per invocation (the trigger's batch size)
+STREAM_BATCH_SIZE = 100
+
+# Scan and Query return at most 1 MB per call and bill reads in 4 KB units
+PAGE_BYTES = 1024 * 1024
+READ_UNIT_BYTES = 4096
+
+# Seeded history for the script benchmarks: one request every HISTORY_STEP
+# seconds back from HISTORY_END, so no two rows share a timestamp
+HISTORY_END = 1767225600
+HISTORY_STEP = 97
+HISTORY_STATUSES = {'APPROVED': 70, 'REJECTED': 15, 'EXPIRED': 10, 'PENDING': 5}
+# How the workflow of a stale PENDING history row ended, for --mode reconcile
+STALE_OUTCOMES = {'SUCCEEDED': 60, 'FAILED': 20, 'RUNNING': 10, 'MISSING': 5, 'EXPRESS': 5}
+
+APPROVAL_LINK = re.compile(r'action=approve&(?:amp;)?token=([A-Za-z0-9_-]+)')
+
+def client_error(code, operation, message='', **response):
+    """A botocore ClientError as the real client would raise it"""
+    return ClientError({'Error': {'Code': code, 'Message': message}, **response}, operation)
+
+class ConditionalCheckFailedException(ClientError):
+    pass
+
+# ---------------------------------------------------------------------------
+# AWS stand-ins
+# ---------------------------------------------------------------------------
+
+class Recorder:
+    """Counts AWS calls and applies the simulated round-trip latency"""
+
+    def __init__(self, latency_seconds):
+        self.latency_seconds = latency_seconds
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def call(self, service, operation_name):
+        with self._lock:
+            self.calls[f'{service}.{operation_name}'] += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+def operation(method):
+    """Count a fake client method as one AWS call"""
+    def wrapper(self, **kwargs):
+        self.recorder.call(self.service, method.__name__)
+        return method(self, **kwargs)
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+class Paginator:
+    """Paginator over a fake operation, following LastEvaluatedKey and MaxItems"""
+
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, PaginationConfig=None, **kwargs):
+        remaining = (PaginationConfig or {}).get('MaxItems')
+        while True:
+            page = self.method(**kwargs)
+            if remaining is not None and 'Items' in page:
+                page['Items'] = page['Items'][:remaining]
+                remaining -= len(page['Items'])
+            yield page
+            if not page.get('LastEvaluatedKey') or remaining == 0:
+                return
+            kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+class FakeService:
+    service = ''
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+
+    def get_paginator(self, operation_name):
+        return Paginator(getattr(self, operation_name))
+
+def attribute_value(attribute):
+    """Comparable Python value of a DynamoDB attribute"""
+    (kind, value), = attribute.items()
+    return Decimal(value) if kind == 'N' else value
+
+COMPARISONS = {
+    '=': operator.eq,
+    '<>': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge
+}
+
+class FakeDynamoDB(FakeService):
+    """
+    In-memory tables with atomic conditional writes.
+
+    Supports the expression subset the layer uses: conditions made of
+    attribute_exists/attribute_not_exists, begins_with and comparisons joined by AND/OR,
+    and SET/ADD/REMOVE updates. Writes to tables whose definition enables a
+    stream are queued as stream records. Scans return 1 MB pages and split
+    a table into parallel segments by a hash of the key. Queries, on the
+    table or a secondary index, filter the whole table on each call.
+    """
+    service = 'dynamodb'
+    exceptions = SimpleNamespace(ConditionalCheckFailedException=ConditionalCheckFailedException)
+
+    def __init__(self, recorder, definitions):
+        super().__init__(recorder)
+        self.keys = {d['TableName']: [k['AttributeName'] for k in d['KeySchema']] for d in definitions}
+        self.indexes = {(d['TableName'], index.get('IndexName')): [k['AttributeName'] for k in index['KeySchema']]
+                        for d in definitions
+                        for index in [d, *d.get('GlobalSecondaryIndexes', []), *d.get('LocalSecondaryIndexes', [])]}
+        self.streamed = {d['TableName'] for d in definitions
+                         if d.get('StreamSpecification', {}).get('StreamEnabled')}
+        self.tables = {name: {} for name in self.keys}
+        self.stream = []
+        self._segments = {}
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _key(self, table, item):
+        return tuple(attribute_value(item[name]) for name in self.keys[table])
+
+    def _store(self, table, key, old, new):
+        self._segments.clear()
+        if new is None:
+            self.tables[table].pop(key, None)
+        else:
+            self.tables[table][key] = new
+        if table in self.streamed:
+            images = {'SequenceNumber': f'{next(self._sequence):021d}'}
+            if new is not None:
+                images['NewImage'] = copy.deepcopy(new)
+            if old is not None:
+                images['OldImage'] = old
+            event = 'INSERT' if old is None else 'REMOVE' if new is None else 'MODIFY'
+            self.stream.append({'eventName': event, 'dynamodb': images})
+
+    def _check(self, expression, item, names, values, operation_name, return_old):
+        if not expression or self._condition(expression, item or {}, names or {}, values or {}):
+            return
+        response = {'Item': copy.deepcopy(item)} if return_old == 'ALL_OLD' and item else {}
+        raise ConditionalCheckFailedException(
+            {'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'The conditional request failed'},
+             **response},
+            operation_name
+        )
+
+    @staticmethod
+    def _predicate(expression, names, values):
+        """A condition expression parsed once into a test of an item"""
+        def term(text):
+            text = text.strip()
+            match = re.fullmatch(r'(attribute_exists|attribute_not_exists)\((\S+)\)', text)
+            if match:
+                name = names.get(match.group(2), match.group(2))
+                if match.group(1) == 'attribute_exists':
+                    return lambda item: name in item
+                return lambda item: name not in item
+            match = re.fullmatch(r'begins_with\((\S+),\s*(\S+)\)', text)
+            if match:
+                name = names.get(match.group(1), match.group(1))
+                prefix = attribute_value(values[match.group(2)])
+                return lambda item: name in item and str(attribute_value(item[name])).startswith(prefix)
+            match = re.fullmatch(r'(\S+)\s*(<=|>=|<>|<|>|=)\s*(\S+)', text)
+            if not match:
+                raise NotImplementedError(f'Condition not simulated: {text}')
+            left, comparison, right = match.groups()
+            name = names.get(left, left)
+            compare = COMPARISONS[comparison]
+            value = attribute_value(values[right])
+            return lambda item: name in item and compare(attribute_value(item[name]), value)
+
+        clauses = [[term(part) for part in re.split(r'\s+AND\s+', clause)]
+                   for clause in re.split(r'\s+OR\s+', expression)]
+        return lambda item: any(all(test(item) for test in clause) for clause in clauses)
+
+    @classmethod
+    def _condition(cls, expression, item, names, values):
+        return cls._predicate(expression, names, values)(item)
+
+    @staticmethod
+    def _update(item, expression, names, values):
+        for action, clauses in re.findall(r'(SET|ADD|REMOVE)\s+(.*?)(?=\s+(?:SET|ADD|REMOVE)\s|$)', expression):
+            for clause in clauses.split(','):
+                if action == 'SET':
+                    target, source = [part.strip() for part in clause.split('=', 1)]
+                    item[names.get(target, target)] = values[source]
+                elif action == 'ADD':
+                    target, source = clause.split()
+                    name = names.get(target, target)
+                    if 'N' not in values[source]:
+                        raise NotImplementedError(f'ADD not simulated for {values[source]}')
+                    current = Decimal(item[name]['N']) if name in item else 0
+                    item[name] = {'N': str(current + Decimal(values[source]['N']))}
+                else:
+                    target = clause.strip()
+                    item.pop(names.get(target, target), None)
+
+    @operation
+    def put_item(self, TableName, Item, ConditionExpression=None, ExpressionAttributeNames=None,
+                 ExpressionAttributeValues=None, ReturnValuesOnConditionCheckFailure=None, **_):
+        key = self._key(TableName, Item)
+        with self._lock:
+            old = self.tables[TableName].get(key)
+            self._check(ConditionExpression, old, ExpressionAttributeNames, ExpressionAttributeValues,
+                        'PutItem', ReturnValuesOnConditionCheckFailure)
+            self._store(TableName, key, old, copy.deepcopy(Item))
+        return {}
+
+    @operation
+    def get_item(self, TableName, Key, **_):
+        with self._lock:
+            item = self.tables[TableName].get(self._key(TableName, Key))
+            return {'Item': copy.deepcopy(item)} if item else {}
+
+    @operation
+    def update_item(self, TableName, Key, UpdateExpression, ConditionExpression=None,
+                    ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+                    ReturnValues=None, ReturnValuesOnConditionCheckFailure=None, **_):
+        key = self._key(TableName, Key)
+        with self._lock:
+            old = self.tables[TableName].get(key)
+            self._check(ConditionExpression, old, ExpressionAttributeNames, ExpressionAttributeValues,
+                        'UpdateItem', ReturnValuesOnConditionCheckFailure)
+            new = copy.deepcopy(old) if old else copy.deepcopy(Key)
+            self._update(new, UpdateExpression, ExpressionAttributeNames or {}, ExpressionAttributeValues or {})
+            self._store(TableName, key, old, new)
+        # Whole items stand in for the UPDATED_* projections
+        if ReturnValues in ('ALL_NEW', 'UPDATED_NEW'):
+            return {'Attributes': copy.deepcopy(new)}
+        if ReturnValues in ('ALL_OLD', 'UPDATED_OLD') and old:
+            return {'Attributes': old}
+        return {}
+
+    @operation
+    def delete_item(self, TableName, Key, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues=None, **_):
+        key = self._key(TableName, Key)
+        with self._lock:
+            old = self.tables[TableName].get(key)
+            self._check(ConditionExpression, old, ExpressionAttributeNames, ExpressionAttributeValues,
+                        'DeleteItem', None)
+            if old is not None:
+                self._store(TableName, key, old, None)
+        return {'Attributes': old} if ReturnValues == 'ALL_OLD' and old else {}
+
+    @operation
+    def batch_write_item(self, RequestItems, **_):
+        with self._lock:
+            for table, requests in RequestItems.items():
+                for request in requests:
+                    item = request['PutRequest']['Item'] if 'PutRequest' in request else request['DeleteRequest']['Key']
+                    key = self._key(table, item)
+                    old = self.tables[table].get(key)
+                    self._store(table, key, old, copy.deepcopy(item) if 'PutRequest' in request else None)
+        return {'UnprocessedItems': {}}
+
+    @operation
+    def batch_get_item(self, RequestItems, **_):
+        with self._lock:
+            responses = {table: [copy.deepcopy(self.tables[table][self._key(table, key)])
+                                 for key in request['Keys'] if self._key(table, key) in self.tables[table]]
+                         for table, request in RequestItems.items()}
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def _segment_keys(self, table, segment, total_segments):
+        """Keys of one scan segment in a stable order, kept until the table changes"""
+        cache_key = (table, segment, total_segments)
+        keys = self._segments.get(cache_key)
+        if keys is None:
+            keys = sorted(key for key in self.tables[table]
+                          if zlib.crc32(repr(key).encode()) % total_segments == segment)
+            self._segments[cache_key] = keys
+        return keys
+
+    @operation
+    def scan(self, TableName, Segment=0, TotalSegments=1, ExclusiveStartKey=None, Limit=None,
+             FilterExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None, **_):
+        """
+        One page of a (parallel) scan: up to PAGE_BYTES of items, or Limit
+        items, from the segment. Items are returned without copying, since a
+        scan returns thousands and nothing writes to them.
+        """
+        with self._lock:
+            table = self.tables[TableName]
+            keys = self._segment_keys(TableName, Segment, TotalSegments)
+            start = bisect.bisect_right(keys, self._key(TableName, ExclusiveStartKey)) if ExclusiveStartKey else 0
+            items = []
+            size = 0
+            end = start
+            while end < len(keys) and (Limit is None or end - start < Limit):
+                item = table[keys[end]]
+                size += item_size(item)
+                if size > PAGE_BYTES and end > start:
+                    break
+                items.append(item)
+                end += 1
+            last = {name: table[keys[end - 1]][name] for name in self.keys[TableName]} if end < len(keys) else None
+        if FilterExpression:
+            matches = self._predicate(FilterExpression, ExpressionAttributeNames or {}, ExpressionAttributeValues or {})
+            items = [item for item in items if matches(item)]
+        response = {'Items': items, 'Count': len(items), 'ScannedCount': end - start}
+        if last:
+            response['LastEvaluatedKey'] = last
+        return response
+
+    @operation
+    def query(self, TableName, KeyConditionExpression, IndexName=None, ExpressionAttributeNames=None,
+              ExpressionAttributeValues=None, ExclusiveStartKey=None, Limit=None, ProjectionExpression=None,
+              ScanIndexForward=True, **_):
+        """One page of a query, up to PAGE_BYTES or Limit items in range key order"""
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        index_keys = self.indexes[(TableName, IndexName)]
+        key_names = list(dict.fromkeys(self.keys[TableName] + index_keys))
+        with self._lock:
+            table = self.tables[TableName]
+            matches = self._predicate(KeyConditionExpression, names, values)
+            order = sorted(((attribute_value(item[index_keys[-1]]), key) for key, item in table.items()
+                            if matches(item)),
+                           reverse=not ScanIndexForward)
+            start = 0
+            if ExclusiveStartKey:
+                start = order.index((attribute_value(ExclusiveStartKey[index_keys[-1]]),
+                                     self._key(TableName, ExclusiveStartKey))) + 1
+            items = []
+            size = 0
+            end = start
+            while end < len(order) and (Limit is None or end - start < Limit):
+                item = table[order[end][1]]
+                size += item_size(item)
+                if size > PAGE_BYTES and end > start:
+                    break
+                items.append(item)
+                end += 1
+        last = {name: items[-1][name] for name in key_names} if end < len(order) else None
+        if ProjectionExpression:
+            projected = [names.get(name.strip(), name.strip()) for name in ProjectionExpression.split(',')]
+            items = [{name: item[name] for name in projected if name in item} for item in items]
+        else:
+            items = copy.deepcopy(items)
+        response = {'Items': items, 'Count': len(items), 'ScannedCount': len(items)}
+        if last:
+            response['LastEvaluatedKey'] = last
+        return response
+
+    def load(self, table, items):
+        """Seed items without counting calls or queuing stream records"""
+        with self._lock:
+            for item in items:
+                self.tables[table][self._key(table, item)] = item
+            self._segments.clear()
+
+    def item(self, table, *key):
+        """Read an item without counting a call"""
+        with self._lock:
+            return copy.deepcopy(self.tables[table].get(key))
+
+    def take_stream(self):
+        """Pending stream records, oldest first"""
+        with self._lock:
+            records, self.stream = self.stream, []
+        return records
+
+class FakeSES(FakeService):
+    """
+    Keeps every email as (to, content); content is the text part or template
+    data. With a rate, sends are spaced to that many per second, as SES's
+    maximum send rate and the client's retries would space them.
+    """
+    service = 'ses'
+
+    def __init__(self, recorder, rate=0):
+        super().__init__(recorder)
+        self.outbox = []
+        self.rate = rate
+        self._next_send = 0.0
+        self._lock = threading.Lock()
+
+    def _keep(self, to, content):
+        with self._lock:
+            self.outbox.append((to, content))
+
+    def _pace(self):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_send)
+            self._next_send = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    @operation
+    def send_email(self, Source, Destination, Message, **_):
+        self._pace()
+        for to in Destination['ToAddresses']:
+            self._keep(to, Message['Body']['Text']['Data'])
+        return {'MessageId': uuid.uuid4().hex}
+
+    @operation
+    def send_templated_email(self, Source, Destination, Template, TemplateData, **_):
+        self._pace()
+        for to in Destination['ToAddresses']:
+            self._keep(to, TemplateData)
+        return {'MessageId': uuid.uuid4().hex}
+
+    @operation
+    def send_bulk_templated_email(self, Source, Template, Destinations, **_):
+        self._pace()
+        for destination in Destinations:
+            for to in destination['Destination']['ToAddresses']:
+                self._keep(to, destination['ReplacementTemplateData'])
+        return {'Status': [{'Status': 'Success', 'MessageId': uuid.uuid4().hex} for _ in Destinations]}
+
+    def take_outbox(self):
+        with self._lock:
+            messages, self.outbox = self.outbox, []
+        return messages
+
+class FakeEC2(FakeService):
+    """
+    An account with SUBNETS and INSTANCE_TYPES; instances boot in two polls.
+    run_instances returns the first response again for a repeated ClientToken.
+    """
+    service = 'ec2'
+
+    def __init__(self, recorder):
+        super().__init__(recorder)
+        self.polls = {}
+        self.tokens = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @operation
+    def describe_subnets(self, **_):
+        return {'Subnets': [{
+            'SubnetId': subnet_id,
+            'AvailabilityZone': zone,
+            'VpcId': VPC_ID,
+            'CidrBlock': cidr,
+            'AvailableIpAddressCount': 250
+        } for subnet_id, zone, cidr in SUBNETS]}
+
+    @operation
+    def describe_security_groups(self, **_):
+        return {'SecurityGroups': [{'GroupId': SECURITY_GROUP, 'VpcId': VPC_ID}]}
+
+    @operation
+    def describe_instance_type_offerings(self, **_):
+        return {'InstanceTypeOfferings': [{'Location': zone, 'InstanceType': instance_type}
+                                          for _, zone, _ in SUBNETS for instance_type in INSTANCE_TYPES]}
+
+    @operation
+    def describe_instance_types(self, **_):
+        return {'InstanceTypes': [{'InstanceType': name, 'VCpuInfo': {'DefaultVCpus': vcpus}}
+                                  for name, vcpus in INSTANCE_TYPES.items()]}
+
+    @operation
+    def run_instances(self, ImageId, InstanceType, SubnetId, MinCount, MaxCount, ClientToken=None, **_):
+        instances = []
+        with self._lock:
+            if ClientToken in self.tokens:
+                return copy.deepcopy(self.tokens[ClientToken])
+            for _ in range(MaxCount):
+                instance_id = f'i-{next(self._ids):017x}'
+                self.polls[instance_id] = 0
+                instances.append({
+                    'InstanceId': instance_id,
+                    'InstanceType': InstanceType,
+                    'State': {'Name': 'pending'},
+                    'PrivateIpAddress': f'10.0.0.{len(self.polls) % 250 + 4}',
+                    'SubnetId': SubnetId,
+                    'ImageId': ImageId
+                })
+            if ClientToken:
+                self.tokens[ClientToken] = {'Instances': copy.deepcopy(instances)}
+        return {'Instances': instances}
+
+    @operation
+    def create_tags(self, **_):
+        return {}
+
+    @operation
+    def describe_instance_status(self, InstanceIds, **_):
+        statuses = []
+        with self._lock:
+            for instance_id in InstanceIds:
+                self.polls[instance_id] += 1
+                polls = self.polls[instance_id]
+                check = 'ok' if polls > 2 else 'initializing'
+                statuses.append({
+                    'InstanceId': instance_id,
+                    'InstanceState': {'Name': 'running' if polls > 1 else 'pending'},
+                    'InstanceStatus': {'Status': check},
+                    'SystemStatus': {'Status': check}
+                })
+        return {'InstanceStatuses': statuses}
+
+class FakeSSM(FakeService):
+    service = 'ssm'
+
+    @operation
+    def get_parameter(self, Name, **_):
+        return {'Parameter': {'Name': Name, 'Value': ALIAS_AMI}}
+
+class FakeStepFunctions(FakeService):
+    service = 'stepfunctions'
+
+    def __init__(self, recorder, machine):
+        super().__init__(recorder)
+        self.machine = machine
+
+    @operation
+    def start_execution(self, stateMachineArn, name, input='{}', **_):
+        return {'executionArn': self.machine.start(stateMachineArn, name, json.loads(input)),
+                'startDate': time.time()}
+
+    @operation
+    def describe_execution(self, executionArn, **_):
+        execution = self.machine.executions.get(executionArn)
+        if execution is None:
+            raise client_error('ExecutionDoesNotExist', 'DescribeExecution', f'Execution does not exist: {executionArn}')
+        response = {'executionArn': executionArn, 'status': execution.status,
+                    'input': json.dumps(execution.input)}
+        if execution.finished is not None:
+            response['stopDate'] = datetime.fromtimestamp(time.time() - (time.perf_counter() - execution.finished),
+                                                          timezone.utc)
+        if execution.status == 'SUCCEEDED':
+            response['output'] = json.dumps(execution.data)
+        if execution.error:
+            response.update(error=execution.error, cause=execution.cause or '')
+        return response
+
+    @operation
+    def send_task_success(self, taskToken, output, **_):
+        self.machine.resume(taskToken, ('success', json.loads(output)), 'SendTaskSuccess')
+        return {}
+
+    @operation
+    def send_task_failure(self, taskToken, error='', cause='', **_):
+        self.machine.resume(taskToken, ('failure', error, cause), 'SendTaskFailure')
+        return {}
+
+# ---------------------------------------------------------------------------
+# State machine interpreter
+# ---------------------------------------------------------------------------
+
+class TaskFailed(Exception):
+    """A state failed with a Step Functions error name (catchable)"""
+
+    def __init__(self, error, cause=''):
+        super().__init__(f'{error}: {cause}')
+        self.error = error
+        self.cause = cause
+
+class RuntimeFailure(TaskFailed):
+    """States.Runtime: a bad path or template; fails the execution uncaught"""
+
+    def __init__(self, cause):
+        super().__init__('States.Runtime', cause)
+
+def read_path(data, path):
+    """Value at a reference path such as $.ec2.Payload.Instances[0].InstanceId"""
+    value = data
+    for name, index in re.findall(r'\.([^.\[]+)|\[(\d+)\]', path[1:]):
+        try:
+            value = value[name] if name else value[int(index)]
+        except (KeyError, IndexError, TypeError):
+            raise RuntimeFailure(f'Path {path} not found in input')
+    return value
+
+def format_argument(value):
+    return value if isinstance(value, str) else json.dumps(value)
+
+def evaluate(expression, data, context):
+    """Value of a .$ field: a path, a $$ context path, or States.Format(...)"""
+    if expression.startswith('$$'):
+        return read_path(context, expression[1:])
+    if expression.startswith('$'):
+        return read_path(data, expression)
+    match = re.fullmatch(r'States\.Format\((.*)\)', expression, re.S)
+    if not match:
+        raise RuntimeFailure(f'Intrinsic function not simulated: {expression}')
+    arguments = [value.replace("\\'", "'") if value or not path else read_path(data, path)
+                 for value, path in re.findall(r"'((?:[^'\\]|\\.)*)'|(\$[^,\s)]*)", match.group(1))]
+    pieces = arguments[0].split('{}')
+    if len(pieces) != len(arguments):
+        raise RuntimeFailure(f'Argument count does not match the template: {expression}')
+    return pieces[0] + ''.join(format_argument(arg) + piece for arg, piece in zip(arguments[1:], pieces[1:]))
+
+def fill(template, data, context=None):
+    """Apply a Parameters/ResultSelector template to data"""
+    if isinstance(template, dict):
+        return {key[:-2] if key.endswith('.$') else key:
+                evaluate(value, data, context or {}) if key.endswith('.$') else fill(value, data, context)
+                for key, value in template.items()}
+    if isinstance(template, list):
+        return [fill(value, data, context) for value in template]
+    return template
+
+def place(data, path, value):
+    """Apply a ResultPath: replace, merge at a path, or (None) discard"""
+    if path is None:
+        return data
+    if path == '$':
+        return value
+    data = copy.deepcopy(data)
+    target = data
+    names = path[2:].split('.')
+    for name in names[:-1]:
+        target = target.setdefault(name, {})
+    target[names[-1]] = value
+    return data
+
+CHOICE_TESTS = {
+    'BooleanEquals': lambda value, expected: isinstance(value, bool) and value == expected,
+    'StringEquals': lambda value, expected: isinstance(value, str) and value == expected,
+    'NumericEquals': lambda value, expected: value == expected,
+    'NumericLessThan': lambda value, expected: value < expected,
+    'NumericLessThanEquals': lambda value, expected: value <= expected,
+    'NumericGreaterThan': lambda value, expected: value > expected,
+    'NumericGreaterThanEquals': lambda value, expected: value >= expected,
+    'IsNull': lambda value, expected: (value is None) == expected
+}
+
+def choice_matches(rule, data):
+    if 'And' in rule:
+        return all(choice_matches(r, data) for r in rule['And'])
+    if 'Or' in rule:
+        return any(choice_matches(r, data) for r in rule['Or'])
+    if 'Not' in rule:
+        return not choice_matches(rule['Not'], data)
+    if 'IsPresent' in rule:
+        try:
+            read_path(data, rule['Variable'])
+            return rule['IsPresent']
+        except RuntimeFailure:
+            return not rule['IsPresent']
+    value = read_path(data, rule['Variable'])
+    for name, test in CHOICE_TESTS.items():
+        if name in rule:
+            return test(value, rule[name])
+    raise RuntimeFailure(f'Choice rule not simulated: {rule}')
+
+class Execution:
+    def __init__(self, arn, data, definition):
+        self.arn = arn
+        self.input = data
+        self.data = data
+        self.definition = definition
+        self.state = definition['StartAt']
+        self.status = 'RUNNING'
+        self.error = None
+        self.cause = None
+        self.token = None
+        self.resumed = None
+        self.waiting = False
+        self.waited_seconds = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+class StateMachine:
+    """
+    Runs executions of state machine definitions, keyed by ARN, in process.
+
+    Executions advance until they wait for a task token or reach a Wait
+    state; drain() keeps advancing them until none is runnable. Executions
+    of the machines in express start on pool as soon as they are started,
+    as Step Functions runs them, rather than on the next drain(). Lambda
+    tasks call the handlers directly, with the payload and result passed
+    through JSON as Lambda would.
+    """
+
+    def __init__(self, definitions, handlers, timings, express=()):
+        self.definitions = definitions
+        self.express = set(express)
+        self.handlers = handlers
+        self.timings = timings
+        self.pool = None
+        self.executions = {}
+        self.tasks = {}
+        self.closed = {}
+        self.runnable = deque()
+        self.running = []
+        self._lock = threading.Lock()
+
+    def start(self, state_machine_arn, name, data):
+        if state_machine_arn not in self.definitions:
+            raise client_error('StateMachineDoesNotExist', 'StartExecution', f'{state_machine_arn} does not exist')
+        arn = f"{state_machine_arn.replace(':stateMachine:', ':execution:')}:{name}"
+        with self._lock:
+            if arn in self.executions:
+                raise client_error('ExecutionAlreadyExists', 'StartExecution', f'Execution {name} already exists')
+            execution = Execution(arn, data, self.definitions[state_machine_arn])
+            self.executions[arn] = execution
+            if state_machine_arn in self.express and self.pool is not None:
+                self.running.append(self.pool.submit(self.advance, execution))
+            else:
+                self.runnable.append(execution)
+        return arn
+
+    def resume(self, token, outcome, operation_name):
+        """Complete a waiting task; raises the service's errors for closed tokens"""
+        with self._lock:
+            execution = self.tasks.pop(token, None)
+            if execution is None:
+                code = self.closed.get(token, 'InvalidToken')
+                raise client_error(code, operation_name, 'Task is no longer open')
+            self.closed[token] = 'TaskTimedOut' if outcome[0] == 'timeout' else 'TaskDoesNotExist'
+            execution.resumed = ('failure', 'States.Timeout', 'Task timed out') if outcome[0] == 'timeout' else outcome
+            self.runnable.append(execution)
+
+    def time_out(self, token):
+        """Let a waiting task hit its TimeoutSeconds now"""
+        try:
+            self.resume(token, ('timeout',), 'Timeout')
+            return True
+        except ClientError:
+            return False
+
+    def drain(self, pool):
+        while True:
+            with self._lock:
+                batch = list(self.runnable)
+                self.runnable.clear()
+                running, self.running = self.running, []
+            for future in running:
+                future.result()
+            if not batch and not running:
+                return
+            list(pool.map(self.advance, batch))
+
+    def invoke(self, function_name, payload, label):
+        """Call a handler as a Lambda invocation, timing it under label"""
+        handler = self.handlers[function_name.split(':')[-1]]
+        event = json.loads(json.dumps(payload))
+        started = time.perf_counter()
+        try:
+            result = handler(event, None)
+        except Exception as e:
+            raise TaskFailed(type(e).__name__, str(e))
+        finally:
+            self.timings.record(label, time.perf_counter() - started)
+        return json.loads(json.dumps(result))
+
+    def advance(self, execution):
+        """Run an execution until it waits or ends"""
+        self._advance(execution)
+        if execution.status != 'RUNNING':
+            execution.finished = time.perf_counter()
+
+    def _advance(self, execution):
+        while execution.status == 'RUNNING':
+            state = execution.definition['States'][execution.state]
+            try:
+                outcome = getattr(self, '_' + state['Type'].lower())(execution, state)
+            except RuntimeFailure as e:
+                execution.status, execution.error, execution.cause = 'FAILED', e.error, e.cause
+                return
+            except TaskFailed as e:
+                if not self._catch(execution, state, e):
+                    execution.status, execution.error, execution.cause = 'FAILED', e.error, e.cause
+                continue
+            if outcome is None:
+                return
+            kind, value = outcome
+            if kind == 'goto':
+                execution.state = value
+            elif state.get('End') or state['Type'] == 'Succeed':
+                execution.data, execution.status = value, 'SUCCEEDED'
+            else:
+                execution.data, execution.state = value, state['Next']
+
+    def _catch(self, execution, state, failure):
+        for catcher in state.get('Catch', []):
+            errors = catcher['ErrorEquals']
+            if failure.error in errors or 'States.ALL' in errors or (
+                    'States.TaskFailed' in errors and failure.error != 'States.Timeout'):
+                execution.data = place(execution.data, catcher.get('ResultPath', '$'),
+                                       {'Error': failure.error, 'Cause': failure.cause})
+                execution.state = catcher['Next']
+                return True
+        return False
+
+    def _result(self, state, data, result):
+        if 'ResultSelector' in state:
+            result = fill(state['ResultSelector'], result)
+        return 'next', place(data, state.get('ResultPath', '$'), result)
+
+    def _task(self, execution, state):
+        if execution.resumed is not None:
+            outcome, execution.resumed, execution.token = execution.resumed, None, None
+            if outcome[0] == 'failure':
+                raise TaskFailed(outcome[1], outcome[2])
+            return self._result(state, execution.data, outcome[1])
+
+        waits = state['Resource'].endswith('.waitForTaskToken')
+        context = {'Execution': {'Id': execution.arn}, 'State': {'Name': execution.state}}
+        if waits:
+            execution.token = secrets.token_urlsafe(96)
+            context['Task'] = {'Token': execution.token}
+            with self._lock:
+                self.tasks[execution.token] = execution
+        parameters = fill(state.get('Parameters', {}), execution.data, context)
+        try:
+            result = self.invoke(parameters['FunctionName'], parameters.get('Payload', {}), execution.state)
+        except TaskFailed:
+            if waits:
+                with self._lock:
+                    self.tasks.pop(execution.token, None)
+            raise
+        if waits:
+            return None
+        return self._result(state, execution.data, {'StatusCode': 200, 'Payload': result})
+
+    def _pass(self, execution, state):
+        if 'Parameters' in state:
+            result = fill(state['Parameters'], execution.data)
+        else:
+            result = state.get('Result', execution.data)
+        return 'next', place(execution.data, state.get('ResultPath', '$'), result)
+
+    def _choice(self, execution, state):
+        for rule in state['Choices']:
+            if choice_matches(rule, execution.data):
+                return 'goto', rule['Next']
+        if 'Default' not in state:
+            raise TaskFailed('States.NoChoiceMatched', f'No choice matched in {execution.state}')
+        return 'goto', state['Default']
+
+    def _wait(self, execution, state):
+        if execution.waiting:
+            execution.waiting = False
+            return 'next', execution.data
+        seconds = read_path(execution.data, state['SecondsPath']) if 'SecondsPath' in state else state.get('Seconds', 0)
+        execution.waited_seconds += seconds
+        execution.waiting = True
+        with self._lock:
+            self.runnable.append(execution)
+        return None
+
+    def _succeed(self, execution, state):
+        return 'next', execution.data
+
+    def _fail(self, execution, state):
+        execution.status, execution.error, execution.cause = 'FAILED', state.get('Error', 'States.Fail'), state.get('Cause')
+        return None
+
+# ---------------------------------------------------------------------------
+# Load driver
+# ---------------------------------------------------------------------------
+
+class Timings:
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, label, seconds):
+        with self._lock:
+            self.samples.setdefault(label, []).append(seconds)
+
+    def timed(self, label, function, *args):
+        started = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.record(label, time.perf_counter() - started)
+
+def attribute_size(attribute):
+    """Bytes DynamoDB counts for one attribute value"""
+    (kind, value), = attribute.items()
+    if kind == 'S':
+        return len(value.encode())
+    if kind == 'N':
+        digits = value.lstrip('-').replace('.', '').strip('0')
+        return (len(digits) + 1) // 2 + 1
+    if kind in ('BOOL', 'NULL'):
+        return 1
+    if kind == 'L':
+        return 3 + sum(1 + attribute_size(element) for element in value)
+    if kind == 'M':
+        return 3 + sum(1 + len(name.encode()) + attribute_size(element) for name, element in value.items())
+    if kind in ('SS', 'NS'):
+        return sum(attribute_size({kind[0]: element}) for element in value)
+    raise NotImplementedError(f'Size of {kind} attributes not simulated')
+
+def item_size(item):
+    return sum(len(name.encode()) + attribute_size(value) for name, value in item.items())
+
+def read_units(sizes):
+    """Eventually consistent read units to read items of these sizes in 1 MB pages"""
+    units = 0
+    page = 0
+    for size in sizes:
+        if page + size > PAGE_BYTES:
+            units += math.ceil(page / READ_UNIT_BYTES) / 2
+            page = 0
+        page += size
+    # A call that returns nothing still costs one unit
+    return units + max(1, math.ceil(page / READ_UNIT_BYTES)) / 2
+
+def status_reads(items, shards):
+    """
+    Read units of listing each status by Scan with a FilterExpression and by
+    one StatusIndex Query per shard.
+
+    Returns:
+        {status: (matching items, scan units, query units, items missing from the index)}
+    """
+    scan = read_units(item_size(item) for item in items)
+    reads = {}
+    for status in sorted({item['status']['S'] for item in items}):
+        matching = [item for item in items if item['status']['S'] == status]
+        query = sum(read_units(item_size(item) for item in matching
+                               if item.get('statusShard', {}).get('S') == f'{status}#{shard}')
+                    for shard in range(shards))
+        missing = sum(1 for item in matching if not item.get('statusShard', {}).get('S', '').startswith(f'{status}#'))
+        reads[status] = (len(matching), scan, query, missing)
+    return reads
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of a sorted list"""
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+def parse_mix(text):
+    """'approve=80,reject=15,timeout=5' -> normalized weights"""
+    weights = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ('approve', 'reject', 'timeout'):
+            raise argparse.ArgumentTypeError(f'Unknown outcome in --mix: {name}')
+        weights[name.strip()] = float(weight)
+    return weights
+
+def synthetic_request(rng, index, args):
+    """A request shaped like the frontend's, varied over the features the workflow branches on"""
+    count = (args.fleet_size or rng.choice(FLEET_SIZES)) if rng.random() < args.fleet_share else 1
+    ebs_size = rng.choice([None, 20, 100])
+    request = {
+        'requesterEmail': f'user{index % args.requesters}@example.com',
+        'approverEmail': f'approver{index % args.approvers}@example.com',
+        'instanceName': f'load-{index}',
+        'instanceType': rng.choice(list(INSTANCE_TYPES)),
+        'subnetId': SUBNETS[index % len(SUBNETS)][0],
+        'securityGroupIds': [SECURITY_GROUP],
+        'instanceCount': count,
+        'ebsVolumeSize': ebs_size,
+        'ebsVolumeType': 'gp3' if ebs_size else None,
+        'privateIpAddress': None,
+        'waitForReady': rng.random() < args.ready_share
+    }
+    if count > 1:
+        request['subnetIds'] = [subnet_id for subnet_id, _, _ in SUBNETS]
+    if rng.random() < 0.5:
+        request['amiId'] = 'ami-0123456789abcdef0'
+    else:
+        request['osAlias'] = 'al2023-latest'
+    return request
+
+def load_table_definitions():
+    definitions = []
+    for path in sorted(glob.glob(os.path.join(ROOT, 'infrastructure', 'dynamodb', '*table-definition.json'))):
+        with open(path) as f:
+            definitions.append(json.load(f))
+    return definitions
+
+def load_handlers(args):
+    if args.auto_approve:
+        os.environ.setdefault('AUTO_APPROVAL_POLICY', json.dumps(AUTO_APPROVAL_POLICY))
+        os.environ.setdefault('EXPRESS_STATE_MACHINE_ARN', EXPRESS_STATE_MACHINE_ARN)
+    if args.digest:
+        # Every approver's digest is due on the first flush
+        os.environ.update({'DIGEST_MODE': 'true', 'DIGEST_WINDOW_SECONDS': '0'})
+    for name, value in LOCAL_ENV.items():
+        os.environ.setdefault(name, value)
+    return {name: importlib.import_module(name).lambda_handler for name in HANDLERS}
+
+def run(args):
+    """Run the whole load test and return what the report needs"""
+    handlers = load_handlers(args)
+    import aws_clients
+    import idempotency
+    import request_status
+
+    rng = random.Random(args.seed)
+    timings = Timings()
+    recorder = Recorder(args.latency_ms / 1000)
+    definitions = {}
+    for arn, path in ((STATE_MACHINE_ARN, args.definition), (EXPRESS_STATE_MACHINE_ARN, EXPRESS_DEFINITION)):
+        with open(path) as f:
+            definitions[arn] = json.load(f)
+    machine = StateMachine(definitions, handlers, timings, express=[EXPRESS_STATE_MACHINE_ARN])
+    dynamodb = FakeDynamoDB(recorder, load_table_definitions())
+    ses = FakeSES(recorder, args.ses_rate)
+    aws_clients._clients.update({
+        'dynamodb': dynamodb,
+        'ses': ses,
+        'ec2': FakeEC2(recorder),
+        'ssm': FakeSSM(recorder),
+        'stepfunctions': FakeStepFunctions(recorder, machine)
+    })
+
+    requests = [synthetic_request(rng, i, args) for i in range(args.requests)]
+    batches = [requests[i:i + args.batch_size] for i in range(0, len(requests), args.batch_size)]
+    keys = [uuid.uuid4().hex for _ in batches]
+    resent = [i for i in range(len(batches)) if rng.random() < args.duplicates] if args.duplicates else []
+    duplicates = []
+    outcomes = list(args.mix)
+    weights = list(args.mix.values())
+    planned = {}
+    status_codes = Counter()
+
+    def submit(batch, key, label='RequestStarter'):
+        body = batch[0] if args.batch_size == 1 else batch
+        try:
+            result = timings.timed(label, handlers['RequestStarter'], {
+                'httpMethod': 'POST',
+                'headers': {'Idempotency-Key': key},
+                'body': json.dumps(body)
+            }, None)
+        except Exception as e:
+            # API Gateway turns an unhandled error into a 502
+            print(f"RequestStarter failed: {str(e)}")
+            return 502
+        return result['statusCode']
+
+    def decide(decision):
+        token_id, outcome = decision
+        record = dynamodb.item('EC2ApprovalTokens', token_id)
+        if outcome == 'timeout':
+            machine.time_out(record['taskToken']['S'])
+            planned[record['requestId']['S']] = 'EXPIRED'
+            return
+        response = timings.timed('ApprovalHandler', handlers['ApprovalHandler'], {
+            'httpMethod': 'GET',
+            'queryStringParameters': {'action': outcome, 'token': token_id}
+        }, None)
+        if response['statusCode'] == 200:
+            planned[record['requestId']['S']] = 'APPROVED' if outcome == 'approve' else 'REJECTED'
+
+    def decide_batch(batch):
+        records = [dynamodb.item('EC2ApprovalTokens', token_id) for token_id, _ in batch]
+        response = timings.timed('ApprovalHandler (batch)', handlers['ApprovalHandler'], {
+            'httpMethod': 'POST',
+            'body': json.dumps({'decisions': [{'token': token_id, 'action': outcome} for token_id, outcome in batch]})
+        }, None)
+        for record, result in zip(records, json.loads(response['body']).get('results', [])):
+            if result['outcome'] in ('APPROVED', 'REJECTED'):
+                planned[record['requestId']['S']] = result['outcome']
+
+    def deliver_stream():
+        records = dynamodb.take_stream()
+        for start in range(0, len(records), STREAM_BATCH_SIZE):
+            timings.timed('AggregateStats', handlers['AggregateStats'],
+                          {'Records': records[start:start + STREAM_BATCH_SIZE]}, None)
+
+    output = sys.stdout if args.verbose else open(os.devnull, 'w')
+    started = time.perf_counter()
+    # Express executions run as soon as they start, beside the submissions
+    with contextlib.redirect_stdout(output), ThreadPoolExecutor(max_workers=args.concurrency) as pool, \
+            ThreadPoolExecutor(max_workers=args.concurrency) as machine.pool:
+        status_codes.update(pool.map(submit, batches, keys))
+        for label, container in (('Duplicate (warm)', 'the warm container'),
+                                 ('Duplicate (new container)', 'a new container')):
+            if not resent:
+                break
+            if duplicates:
+                # A new container starts with an empty in-process LRU
+                idempotency._cache.clear()
+            calls = sum(recorder.calls.values())
+            executions = len(machine.executions)
+            codes = Counter(pool.map(submit, [batches[i] for i in resent], [keys[i] for i in resent],
+                                     itertools.repeat(label)))
+            duplicates.append((container, codes, sum(recorder.calls.values()) - calls,
+                               len(machine.executions) - executions))
+        machine.drain(pool)
+        if args.digest:
+            # The scheduled flush, run until no approver has anything staged
+            while timings.timed('SendApprovalDigest', handlers['SendApprovalDigest'], {}, None)['requests']:
+                pass
+        # Auto-approved requests may have notified their requesters by now
+        outbox = ses.take_outbox()
+        approval_emails = [(to, content) for to, content in outbox if to.startswith('approver')]
+        notified = len(outbox) - len(approval_emails)
+        emails_sent = (time.perf_counter() - started, sum(count for name, count in recorder.calls.items()
+                                                          if name.startswith('ses.')) - notified)
+        deliver_stream()
+
+        links = [link for _, content in approval_emails for link in APPROVAL_LINK.finditer(content)]
+        decisions = [(link.group(1), rng.choices(outcomes, weights)[0]) for link in links]
+        clicks = [decision for decision in decisions if decision[1] != 'timeout']
+        decisions_started = time.perf_counter()
+        if args.approval_batch:
+            list(pool.map(decide, [decision for decision in decisions if decision[1] == 'timeout']))
+            list(pool.map(decide_batch, [clicks[i:i + args.approval_batch]
+                                         for i in range(0, len(clicks), args.approval_batch)]))
+        else:
+            list(pool.map(decide, decisions))
+        decided = (len(clicks), time.perf_counter() - decisions_started)
+        machine.drain(pool)
+        deliver_stream()
+    elapsed = time.perf_counter() - started
+
+    statuses = {key[0]: item['status']['S'] for key, item in dynamodb.tables['EC2ApprovalRequests'].items()}
+    executions = list(machine.executions.values())
+    express = [e for e in executions if e.definition is definitions[EXPRESS_STATE_MACHINE_ARN]]
+    standard = [e for e in executions if e.definition is not definitions[EXPRESS_STATE_MACHINE_ARN]]
+    for execution in express:
+        planned[execution.input['requestId']] = 'APPROVED'
+    return {
+        'elapsed': elapsed,
+        'status_codes': status_codes,
+        'started': len(executions),
+        'executions': Counter(e.status for e in executions),
+        'errors': Counter(e.error for e in executions if e.error),
+        'causes': {e.error: f'{e.cause} (in {e.state})' for e in executions if e.error},
+        'statuses': Counter(statuses.values()),
+        'mismatched': sum(1 for request_id, status in planned.items() if statuses.get(request_id) != status),
+        'unplanned': len(executions) - len(planned),
+        'decided': decided,
+        'latency': {workflow: sorted((e.finished - e.started) * 1000 for e in group if e.finished)
+                    for workflow, group in (('express', express), ('standard', standard))},
+        'approval_emails': (len(approval_emails), len({to for to, _ in approval_emails}), *emails_sent),
+        'notifications': notified + sum(1 for to, _ in ses.take_outbox() if not to.startswith('approver')),
+        'waited': sum(e.waited_seconds for e in executions),
+        'duplicates': duplicates,
+        'status_reads': status_reads(list(dynamodb.tables['EC2ApprovalRequests'].values()),
+                                     request_status.STATUS_SHARDS) if args.status_reads else {},
+        'timings': timings.samples,
+        'calls': recorder.calls
+    }
+
+def report(args, result):
+    started = result['started'] or 1
+    elapsed = result['elapsed']
+    handler_time = sum(sum(samples) for samples in result['timings'].values())
+
+    print(f"Requests:   {args.requests} in batches of {args.batch_size}, concurrency {args.concurrency}, "
+          f"{args.latency_ms:g} ms per AWS call")
+    print(f"Responses:  {dict(sorted(result['status_codes'].items()))}, {result['started']} executions started")
+    print(f"Executions: {dict(result['executions'])}")
+    for error, count in result['errors'].items():
+        print(f"  {count} failed with {error}, e.g. {result['causes'][error]}")
+    print(f"Final:      {dict(sorted(result['statuses'].items()))}, {result['notifications']} requester emails, "
+          f"{result['mismatched']} not as decided, {result['unplanned']} never decided")
+    print(f"Wall time:  {elapsed:.2f}s, {result['started'] / elapsed:.1f} requests/s end to end, "
+          f"{handler_time / started * 1000:.2f} ms handler time per request "
+          f"({result['waited']:,}s of Wait states skipped)")
+    emails, approvers, seconds, calls = result['approval_emails']
+    print(f"Approvals:  {emails} {'digests' if args.digest else 'emails'} to {approvers} approvers in {calls} SES calls, "
+          f"all sent {seconds:.2f}s after the first submission"
+          + (f" ({args.ses_rate:g} sends/s)" if args.ses_rate else ''))
+    clicks, seconds = result['decided']
+    calls = len(result['timings'].get('ApprovalHandler (batch)' if args.approval_batch else 'ApprovalHandler', []))
+    print(f"Decisions:  {clicks} approvals and rejections in {calls} ApprovalHandler calls"
+          f"{' (POST /approval/batch)' if args.approval_batch else ''}, {seconds:.2f}s, "
+          f"{clicks / seconds if seconds else 0:.0f}/s")
+    if args.auto_approve:
+        express, standard = result['latency']['express'], result['latency']['standard']
+        print(f"Fast path:  {len(express)} of {result['started']} requests auto-approved on the Express machine, "
+              f"end to end p50 {percentile(express, 50) if express else 0:.1f} ms, "
+              f"p95 {percentile(express, 95) if express else 0:.1f} ms; "
+              f"the rest p50 {percentile(standard, 50) if standard else 0:.1f} ms through the simulated approver")
+    for container, codes, calls, executions in result['duplicates']:
+        resent = sum(codes.values())
+        print(f"Duplicates: {resent} resent to {container}, {dict(codes)}, {calls / resent:.2f} AWS calls each, "
+              f"{executions} executions started")
+    print()
+
+    print(f"{'Handler / state':<28}{'Calls':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+          f"{'ms/request':>12}")
+    print('-' * 88)
+    for label, samples in result['timings'].items():
+        ordered = sorted(s * 1000 for s in samples)
+        print(f"{label:<28}{len(ordered):>8}{percentile(ordered, 50):>10.3f}{percentile(ordered, 95):>10.3f}"
+              f"{percentile(ordered, 99):>10.3f}{ordered[-1]:>10.3f}{sum(ordered) / started:>12.3f}")
+    print()
+
+    print(f"{'AWS call':<44}{'Total':>10}{'Per request':>14}")
+    print('-' * 68)
+    for name, count in sorted(result['calls'].items(), key=lambda pair: -pair[1]):
+        print(f"{name:<44}{count:>10}{count / started:>14.3f}")
+    total = sum(result['calls'].values())
+    print(f"{'all':<44}{total:>10}{total / started:>14.3f}")
+
+    if result['status_reads']:
+        print()
+        print(f"{'Listing status':<16}{'Items':>8}{'Scan RCU':>12}{'Query RCU':>12}{'Not indexed':>14}")
+        print('-' * 62)
+        for status, (items, scan, query, missing) in result['status_reads'].items():
+            print(f"{status:<16}{items:>8}{scan:>12.1f}{query:>12.1f}{missing:>14}")
+
+# ---------------------------------------------------------------------------
+# Script benchmarks
+# ---------------------------------------------------------------------------
+
+class FakeTable:
+    """The part of a boto3 Table resource the scripts use, over a FakeDynamoDB table"""
+
+    def __init__(self, dynamodb, name='EC2ApprovalRequests'):
+        self.dynamodb = dynamodb
+        self.name = name
+
+    def scan(self, ExclusiveStartKey=None, ExpressionAttributeValues=None, **kwargs):
+        from dynamodb_items import deserialize_item, serialize_item
+
+        if ExclusiveStartKey:
+            kwargs['ExclusiveStartKey'] = serialize_item(ExclusiveStartKey)
+        if ExpressionAttributeValues:
+            kwargs['ExpressionAttributeValues'] = serialize_item(ExpressionAttributeValues)
+        response = self.dynamodb.scan(TableName=self.name, **kwargs)
+        result = {'Items': [deserialize_item(item) for item in response['Items']]}
+        if 'LastEvaluatedKey' in response:
+            result['LastEvaluatedKey'] = deserialize_item(response['LastEvaluatedKey'])
+        return result
+
+class FailingTable(FakeTable):
+    """A FakeTable whose scans are denied after fail_after pages, as for a lost cross-account role"""
+
+    def __init__(self, dynamodb, fail_after):
+        super().__init__(dynamodb)
+        self.fail_after = fail_after
+        self.pages = 0
+
+    def scan(self, **kwargs):
+        if self.pages >= self.fail_after:
+            raise client_error('AccessDeniedException', 'Scan', 'not authorized to perform: dynamodb:Scan')
+        self.pages += 1
+        return super().scan(**kwargs)
+
+class KilledTable(FakeTable):
+    """A FakeTable that SIGKILLs its process on the scan after kill_after pages, as a crash would"""
+
+    def __init__(self, dynamodb, kill_after):
+        super().__init__(dynamodb)
+        self.kill_after = kill_after
+        self.pages = 0
+        self._lock = threading.Lock()
+
+    def scan(self, **kwargs):
+        with self._lock:
+            self.pages += 1
+            if self.pages > self.kill_after:
+                os.kill(os.getpid(), signal.SIGKILL)
+        return super().scan(**kwargs)
+
+class FakeTarget:
+    """A dynamodb_targets.Target whose table is a FakeTable"""
+
+    def __init__(self, name, table):
+        self.name = name
+        self.table = table
+
+    def new_table(self):
+        # FakeDynamoDB is safe to share across threads
+        return self.table
+
+def history_item(rng, index, args, step=HISTORY_STEP):
+    """A request row as the workflow leaves it, index steps of step seconds before HISTORY_END"""
+    from request_status import status_shard
+
+    request = synthetic_request(rng, index, args)
+    timestamp = HISTORY_END - index * step
+    request_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    status = rng.choices(list(HISTORY_STATUSES), list(HISTORY_STATUSES.values()))[0]
+    item = {name: value for name, value in request.items() if value is not None and name != 'waitForReady'}
+    item.update({
+        'requestId': request_id,
+        'timestamp': timestamp,
+        'requestDate': time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime(timestamp)),
+        'status': status,
+        'statusShard': status_shard(status, request_id),
+        'expirationTime': timestamp + 4 * 3600,
+        'executionArn': f"{STATE_MACHINE_ARN.replace(':stateMachine:', ':execution:')}:request-{request_id}"
+    })
+    if status != 'PENDING':
+        item['approvalTimestamp'] = timestamp + rng.randint(60, 4 * 3600)
+        item['approvedBy'] = item['approverEmail']
+    if status == 'APPROVED':
+        item['instanceIds'] = [f'i-{rng.getrandbits(68):017x}' for _ in range(item['instanceCount'])]
+    return item
+
+def seeded_dynamodb(recorder, args, seed=None):
+    """A FakeDynamoDB whose requests table holds --rows rows of history, the same for a given seed"""
+    from dynamodb_items import serialize_item
+
+    rng = random.Random(args.seed if seed is None else seed)
+    dynamodb = FakeDynamoDB(recorder, load_table_definitions())
+    dynamodb.load('EC2ApprovalRequests', (serialize_item(history_item(rng, i, args)) for i in range(args.rows)))
+    return dynamodb
+
+def seeded_table(recorder, args):
+    """A FakeTable of the seeded requests table"""
+    return FakeTable(seeded_dynamodb(recorder, args))
+
+def run_export(args):
+    """Export the seeded table with export_to_csv once per --segments count"""
+    import export_to_csv
+
+    recorder = Recorder(args.latency_ms / 1000)
+    target = FakeTarget('local', seeded_table(recorder, args))
+    chunk_size = args.chunk_size or export_to_csv.DEFAULT_CHUNK_SIZE
+    runs = []
+    reference = None
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, 'w') as devnull:
+        for segments in args.segments:
+            path = os.path.join(directory, f'segments-{segments}.csv')
+            calls = recorder.calls['dynamodb.scan']
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(devnull):
+                export_to_csv.export_to_csv(path, segments, args.stream, chunk_size, targets=[target])
+            elapsed = time.perf_counter() - started
+            with open(path, 'rb') as f:
+                lines = f.read().splitlines()
+            # Streamed rows arrive in a different order with every segment count
+            rows = sorted(lines[1:]) if args.stream else lines[1:]
+            reference = reference or rows
+            runs.append((segments, recorder.calls['dynamodb.scan'] - calls, len(lines) - 1, elapsed,
+                         rows == reference))
+    return {'chunk_size': chunk_size, 'runs': runs}
+
+def export_child(args, path, chunk_size, stream, kill_after, resume, results):
+    """
+    Export the seeded table in this (child) process, optionally killed after
+    kill_after scan pages, and put (peak RSS growth in KB, scan calls, seconds)
+    on results. Peak RSS is process-wide, so every measured export needs a
+    process of its own.
+    """
+    import resource
+    import export_to_csv
+
+    recorder = Recorder(args.latency_ms / 1000)
+    dynamodb = seeded_dynamodb(recorder, args)
+    table = KilledTable(dynamodb, kill_after) if kill_after else FakeTable(dynamodb)
+    # ru_maxrss is in KB on Linux
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        export_to_csv.export_to_csv(path, args.segments[0], stream, chunk_size, resume, [FakeTarget('local', table)])
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((peak - before, recorder.calls['dynamodb.scan'], elapsed))
+
+def run_in_child(args, path, chunk_size=None, stream=False, kill_after=0, resume=False):
+    """Run export_child in a new process; returns its result, or None if it was killed"""
+    import export_to_csv
+
+    results = multiprocessing.Queue()
+    child = multiprocessing.Process(target=export_child, args=(
+        args, path, chunk_size or export_to_csv.DEFAULT_CHUNK_SIZE, stream, kill_after, resume, results))
+    child.start()
+    child.join()
+    if child.exitcode == -signal.SIGKILL:
+        return None
+    if child.exitcode:
+        raise RuntimeError(f'Export process failed with exit code {child.exitcode}')
+    return results.get()
+
+def run_memory(args):
+    """Peak RSS growth of a sorted export for each --chunk-sizes count, each in a new process"""
+    with tempfile.TemporaryDirectory() as directory:
+        return [(chunk_size, *run_in_child(args, os.path.join(directory, f'chunk-{chunk_size}.csv'), chunk_size))
+                for chunk_size in args.chunk_sizes]
+
+def report_memory(args, result):
+    print(f"Export:     {args.rows:,} rows newest first, {args.segments[0]} segment(s), "
+          f"{args.latency_ms:g} ms per scan call, one process per run")
+    print()
+    print(f"{'Chunk size':>12}{'Peak RSS growth MB':>20}{'Scan calls':>12}{'Wall s':>10}")
+    print('-' * 54)
+    for chunk_size, growth, calls, elapsed in result:
+        print(f"{chunk_size:>12,}{growth / 1024:>20.1f}{calls:>12}{elapsed:>10.2f}")
+
+def run_resume(args):
+    """
+    For a sorted and a streamed export: kill one after --kill-after scan
+    pages, resume it, and compare the file with an uninterrupted export.
+    """
+    runs = []
+    with tempfile.TemporaryDirectory() as directory:
+        for stream in (False, True):
+            mode = 'stream' if stream else 'sorted'
+            reference = os.path.join(directory, f'{mode}-reference.csv')
+            path = os.path.join(directory, f'{mode}.csv')
+            _, full_calls, _ = run_in_child(args, reference, args.chunk_size, stream)
+            if run_in_child(args, path, args.chunk_size, stream, kill_after=args.kill_after) is not None:
+                raise RuntimeError(f'The {mode} export finished within {args.kill_after} pages; lower --kill-after')
+            # Killed before the first checkpoint, the resumed run starts over
+            checkpointed = 0
+            if os.path.exists(f'{path}.checkpoint'):
+                with open(f'{path}.checkpoint') as f:
+                    checkpointed = json.load(f)['rows']
+            _, resumed_calls, _ = run_in_child(args, path, args.chunk_size, stream, resume=True)
+            with open(reference, 'rb') as f:
+                expected = f.read()
+            with open(path, 'rb') as f:
+                actual = f.read()
+            if stream and args.segments[0] > 1:
+                # Segments deliver pages in a different order on every run
+                identical = sorted(actual.splitlines()) == sorted(expected.splitlines())
+            else:
+                identical = actual == expected
+            runs.append((mode, full_calls, checkpointed, resumed_calls, len(expected.splitlines()) - 1, identical,
+                         os.path.exists(f'{path}.checkpoint')))
+    return runs
+
+def report_resume(args, result):
+    print(f"Export:     {args.rows:,} rows, {args.segments[0]} segment(s), killed (SIGKILL) on scan page "
+          f"{args.kill_after + 1} and run again with --resume")
+    print()
+    print(f"{'Mode':<8}{'Pages':>8}{'Rows saved at kill':>20}{'Pages on resume':>17}{'Rows':>9}  Matches uninterrupted")
+    print('-' * 84)
+    for mode, calls, checkpointed, resumed_calls, rows, identical, left in result:
+        match = ('same rows' if mode == 'stream' and args.segments[0] > 1 else 'byte for byte') if identical else 'NO'
+        print(f"{mode:<8}{calls:>8}{checkpointed:>20,}{resumed_calls:>17}{rows:>9,}  {match}"
+              f"{', checkpoint left behind' if left else ''}")
+
+def report_export(args, result):
+    baseline = result['runs'][0][3]
+    order = 'scan order (--stream)' if args.stream else f"newest first, {result['chunk_size']:,}-row sort chunks"
+    print(f"Export:     {args.rows:,} rows to CSV, {order}, {args.latency_ms:g} ms per scan call")
+    print()
+    print(f"{'Segments':>10}{'Scan calls':>12}{'Rows':>10}{'Wall s':>10}{'Rows/s':>12}{'Speedup':>10}  Same rows")
+    print('-' * 76)
+    for segments, calls, rows, elapsed, same in result['runs']:
+        print(f"{segments:>10}{calls:>12}{rows:>10}{elapsed:>10.2f}{rows / elapsed:>12,.0f}"
+              f"{baseline / elapsed:>9.2f}x  {'yes' if same else 'NO'}")
+
+def run_targets(args):
+    """
+    Read targets with different page latencies, one of which fails part way,
+    through the viewer (merge_streams) and the exporter (fan_in).
+    """
+    import export_to_csv
+    import view_dynamodb_logs
+
+    targets = [FakeTarget(f'local-{latency_ms}ms', FakeTable(seeded_dynamodb(Recorder(latency_ms / 1000), args,
+                                                                            args.seed + i)))
+               for i, latency_ms in enumerate(args.target_latencies)]
+    failing_latency = min(args.target_latencies)
+    failing = FakeTarget('failing', FailingTable(seeded_dynamodb(Recorder(failing_latency / 1000), args,
+                                                                 args.seed + len(targets)), args.fail_after))
+
+    # Each healthy target alone, for the wall time the merge should approach
+    alone = {}
+    for target in targets:
+        started = time.perf_counter()
+        view_dynamodb_logs.load_requests([target])
+        alone[target.name] = time.perf_counter() - started
+
+    failing.table.pages = 0
+    started = time.perf_counter()
+    requests, view_errors = view_dynamodb_logs.load_requests(targets + [failing])
+    view_elapsed = time.perf_counter() - started
+    timestamps = [r.timestamp for r in requests]
+
+    failing.table.pages = 0
+    output = io.StringIO()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'targets.csv')
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(output):
+            export_to_csv.export_to_csv(path, targets=targets + [failing])
+        export_elapsed = time.perf_counter() - started
+        with open(path, newline='') as f:
+            exported = list(csv.DictReader(f))
+
+    return {
+        'targets': list(zip((target.name for target in targets), args.target_latencies)),
+        'failing': (failing.name, failing_latency),
+        'alone': alone,
+        'view_elapsed': view_elapsed,
+        'viewed': Counter(r.target for r in requests),
+        'view_ordered': all(a >= b for a, b in zip(timestamps, timestamps[1:])),
+        'view_errors': {name: f'{type(e).__name__}: {e}' for name, e in view_errors.items()},
+        'export_elapsed': export_elapsed,
+        'exported': Counter(row['target'] for row in exported),
+        'export_ordered': all(a['requestDate'] >= b['requestDate'] for a, b in zip(exported, exported[1:])),
+        'export_warnings': [line for line in output.getvalue().splitlines() if 'failed' in line]
+    }
+
+def report_targets(args, result):
+    failing_name, failing_latency = result['failing']
+    print(f"Targets:    {len(result['targets'])} with {args.rows:,} rows each, and one denied after "
+          f"{args.fail_after} pages")
+    print()
+    print(f"{'Target':<24}{'Page ms':>10}{'Alone s':>10}{'Viewed':>10}{'Exported':>10}")
+    print('-' * 64)
+    for name, latency_ms in result['targets']:
+        print(f"{name:<24}{latency_ms:>10g}{result['alone'][name]:>10.2f}"
+              f"{result['viewed'][name]:>10}{result['exported'][name]:>10}")
+    print(f"{failing_name:<24}{failing_latency:>10g}{'-':>10}"
+          f"{result['viewed'][failing_name]:>10}{result['exported'][failing_name]:>10}")
+    print()
+    alone = result['alone'].values()
+    print(f"Viewer:     {sum(result['viewed'].values()):,} rows merged in {result['view_elapsed']:.2f}s "
+          f"(slowest target alone {max(alone):.2f}s, all in turn {sum(alone):.2f}s), "
+          f"newest first: {'yes' if result['view_ordered'] else 'NO'}")
+    for name, error in result['view_errors'].items():
+        print(f"            error for {name}: {error}")
+    print(f"Exporter:   {sum(result['exported'].values()):,} rows in {result['export_elapsed']:.2f}s, "
+          f"newest first: {'yes' if result['export_ordered'] else 'NO'}")
+    for warning in result['export_warnings']:
+        print(f"            {warning.strip()}")
+    healthy = all(result['viewed'][name] == args.rows and result['exported'][name] == args.rows
+                  for name, _ in result['targets'])
+    reported = list(result['view_errors']) == [failing_name] and len(result['export_warnings']) == 1 \
+        and failing_name in result['export_warnings'][0]
+    print(f"Checks:     healthy targets complete: {'yes' if healthy else 'NO'}, "
+          f"only {failing_name} reported: {'yes' if reported else 'NO'}")
+
+def stale_executions(rng, dynamodb, machine):
+    """
+    Give each PENDING row of a seeded table a workflow that ended by one of
+    STALE_OUTCOMES; returns the status ReconcilePending should leave per row
+    """
+    with open(DEFINITION) as f:
+        definition = json.load(f)
+    expected = {}
+    for item in dynamodb.tables['EC2ApprovalRequests'].values():
+        if item['status']['S'] != 'PENDING':
+            continue
+        request_id = item['requestId']['S']
+        outcome = rng.choices(list(STALE_OUTCOMES), list(STALE_OUTCOMES.values()))[0]
+        if outcome == 'EXPRESS':
+            item['autoApprovalRule'] = {'S': AUTO_APPROVAL_POLICY[0]['name']}
+            expected[request_id] = 'FAILED'
+            continue
+        if outcome == 'MISSING':
+            expected[request_id] = 'EXPIRED'
+            continue
+        execution = Execution(item['executionArn']['S'], {'requestId': request_id}, definition)
+        execution.status = outcome
+        if outcome == 'SUCCEEDED':
+            decision = rng.choice(['APPROVED', 'APPROVED', 'APPROVED', 'REJECTED'])
+            instance_ids = [f'i-{rng.getrandbits(68):017x}'] if decision == 'APPROVED' else []
+            execution.data = {'StatusCode': 200, 'Payload': {'decision': decision, 'instanceIds': instance_ids}}
+            expected[request_id] = decision
+        elif outcome == 'FAILED':
+            execution.error, execution.cause = 'States.TaskFailed', 'LaunchEC2 failed: InsufficientInstanceCapacity'
+            expected[request_id] = 'FAILED'
+        else:
+            expected[request_id] = 'PENDING'
+        if outcome != 'RUNNING':
+            execution.finished = time.perf_counter()
+        machine.executions[execution.arn] = execution
+    return expected
+
+def run_reconcile(args):
+    """
+    Run ReconcilePending over the stale PENDING rows of --rows rows of
+    history, once per --workers count, each time on a new copy, then once
+    more to see what a second run finds
+    """
+    import aws_clients
+    os.environ.setdefault('AWS_DEFAULT_REGION', LOCAL_ENV['AWS_DEFAULT_REGION'])
+    reconciler = importlib.import_module('ReconcilePending')
+
+    runs = []
+    for workers in args.workers:
+        recorder = Recorder(args.latency_ms / 1000)
+        dynamodb = seeded_dynamodb(recorder, args)
+        machine = StateMachine({}, {}, Timings())
+        expected = stale_executions(random.Random(args.seed), dynamodb, machine)
+        aws_clients._clients.update({'dynamodb': dynamodb,
+                                     'stepfunctions': FakeStepFunctions(recorder, machine)})
+        # The handler reads these at import
+        reconciler.MAX_WORKERS = workers
+        reconciler.DESCRIBE_RATE = args.describe_rate
+        reconciler.RECONCILE_MAX_ROWS = args.rows
+        reconciler._next_describe = 0.0
+
+        with open(os.devnull, 'w') as output, contextlib.redirect_stdout(output):
+            started = time.perf_counter()
+            first = reconciler.lambda_handler({}, None)
+            elapsed = time.perf_counter() - started
+            calls = Counter(recorder.calls)
+            second = reconciler.lambda_handler({}, None)
+        statuses = {key[0]: item['status']['S'] for key, item in dynamodb.tables['EC2ApprovalRequests'].items()}
+        runs.append({
+            'workers': workers,
+            'first': first,
+            'elapsed': elapsed,
+            'calls': calls,
+            'second': second,
+            'mismatched': sum(1 for request_id, status in expected.items() if statuses[request_id] != status)
+        })
+    return runs
+
+def report_reconcile(args, result):
+    first = result[0]['first']
+    print(f"Reconcile:  {first['checked']:,} stale PENDING rows among {args.rows:,} rows of history, "
+          f"{args.latency_ms:g} ms per AWS call, DescribeExecution paced to {args.describe_rate:g}/s")
+    print(f"Repaired:   {dict(sorted(first['repaired'].items()))}, {first['running']} still running")
+    print()
+    print(f"{'Workers':>8}{'Repaired':>10}{'Queries':>9}{'Describes':>11}{'Updates':>9}{'Wall s':>9}{'Rows/s':>9}"
+          f"{'Wrong':>7}  Second run")
+    print('-' * 96)
+    for run in result:
+        repaired = sum(run['first']['repaired'].values())
+        calls = run['calls']
+        second = run['second']
+        print(f"{run['workers']:>8}{repaired:>10,}{calls['dynamodb.query']:>9}"
+              f"{calls['stepfunctions.describe_execution']:>11,}{calls['dynamodb.update_item']:>9,}"
+              f"{run['elapsed']:>9.2f}{repaired / run['elapsed']:>9,.0f}{run['mismatched']:>7}  "
+              f"{second['checked']} checked, {sum(second['repaired'].values())} repaired")
+
+def archive_reads(root, since):
+    """Time request_archive.read for each kind of report; {label: (rows, partitions, seconds, request IDs)}"""
+    import request_archive
+
+    month = since + 334 * 86400
+    reads = {
+        'whole year': {},
+        'one requester': {'requester': 'user7@example.com'},
+        'one status (REJECTED)': {'statuses': ['REJECTED']},
+        'one month (December)': {'since': month, 'until': month + 31 * 86400 - 1}
+    }
+    results = {}
+    for label, filters in reads.items():
+        started = time.perf_counter()
+        rows = list(request_archive.read(root, **filters))
+        elapsed = time.perf_counter() - started
+        opened = sum(len(keys) for _, keys in request_archive.partitions(
+            root, filters.get('since'), filters.get('until'), filters.get('statuses')))
+        results[label] = (len(rows), opened, elapsed, sorted(row['requestId'] for row in rows))
+    return results
+
+def run_archive(args):
+    """
+    Archive --days days of --per-day requests a day the way ArchiveRequests
+    does, one write per hour of TTL deletes, and time the reports over it
+    before and after archive_requests.py --compact
+    """
+    import archive_requests
+    import request_archive
+
+    step = 86400 // args.per_day
+    rng = random.Random(args.seed)
+    rows = [history_item(rng, i, args, step) for i in range(args.days * args.per_day)]
+    with tempfile.TemporaryDirectory() as root:
+        started = time.perf_counter()
+        hours = {}
+        for row in rows:
+            hours.setdefault(row['timestamp'] // 3600, []).append(row)
+        for hour, batch in sorted(hours.items()):
+            request_archive.write(root, batch, archived_at=(hour + 5) * 3600)
+        written = time.perf_counter() - started
+        files = sum(len(names) for _, _, names in os.walk(root))
+        size = sum(os.path.getsize(os.path.join(path, name)) for path, _, names in os.walk(root) for name in names)
+
+        since = HISTORY_END - args.days * 86400
+        before = archive_reads(root, since)
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            archive_requests.compact(root)
+            compacted = time.perf_counter() - started
+        compacted_files = sum(len(names) for _, _, names in os.walk(root))
+        after = archive_reads(root, since)
+    return {
+        'rows': len(rows),
+        'written': (files, size, written),
+        'compacted': (compacted_files, compacted),
+        'reads': [(label, before[label], after[label]) for label in before]
+    }
+
+def report_archive(args, result):
+    files, size, written = result['written']
+    compacted_files, compacted = result['compacted']
+    print(f"Archive:    {result['rows']:,} rows over {args.days} days at {args.per_day}/day, "
+          f"{size / 1024 / 1024:.1f} MB gzip JSON Lines")
+    print(f"Written:    {files:,} part files in {written:.2f}s, one per partition per hour of TTL deletes")
+    print(f"Compacted:  to {compacted_files:,} files in {compacted:.2f}s")
+    print()
+    print(f"{'Read':<24}{'Rows':>9}{'Files':>8}{'Before s':>10}{'Files':>8}{'After s':>9}  Same rows")
+    print('-' * 78)
+    for label, (rows, files, before, ids), (_, compacted_files, after, compacted_ids) in result['reads']:
+        print(f"{label:<24}{rows:>9,}{files:>8,}{before:>10.2f}{compacted_files:>8,}{after:>9.2f}  "
+              f"{'yes' if ids == compacted_ids else 'NO'}")
+
+# ---------------------------------------------------------------------------
+# Micro benchmarks
+# ---------------------------------------------------------------------------
+
+def per_call_us(fn):
+    """Best of five timeit rounds of fn, in microseconds per call"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(5, number)) / number * 1e6
+
+def capture_emails(args):
+    """
+    The first (to, data) sent with each email template in two short workflow
+    runs of 100 requests to one approver, the first in DIGEST_MODE
+    """
+    import email_templates
+
+    sample = argparse.Namespace(**{**vars(args), 'requests': 100, 'approvers': 1, 'concurrency': 1, 'batch_size': 1,
+                                   'latency_ms': 0, 'ses_rate': 0, 'duplicates': 0, 'status_reads': False,
+                                   'approval_batch': 0, 'digest': True})
+    emails = {}
+    send = email_templates.send
+
+    def recording_send(name, source, to, data):
+        emails.setdefault(name, (to, data))
+        return send(name, source, to, data)
+
+    # Local rendering sends digests through send() as well
+    email_templates.send, email_templates.RENDERING = recording_send, 'local'
+    try:
+        run(sample)
+        # The handlers are imported by now, so the setting is switched on the module
+        importlib.import_module('SendApprovalEmail').DIGEST_MODE = False
+        run(argparse.Namespace(**{**vars(sample), 'digest': False}))
+    finally:
+        email_templates.send = send
+    return emails
+
+def run_micro(args):
+    """
+    Render and send time and payload bytes of each email template, locally
+    and with SES templates, and the time per call of other per-request work
+    """
+    import auto_approval
+    import aws_clients
+    import email_templates
+    import metrics
+    import rate_limit
+
+    emails = capture_emails(args)
+    ses = aws_clients._clients['ses']
+    source = os.environ['FROM_EMAIL']
+    rendering = email_templates.RENDERING
+    results = []
+    try:
+        for name in [name for name in email_templates.TEMPLATES if name in emails]:
+            to, data = emails[name]
+            rendered = email_templates.render(name, data)
+            row = [name, per_call_us(lambda: email_templates.render(name, data))]
+            for mode in ('local', 'ses'):
+                email_templates.RENDERING = mode
+                row.append(per_call_us(lambda: email_templates.send_bulk(name, source, [(to, data)])))
+                ses.take_outbox()
+            row += [sum(len(part.encode()) for part in rendered.values()),
+                    len(json.dumps(data, default=str).encode())]
+            results.append(row)
+    finally:
+        email_templates.RENDERING = rendering
+
+    calls = []
+    rules = auto_approval.RULES
+    auto_approval.RULES = auto_approval.compile_policy(AUTO_APPROVAL_POLICY)
+    try:
+        small = {'requesterEmail': 'user1@example.com', 'instanceType': 't3.micro', 'instanceCount': 1,
+                 'ebsVolumeSize': 20, 'fallbackInstanceTypes': [], 'waitForReady': False}
+        for label, body in (('auto_approval.match, matching request', small),
+                            ('auto_approval.match, other instance type', {**small, 'instanceType': 'm5.large'}),
+                            ('auto_approval.match, other domain', {**small, 'requesterEmail': 'user1@example.org'})):
+            calls.append((label, per_call_us(lambda: auto_approval.match(body))))
+    finally:
+        auto_approval.RULES = rules
+
+    # A table that admits at once, so only the limiter's own work is timed
+    dynamodb = aws_clients._clients['dynamodb']
+    aws_clients._clients['dynamodb'] = SimpleNamespace(
+        exceptions=dynamodb.exceptions,
+        update_item=lambda **_: {'Attributes': {'fullAt': {'N': '0'}}}
+    )
+    burst = rate_limit.BURST
+    rate_limit.BURST = 10
+    try:
+        calls.append(('rate_limit.acquire, admitted (UpdateItem not counted)',
+                      per_call_us(lambda: rate_limit.acquire('user1@example.com'))))
+        rate_limit._blocked['user2@example.com'] = time.time() + 3600
+        calls.append(('rate_limit.acquire, rejected from the container cache',
+                      per_call_us(lambda: rate_limit.acquire('user2@example.com'))))
+    finally:
+        aws_clients._clients['dynamodb'] = dynamodb
+        rate_limit.BURST = burst
+        rate_limit._full_at.clear()
+        rate_limit._blocked.clear()
+
+    # Records are printed; Lambda ships stdout to CloudWatch Logs
+    event = {'request': {'requestId': str(uuid.uuid4())}}
+    instrumented = metrics.instrument('LoadTest')(lambda event, context: None)
+    with open(os.devnull, 'w') as output, contextlib.redirect_stdout(output):
+        calls.append(('metrics.instrument, added to a handler call',
+                      per_call_us(lambda: instrumented(event, None)) - per_call_us(lambda: (lambda e, c: None)(event, None))))
+        calls.append(('metrics.stage, one stage record',
+                      per_call_us(lambda: metrics.stage('launch', event['request']['requestId'], time.time() - 60))))
+
+    # In a fresh interpreter each time, after the json every handler imports first
+    script = 'import json, time; started = time.perf_counter(); import metrics; print(time.perf_counter() - started)'
+    imports = [float(subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                                    env={**os.environ, 'PYTHONPATH': os.path.join(ROOT, 'src', 'layer', 'python')}
+                                    ).stdout) * 1e6 for _ in range(9)]
+    calls.append(('import metrics after json, median of 9 interpreters', statistics.median(imports)))
+    return {'emails': results, 'calls': calls}
+
+def report_micro(args, result):
+    print('Emails:     template data from 100 requests to one approver, with and without DIGEST_MODE; '
+          'sends go to the SES stand-in with no latency')
+    print()
+    print(f"{'Template':<26}{'Render us':>11}{'Send local us':>15}{'Send SES us':>13}"
+          f"{'Local bytes':>13}{'SES bytes':>11}")
+    print('-' * 89)
+    for name, render_us, local_us, ses_us, local_bytes, ses_bytes in result['emails']:
+        print(f"{name:<26}{render_us:>11,.1f}{local_us:>15,.1f}{ses_us:>13,.1f}{local_bytes:>13,}{ses_bytes:>11,}")
+    print()
+    print(f"{'Per call':<60}{'us':>10}")
+    print('-' * 70)
+    for label, us in result['calls']:
+        print(f"{label:<60}{us:>10.2f}")
+
+def parse_counts(text):
+    """'1,2,4,8' -> [1, 2, 4, 8]"""
+    try:
+        counts = [int(part) for part in text.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Expected comma-separated whole numbers: {text}')
+    if any(count < 1 for count in counts):
+        raise argparse.ArgumentTypeError(f'Counts must be at least 1: {text}')
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the approval workflow locally against in-memory AWS stand-ins')
+    parser.add_argument('--requests', type=int, default=1000, help='Synthetic requests to submit (default: 1000)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent handler invocations (default: 8)')
+    parser.add_argument('--batch-size', type=int, default=1, help='Requests per RequestStarter call (default: 1)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('approve=80,reject=15,timeout=5'),
+                        help='Approver decisions by weight (default: approve=80,reject=15,timeout=5)')
+    parser.add_argument('--fleet-share', type=float, default=0.1, help='Share of multi-instance requests (default: 0.1)')
+    parser.add_argument('--fleet-size', type=int, help='Instances per multi-instance request (default: 2, 3 or 5)')
+    parser.add_argument('--ready-share', type=float, default=0.2, help='Share of requests with waitForReady (default: 0.2)')
+    parser.add_argument('--requesters', type=int, default=20, help='Distinct requester addresses (default: 20)')
+    parser.add_argument('--approvers', type=int, default=1, help='Distinct approver addresses (default: 1)')
+    parser.add_argument('--digest', action='store_true',
+                        help='Run SendApprovalEmail in DIGEST_MODE and flush the digests before deciding')
+    parser.add_argument('--approval-batch', type=int, default=0,
+                        help='Send decisions to POST /approval/batch this many at a time instead of one link each')
+    parser.add_argument('--auto-approve', action='store_true',
+                        help='Route requests matching AUTO_APPROVAL_POLICY (default: single t3.micro/t3.small '
+                             'with at most 30 GB EBS) to the Express state machine')
+    parser.add_argument('--ses-rate', type=float, default=0,
+                        help='Space SES sends to this many per second, like an account send rate (default: unlimited)')
+    parser.add_argument('--duplicates', type=float, default=0, help='Share of submissions sent twice (default: 0)')
+    parser.add_argument('--status-reads', action='store_true',
+                        help='Compare read units of listing each status by Scan and by StatusIndex Query')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Simulated latency per AWS call (default: 0)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed (default: 1)')
+    parser.add_argument('--definition', default=DEFINITION, help='Variant of EC2ApprovalDemo-SIMPLE.json to run (default: that file)')
+    parser.add_argument('--verbose', action='store_true', help='Show handler logs')
+    parser.add_argument('--mode', default='workflow',
+                        choices=['workflow', 'export', 'memory', 'resume', 'targets', 'reconcile', 'archive', 'micro'],
+                        help='workflow: run requests through the handlers (default); '
+                             'export: time export_to_csv.py over a seeded table; '
+                             "memory: the exporter's peak RSS per --chunk-sizes; "
+                             'resume: kill an export part way and resume it; '
+                             'targets: read several seeded tables, one failing, with both scripts; '
+                             'reconcile: time ReconcilePending over seeded stale rows; '
+                             'archive: time reports over a year of archived history, before and after compaction; '
+                             'micro: time email rendering and other per-call work in the handlers')
+    parser.add_argument('--rows', type=int, default=50000,
+                        help='With the script modes: rows of seeded history per table (default: 50000)')
+    parser.add_argument('--segments', type=parse_counts, default=parse_counts('1,2,4,8'),
+                        help='With --mode export: scan segment counts to compare (default: 1,2,4,8); '
+                             'memory and resume use the first')
+    parser.add_argument('--stream', action='store_true', help='With --mode export: export in scan order (--stream)')
+    parser.add_argument('--chunk-size', type=int, help="With --mode export or resume: the exporter's --chunk-size")
+    parser.add_argument('--chunk-sizes', type=parse_counts, default=parse_counts('1000,10000'),
+                        help='With --mode memory: --chunk-size values to compare (default: 1000,10000)')
+    parser.add_argument('--kill-after', type=int, default=20,
+                        help='With --mode resume: scan pages read before the export is killed (default: 20)')
+    parser.add_argument('--target-latencies', type=parse_counts, default=parse_counts('20,50,100,200'),
+                        help='With --mode targets: ms per scan page of each healthy target (default: 20,50,100,200)')
+    parser.add_argument('--fail-after', type=int, default=2,
+                        help='With --mode targets: pages the failing target returns before access is denied (default: 2)')
+    parser.add_argument('--workers', type=parse_counts, default=parse_counts('10,32'),
+                        help="With --mode reconcile: ReconcilePending's MAX_WORKERS values to compare (default: 10,32)")
+    parser.add_argument('--describe-rate', type=float, default=1000,
+                        help='With --mode reconcile: DescribeExecution calls per second (default: 1000)')
+    parser.add_argument('--days', type=int, default=365, help='With --mode archive: days of history (default: 365)')
+    parser.add_argument('--per-day', type=int, default=300,
+                        help='With --mode archive: requests archived per day (default: 300)')
+    args = parser.parse_args()
+    if args.duplicates and args.batch_size > 1:
+        parser.error('--duplicates needs --batch-size 1: RequestStarter only deduplicates single submissions')
+
+    if args.mode == 'export':
+        report_export(args, run_export(args))
+    elif args.mode == 'memory':
+        report_memory(args, run_memory(args))
+    elif args.mode == 'resume':
+        report_resume(args, run_resume(args))
+    elif args.mode == 'targets':
+        report_targets(args, run_targets(args))
+    elif args.mode == 'reconcile':
+        report_reconcile(args, run_reconcile(args))
+    elif args.mode == 'archive':
+        report_archive(args, run_archive(args))
+    elif args.mode == 'micro':
+        report_micro(args, run_micro(args))
+    else:
+        report(args, run(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Measure Lambda handler init duration locally
+Usage: python3 measure_cold_start.py [--runs N] [HANDLER ...]
+
+Each run starts a fresh interpreter, so every measurement is a cold start.
+It reports the handler's module import time (what Lambda bills as Init
+Duration) and, for handlers that have one, the time to answer a request
+that needs no AWS call, plus whether boto3 was loaded along the way.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(ROOT, 'src', 'lambda')
+LAYER_DIR = os.path.join(ROOT, 'src', 'layer', 'python')
+
+HANDLERS = [
+    'RequestStarter',
+    'ResolveAMI',
+    'SendApprovalEmail',
+    'SendApprovalDigest',
+    'ApprovalHandler',
+    'LaunchEC2',
+    'CheckInstanceReadiness',
+    'FinalizeRequest',
+    'AggregateStats',
+    'ReconcilePending',
+    'ArchiveRequests'
+]
+
+# Events each handler can answer without touching AWS
+LOCAL_EVENTS = {
+    'RequestStarter': [
+        ('preflight', {'httpMethod': 'OPTIONS'}),
+        ('invalid', {'body': '{}'})
+    ],
+    'ResolveAMI': [
+        ('user AMI', {'request': {'amiId': 'ami-12345678'}})
+    ],
+    'ApprovalHandler': [
+        ('invalid', {'queryStringParameters': {}})
+    ],
+    'AggregateStats': [
+        ('empty batch', {'Records': []})
+    ],
+    'ArchiveRequests': [
+        ('empty batch', {'Records': []})
+    ]
+}
+
+# Placeholder configuration so modules can be imported outside Lambda
+DUMMY_ENV = {
+    'STATE_MACHINE_ARN': 'arn:aws:states:us-east-1:000000000000:stateMachine:Local',
+    'FROM_EMAIL': 'noreply@example.com',
+    'APPROVAL_BASE_URL': 'https://example.com',
+    'AWS_DEFAULT_REGION': 'us-east-1'
+}
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+handler = __import__(sys.argv[1])
+result = {"init_ms": (time.perf_counter() - start) * 1000, "events": {}}
+for name, event in json.loads(sys.argv[2]):
+    start = time.perf_counter()
+    handler.lambda_handler(event, None)
+    result["events"][name] = (time.perf_counter() - start) * 1000
+result["boto3_loaded"] = "boto3" in sys.modules
+print(json.dumps(result))
+'''
+
+def probe(handler):
+    """Cold-start one handler in a new interpreter and return its timings"""
+    env = dict(os.environ, **DUMMY_ENV)
+    env['PYTHONPATH'] = os.pathsep.join([LAMBDA_DIR, LAYER_DIR])
+    events = json.dumps(LOCAL_EVENTS.get(handler, []))
+    out = subprocess.run(
+        [sys.executable, '-c', PROBE, handler, events],
+        env=env, capture_output=True, text=True, check=True
+    )
+    # Handlers may log to stdout; the probe result is the last line
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure Lambda handler cold-start time locally')
+    parser.add_argument('handlers', nargs='*', default=HANDLERS, help='Handlers to measure (default: all)')
+    parser.add_argument('--runs', type=int, default=10, help='Cold starts per handler (default: 10)')
+
+    args = parser.parse_args()
+
+    print(f"{'Handler':<28}{'Init (ms)':>12}{'boto3':>8}  Local events (ms)")
+    print('-' * 80)
+    for handler in args.handlers:
+        runs = [probe(handler) for _ in range(args.runs)]
+        init = statistics.median(r['init_ms'] for r in runs)
+        boto3_loaded = 'yes' if runs[0]['boto3_loaded'] else 'no'
+        events = ', '.join(
+            f"{name}={statistics.median(r['events'][name] for r in runs):.2f}"
+            for name in runs[0]['events']
+        )
+        print(f"{handler:<28}{init:>12.2f}{boto3_loaded:>8}  {events or '-'}")
+    print(f"\nMedian of {args.runs} fresh interpreters per handler")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Publish the shared email templates to SES
+Usage: python3 publish_email_templates.py [--region REGION] [--render NAME DATA_JSON]
+
+Creates or updates one SES template per entry in the layer's
+email_templates.TEMPLATES, so the Lambda functions can send with
+EMAIL_RENDERING=ses. Run it again after changing a template.
+
+--render prints the local rendering of a template for the given JSON data
+instead, to preview a change before publishing.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'layer', 'python'))
+
+import email_templates
+
+def publish(region):
+    """Create or update every template in SES"""
+    import boto3
+
+    ses = boto3.client('ses', region_name=region)
+    existing = set()
+    for page in paginate_templates(ses):
+        existing.update(t['Name'] for t in page['TemplatesMetadata'])
+
+    for name, template in email_templates.TEMPLATES.items():
+        definition = {
+            'TemplateName': name,
+            'SubjectPart': template['subject'],
+            'TextPart': template['text'],
+            'HtmlPart': template['html']
+        }
+        if name in existing:
+            ses.update_template(Template=definition)
+            print(f"Updated {name}")
+        else:
+            ses.create_template(Template=definition)
+            print(f"Created {name}")
+
+def paginate_templates(ses):
+    """ListTemplates has no paginator in boto3, so follow NextToken by hand"""
+    kwargs = {}
+    while True:
+        page = ses.list_templates(**kwargs)
+        yield page
+        if not page.get('NextToken'):
+            break
+        kwargs['NextToken'] = page['NextToken']
+
+def main():
+    parser = argparse.ArgumentParser(description='Publish email templates to SES')
+    parser.add_argument('--region', default='ap-southeast-5', help='SES region')
+    parser.add_argument('--render', nargs=2, metavar=('NAME', 'DATA_JSON'),
+                        help='Print a local rendering instead of publishing')
+    args = parser.parse_args()
+
+    if args.render:
+        name, data = args.render
+        rendered = email_templates.render(name, json.loads(data))
+        for part in ('subject', 'text', 'html'):
+            print(f"--- {part} ---")
+            print(rendered[part])
+        return
+
+    publish(args.region)
+
+if __name__ == '__main__':
+    main()
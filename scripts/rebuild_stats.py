@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Rebuild the EC2ApprovalStats counters from the request history
+Usage: python3 rebuild_stats.py [--archive URL | --table-only] [--segments N] [--dry-run]
+
+Sums every request's contribution (see the layer's request_stats module)
+over the history archive (see request_archive) and a full scan of the
+table, and overwrites each counter item the rebuild produces. A request
+still in the table is counted from its row; any other request once, from
+the copy archived last. Use it to backfill after enabling the stream, or to
+repair counters after a failed AggregateStats batch was retried.
+
+Rows expire from the table 4 hours after submission, so only the archive
+holds the history: without it a rebuild would replace the all-time,
+per-day and per-requester counts (and the quota usage) with a few hours of
+requests. --table-only does that on purpose, for a stats table that is
+still empty. Counter items the rebuild does not produce are never deleted.
+If the archive starts later than the counters, the all-time totals are
+rebuilt from what it holds.
+
+URL is a local directory or s3://bucket/prefix (default: $ARCHIVE_URL).
+
+Disable the AggregateStats stream trigger while this runs, or updates
+applied during the rebuild are lost:
+    aws lambda update-event-source-mapping --uuid UUID --no-enabled
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import boto3
+
+from dynamodb_scan import scan_items
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'layer', 'python'))
+
+import request_archive
+import request_stats
+
+TABLE_NAME = os.environ.get('DYNAMODB_TABLE', 'EC2ApprovalRequests')
+STATS_TABLE = os.environ.get('STATS_TABLE', 'EC2ApprovalStats')
+REGION = os.environ.get('AWS_REGION', 'ap-southeast-5')
+
+dynamodb = boto3.resource('dynamodb', region_name=REGION)
+table = dynamodb.Table(TABLE_NAME)
+stats_table = dynamodb.Table(STATS_TABLE)
+
+def aggregate(archive, segments):
+    """
+    Sum the contribution of every request in the table and the archive.
+
+    Returns:
+        (totals, requests counted from the table, requests counted from the archive)
+    """
+    totals = {}
+    in_table = set()
+    for item in scan_items(table, segments=segments):
+        request_stats.accumulate(totals, request_stats.contribution(item))
+        in_table.add(item['requestId'])
+
+    # A request can be archived more than once; the last copy wins
+    archived = {}
+    if archive:
+        for row in request_archive.read(archive):
+            request_id = row.get('requestId')
+            if request_id in in_table:
+                continue
+            kept = archived.get(request_id)
+            if kept is None or row.get('archivedAt', 0) >= kept.get('archivedAt', 0):
+                archived[request_id] = row
+    for row in archived.values():
+        request_stats.accumulate(totals, request_stats.contribution(row))
+    return totals, len(in_table), len(archived)
+
+def write_stats(totals):
+    """Overwrite the counter items in totals, leaving every other item alone"""
+    with stats_table.batch_writer() as batch:
+        for key, counters in totals.items():
+            batch.put_item(Item={'statKey': key, **{name: value for name, value in counters.items() if value}})
+    return len(totals)
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild EC2ApprovalStats from the request archive and EC2ApprovalRequests')
+    parser.add_argument('--archive', default=request_archive.ARCHIVE_URL,
+                        help='Archive root: local directory or s3://bucket/prefix (default: $ARCHIVE_URL)')
+    parser.add_argument('--table-only', action='store_true',
+                        help='Count only the rows still in the table (for an empty stats table)')
+    parser.add_argument('--segments', type=int, default=1, help='Parallel scan segments (default: 1)')
+    parser.add_argument('--dry-run', action='store_true', help='Print the totals without writing them')
+    args = parser.parse_args()
+
+    if args.table_only:
+        args.archive = None
+    elif not args.archive:
+        parser.error('--archive or ARCHIVE_URL is required; the table alone holds only the last few hours')
+    if args.table_only and not args.dry_run and stats_table.scan(Limit=1, ProjectionExpression='statKey')['Items']:
+        parser.error(f'--table-only would replace the history in {STATS_TABLE}; rebuild from --archive instead')
+
+    started = time.time()
+    totals, from_table, from_archive = aggregate(args.archive, args.segments)
+    print(f"Aggregated {from_table} requests from {TABLE_NAME} and {from_archive} from the archive "
+          f"into {len(totals)} counter items in {time.time() - started:.1f}s")
+
+    if args.dry_run:
+        for key in sorted(totals):
+            print(f"  {key}: {totals[key]}")
+        return
+
+    written = write_stats(totals)
+    print(f"Wrote {written} counter items to {STATS_TABLE}")
+
+if __name__ == '__main__':
+    main()
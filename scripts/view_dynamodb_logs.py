@@ -1,17 +1,69 @@
 #!/usr/bin/env python3
 """
 View EC2 Approval Request Logs from DynamoDB
-Usage: python3 view_dynamodb_logs.py [--user EMAIL] [--status STATUS]
+Usage: python3 view_dynamodb_logs.py [--user EMAIL] [--status STATUS] [--instance-type TYPE]
+                                     [--since TIME] [--until TIME] [--segments N]
+                                     [--group-by KEY] [--format table|json|ndjson] [--details]
+                                     [--archive URL] [--target REGION[/TABLE][@PROFILE] ...]
+                                     [--stats] [--stages]
+
+Filters combine: the requester or status narrows the index query, the time
+range goes in its key condition and the rest in a FilterExpression. Rows
+are held as compact records and the report is written in one call.
+--group-by prints one line of counts per status, user, approver,
+instanceType or day instead of the requests.
+
+--target (repeatable, default $DYNAMODB_TARGETS or the table in $AWS_REGION)
+reads several regions, tables or accounts at once and merges their
+requests newest first (see dynamodb_targets.py).
+
+--stats reads the counters kept by the AggregateStats function instead of
+listing requests: a fixed number of item reads, however large the table.
+--stages prints p50/p95/p99 of the pipeline stage and handler duration
+metrics the Lambda functions log in Embedded Metric Format.
+--archive lists requests from the history archive (see the layer's
+request_archive module) instead of the table, including rows TTL deleted.
 """
 
 import boto3
 import argparse
-from datetime import datetime
+import heapq
+import itertools
+import json
+import math
+import operator
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb', region_name='ap-southeast-5')
-table = dynamodb.Table('EC2ApprovalRequests')
+from dynamodb_scan import query_items, scan_items
+from dynamodb_targets import DEFAULT_REGION, merge_streams, parse_targets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'layer', 'python'))
+
+import request_archive
+from request_status import STATUS_SHARDS
+
+# Initialize DynamoDB (requests are read through dynamodb_targets)
+dynamodb = boto3.resource('dynamodb', region_name=DEFAULT_REGION)
+stats_table = dynamodb.Table(os.environ.get('STATS_TABLE', 'EC2ApprovalStats'))
+
+STATUSES = ('PENDING', 'APPROVED', 'REJECTED', 'EXPIRED', 'FAILED')
+LATENCY_BUCKETS = ('le_10', 'le_60', 'le_300', 'le_900', 'le_3600', 'le_14400', 'le_inf')
+
+# Pipeline stages and instrumented functions (see the layer's metrics module)
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'EC2ApprovalWorkflow')
+STAGES = ('submit', 'emailSent', 'decision', 'launch', 'running', 'notified')
+FUNCTIONS = ('RequestStarter', 'ResolveAMI', 'SendApprovalEmail', 'SendApprovalDigest', 'ApprovalHandler',
+             'LaunchEC2', 'CheckInstanceReadiness', 'FinalizeRequest', 'AggregateStats', 'ReconcilePending',
+             'ArchiveRequests')
+
+# Requests handed from a target's reader thread to the merge at a time
+PAGE_ROWS = 1000
 
 def decimal_to_int(obj):
     """Convert Decimal to int for display"""
@@ -19,133 +71,509 @@ def decimal_to_int(obj):
         return int(obj)
     return obj
 
+def to_int(value, fallback=None):
+    """int(value), or fallback for a value that is not a number (e.g. "30GB")"""
+    try:
+        return int(value)
+    except (TypeError, ValueError, ArithmeticError):
+        return fallback
+
 def format_timestamp(ts):
     """Format Unix timestamp to readable date"""
     if ts:
-        return datetime.fromtimestamp(decimal_to_int(ts)).strftime('%Y-%m-%d %H:%M:%S')
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(decimal_to_int(ts)))
     return 'N/A'
 
-def view_all_requests():
-    """View all requests"""
-    response = table.scan()
-    items = response['Items']
+def parse_time(value):
+    """Parse a Unix timestamp or ISO date/time (local time) for --since/--until"""
+    if value.isdigit():
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time '{value}', use YYYY-MM-DD[ HH:MM[:SS]] or a Unix timestamp")
+
+def time_range(since=None, until=None):
+    """
+    Build a condition on the timestamp attribute.
     
-    # Sort by timestamp (newest first)
-    items.sort(key=lambda x: decimal_to_int(x.get('timestamp', 0)), reverse=True)
+    Returns:
+        Tuple of (expression, attribute names, attribute values). The
+        expression is None when no bound is given.
+    """
+    if since is not None and until is not None:
+        expression, values = '#ts BETWEEN :since AND :until', {':since': since, ':until': until}
+    elif since is not None:
+        expression, values = '#ts >= :since', {':since': since}
+    elif until is not None:
+        expression, values = '#ts <= :until', {':until': until}
+    else:
+        return None, {}, {}
+    return expression, {'#ts': 'timestamp'}, values
+
+class Request:
+    """
+    One request as the viewer holds it.
     
-    print(f"\n{'='*120}")
-    print(f"EC2 APPROVAL REQUESTS - Total: {len(items)}")
-    print(f"{'='*120}\n")
+    Items are converted page by page as they arrive: numbers become ints,
+    lists become tuples and only the fields below are kept, in slots rather
+    than a per-row dict, so sorting, filtering and grouping run on plain
+    attributes and 100k rows stay small in memory.
+    """
+    __slots__ = ('requestId', 'timestamp', 'status', 'requesterEmail', 'approverEmail', 'instanceName',
+                 'instanceType', 'instanceCount', 'subnetId', 'securityGroupIds', 'amiId', 'ebsVolumeSize',
+                 'ebsVolumeType', 'privateIpAddress', 'autoApprovalRule', 'approvalTimestamp', 'instanceIds',
+                 'executionArn', 'target')
+    
+    def __init__(self, item, target=None):
+        get = item.get
+        self.requestId = get('requestId')
+        self.timestamp = to_int(get('timestamp') or 0, 0)
+        self.status = get('status') or 'UNKNOWN'
+        self.requesterEmail = get('requesterEmail')
+        self.approverEmail = get('approverEmail')
+        self.instanceName = get('instanceName')
+        self.instanceType = get('instanceType')
+        self.instanceCount = to_int(get('instanceCount') or 1, 1)
+        self.subnetId = get('subnetId')
+        self.securityGroupIds = tuple(get('securityGroupIds') or ())
+        self.amiId = get('amiId')
+        # Rows written before ebsVolumeSize was validated keep their raw value
+        self.ebsVolumeSize = to_int(get('ebsVolumeSize'), get('ebsVolumeSize')) if get('ebsVolumeSize') else None
+        self.ebsVolumeType = get('ebsVolumeType')
+        self.privateIpAddress = get('privateIpAddress')
+        self.autoApprovalRule = get('autoApprovalRule')
+        self.approvalTimestamp = to_int(get('approvalTimestamp')) if get('approvalTimestamp') else None
+        self.instanceIds = tuple(get('instanceIds') or ([get('instanceId')] if get('instanceId') else ()))
+        self.executionArn = get('executionArn')
+        self.target = target
     
-    for item in items:
-        print_request(item)
+    def decision_seconds(self):
+        """Seconds from submission to the final decision, or None while pending"""
+        if not self.approvalTimestamp or not self.timestamp:
+            return None
+        return self.approvalTimestamp - self.timestamp
+    
+    def to_dict(self):
+        """The request's fields for JSON output, without unset ones"""
+        return {field: value for field, value in zip(self.__slots__, _fields(self)) if value is not None}
 
-def view_by_user(email):
-    """View requests by specific user"""
-    response = table.query(
-        IndexName='RequesterEmailIndex',
-        KeyConditionExpression='requesterEmail = :email',
-        ExpressionAttributeValues={':email': email}
-    )
+_fields = operator.attrgetter(*Request.__slots__)
+
+# --group-by keys
+GROUP_KEYS = {
+    'status': lambda r: r.status,
+    'user': lambda r: r.requesterEmail or 'unknown',
+    'approver': lambda r: r.approverEmail or 'unknown',
+    'instanceType': lambda r: r.instanceType or 'unknown',
+    'target': lambda r: r.target or 'default',
+    'day': lambda r: time.strftime('%Y-%m-%d', time.localtime(r.timestamp))
+}
+
+def fetch_items(target, email=None, status=None, since=None, until=None, instance_type=None, segments=1):
+    """
+    Yield the items of one target matching every filter, from the cheapest source.
     
-    items = response['Items']
-    items.sort(key=lambda x: decimal_to_int(x.get('timestamp', 0)), reverse=True)
+    A requester is queried on RequesterEmailIndex, otherwise a status on
+    every shard of StatusIndex, both with the time range in the key
+    condition and newest first; with neither the table is scanned, in no
+    particular order. Filters the key condition cannot express are sent as
+    a FilterExpression, so only matching items cross the network.
+    """
+    expression, names, values = time_range(since, until)
+    names, values = dict(names), dict(values)
+    filters = []
+    if not email and not status and expression:
+        filters.append(expression)
+    if email and status:
+        filters.append('#status = :status')
+        names['#status'] = 'status'
+        values[':status'] = status.upper()
+    if instance_type:
+        filters.append('instanceType = :instanceType')
+        values[':instanceType'] = instance_type
     
-    print(f"\n{'='*120}")
-    print(f"REQUESTS BY {email} - Total: {len(items)}")
-    print(f"{'='*120}\n")
+    def request(key_condition=None, **key_values):
+        kwargs = {}
+        if key_condition:
+            kwargs['KeyConditionExpression'] = f'{key_condition} AND {expression}' if expression else key_condition
+        if filters:
+            kwargs['FilterExpression'] = ' AND '.join(filters)
+        if names:
+            kwargs['ExpressionAttributeNames'] = names
+        if values or key_values:
+            kwargs['ExpressionAttributeValues'] = {**values, **key_values}
+        return kwargs
     
-    for item in items:
-        print_request(item)
+    if email:
+        yield from query_items(target.table, IndexName='RequesterEmailIndex', ScanIndexForward=False,
+                               **request('requesterEmail = :email', **{':email': email}))
+    elif status:
+        shards = [query_items(target.table, IndexName='StatusIndex', ScanIndexForward=False,
+                              **request('statusShard = :shard', **{':shard': f"{status.upper()}#{shard}"}))
+                  for shard in range(STATUS_SHARDS)]
+        yield from heapq.merge(*shards, key=lambda item: item.get('timestamp', 0), reverse=True)
+    else:
+        yield from scan_items(target.table, segments=segments,
+                              table_factory=target.new_table if segments > 1 else None, **request())
 
-def view_by_status(status):
-    """View requests by status"""
-    response = table.scan(
-        FilterExpression='#status = :status',
-        ExpressionAttributeNames={'#status': 'status'},
-        ExpressionAttributeValues={':status': status.upper()}
-    )
+def request_pages(target, email=None, status=None, since=None, until=None, instance_type=None, segments=1,
+                  tag=False):
+    """One target's matching requests as lists of Request, newest first"""
+    requests = (Request(item, target.name if tag else None)
+                for item in fetch_items(target, email, status, since, until, instance_type, segments))
+    if not email and not status:
+        requests = iter(sorted(requests, key=lambda r: r.timestamp, reverse=True))
+    while True:
+        page = list(itertools.islice(requests, PAGE_ROWS))
+        if not page:
+            return
+        yield page
+
+def load_requests(targets, email=None, status=None, since=None, until=None, instance_type=None, segments=1,
+                  archive=None):
+    """
+    Load the matching requests, newest first.
     
-    items = response['Items']
-    items.sort(key=lambda x: decimal_to_int(x.get('timestamp', 0)), reverse=True)
+    Targets are read concurrently and merged as their pages arrive. With
+    archive set, rows come from the history archive (see the layer's
+    request_archive module) instead; only the day and status partitions
+    that can match are opened.
     
-    print(f"\n{'='*120}")
-    print(f"{status.upper()} REQUESTS - Total: {len(items)}")
-    print(f"{'='*120}\n")
+    Returns:
+        (requests, {target name: exception} for targets that failed)
+    """
+    errors = {}
+    if archive:
+        items = request_archive.read(archive, since, until, [status] if status else None, email)
+        requests = [Request(item) for item in items
+                    if not instance_type or item.get('instanceType') == instance_type]
+        requests.sort(key=lambda r: r.timestamp, reverse=True)
+        return requests, errors
     
-    for item in items:
-        print_request(item)
+    tag = len(targets) > 1
+    pages = lambda target: request_pages(target, email, status, since, until, instance_type, segments, tag)
+    requests = [r for _, r in merge_streams(targets, pages, lambda r: r.timestamp, errors)]
+    return requests, errors
 
-def print_request(item):
-    """Print a single request in formatted way"""
-    status = item.get('status', 'UNKNOWN')
-    status_emoji = {
+def title(email=None, status=None, instance_type=None, archive=None, targets=1):
+    """Heading naming the filters, e.g. ARCHIVED PENDING REQUESTS BY x@y"""
+    parts = ['ARCHIVED' if archive else '', status.upper() if status else 'EC2 APPROVAL', 'REQUESTS',
+             f'FOR {instance_type}' if instance_type else '', f'BY {email}' if email else '',
+             f'IN {targets} TARGETS' if targets > 1 and not archive else '']
+    return ' '.join(part for part in parts if part)
+
+def table_lines(requests):
+    """One aligned line per request"""
+    lines = [f"{'Submitted':<21}{'Status':<10}{'Requester':<32}{'Name':<24}{'Type':<14}{'Count':>5}"
+             f"{'Decided in':>12}  Request ID", '-' * 140]
+    for r in requests:
+        seconds = r.decision_seconds()
+        lines.append(f"{format_timestamp(r.timestamp):<21}{r.status:<10}{(r.requesterEmail or '')[:31]:<32}"
+                     f"{(r.instanceName or '')[:23]:<24}{(r.instanceType or ''):<14}{r.instanceCount:>5}"
+                     f"{'' if seconds is None else f'{seconds}s':>12}  {r.requestId}"
+                     + (f"  {r.target}" if r.target else ''))
+    return lines
+
+def detail_lines(r):
+    """Every field of a single request, one per line"""
+    emoji = {
         'PENDING': '⏳',
         'APPROVED': '✅',
         'REJECTED': '❌',
-        'EXPIRED': '⏰'
-    }.get(status, '❓')
+        'EXPIRED': '⏰',
+        'FAILED': '⚠️'
+    }.get(r.status, '❓')
     
-    print(f"{status_emoji} REQUEST DETAILS")
-    print(f"{'='*80}")
+    lines = [
+        f"{emoji} REQUEST DETAILS",
+        '=' * 80,
+        '',
+        '📋 REQUEST INFO:',
+        f"   Request ID: {r.requestId}",
+        f"   Submitted: {format_timestamp(r.timestamp)}",
+        f"   Status: {r.status}",
+        '',
+        '👤 REQUESTER:',
+        f"   Email: {r.requesterEmail}",
+        '',
+        '💻 INSTANCE DETAILS:',
+        f"   Name: {r.instanceName}",
+        f"   Type: {r.instanceType}",
+        f"   Subnet: {r.subnetId}",
+        f"   Security Groups: {', '.join(r.securityGroupIds)}"
+    ]
     
-    # Request Information
-    print(f"\n📋 REQUEST INFO:")
-    print(f"   Request ID: {item.get('requestId')}")
-    print(f"   Submitted: {format_timestamp(item.get('timestamp'))}")
-    print(f"   Status: {status}")
+    # Optional Configuration
+    if r.amiId:
+        lines.append(f"   AMI: {r.amiId}")
+    if r.ebsVolumeSize:
+        lines.append(f"   EBS: {r.ebsVolumeSize} GB ({r.ebsVolumeType or 'default'})")
+    if r.privateIpAddress:
+        lines.append(f"   Private IP: {r.privateIpAddress}")
     
-    # Requester Information
-    print(f"\n👤 REQUESTER:")
-    print(f"   Email: {item.get('requesterEmail')}")
+    lines += ['', '✍️  APPROVAL INFO:', f"   Approver Email: {r.approverEmail or 'N/A'}"]
+    if r.autoApprovalRule:
+        lines.append(f"   Auto-Approved: rule {r.autoApprovalRule} (Express workflow)")
+    if r.approvalTimestamp:
+        lines.append(f"   Decision Time: {format_timestamp(r.approvalTimestamp)}")
+    if len(r.instanceIds) > 1:
+        lines.append(f"   Instance IDs ({len(r.instanceIds)}): {', '.join(r.instanceIds)}")
+    elif r.instanceIds:
+        lines.append(f"   Instance ID: {r.instanceIds[0]}")
     
-    # Instance Details
-    print(f"\n💻 INSTANCE DETAILS:")
-    print(f"   Name: {item.get('instanceName')}")
-    print(f"   Type: {item.get('instanceType')}")
-    print(f"   Subnet: {item.get('subnetId')}")
-    print(f"   Security Groups: {', '.join(item.get('securityGroupIds', []))}")
+    lines += ['', '🔧 TECHNICAL:', f"   Execution ARN: {(r.executionArn or 'N/A')[:60]}...", '', '-' * 80, '']
+    return lines
+
+def fast_path_lines(requests):
+    """How many requests were auto-approved and how quickly requests were decided"""
+    auto = [r for r in requests if r.autoApprovalRule]
+    lines = [f"Auto-approved (Express): {len(auto)} of {len(requests)}"]
+    for label, group in (('auto-approved', auto), ('emailed', [r for r in requests if not r.autoApprovalRule])):
+        seconds = [s for s in (r.decision_seconds() for r in group) if s is not None]
+        if seconds:
+            lines.append(f"   Submission to decision ({label}): median {statistics.median(seconds):.0f}s, "
+                         f"max {max(seconds)}s over {len(seconds)} decided")
+    return lines
+
+def group_requests(requests, group_by):
+    """
+    Summarize requests per group in one pass.
     
-    # Optional Configuration
-    if item.get('amiId'):
-        print(f"   AMI: {item.get('amiId')}")
-    if item.get('ebsVolumeSize'):
-        print(f"   EBS: {decimal_to_int(item.get('ebsVolumeSize'))} GB ({item.get('ebsVolumeType', 'default')})")
-    if item.get('privateIpAddress'):
-        print(f"   Private IP: {item.get('privateIpAddress')}")
-    
-    # Approval Information
-    print(f"\n✍️  APPROVAL INFO:")
-    print(f"   Approver Email: {item.get('approverEmail', 'N/A')}")
-    if item.get('approvalTimestamp'):
-        print(f"   Decision Time: {format_timestamp(item.get('approvalTimestamp'))}")
-    if item.get('instanceId'):
-        print(f"   Instance ID: {item.get('instanceId')}")
-    
-    # Technical Details
-    print(f"\n🔧 TECHNICAL:")
-    print(f"   Execution ARN: {item.get('executionArn', 'N/A')[:60]}...")
-    
-    print(f"\n{'-'*80}\n")
+    Returns:
+        List of dicts (group, requests, instances, per-status counts,
+        autoApproved, medianDecisionSeconds), largest group first
+    """
+    key = GROUP_KEYS[group_by]
+    groups = {}
+    for r in requests:
+        group = groups.get(key(r))
+        if group is None:
+            group = groups[key(r)] = {'requests': 0, 'instances': 0, 'statuses': {}, 'autoApproved': 0, 'seconds': []}
+        group['requests'] += 1
+        group['instances'] += r.instanceCount
+        group['statuses'][r.status] = group['statuses'].get(r.status, 0) + 1
+        if r.autoApprovalRule:
+            group['autoApproved'] += 1
+        seconds = r.decision_seconds()
+        if seconds is not None:
+            group['seconds'].append(seconds)
+    
+    summary = []
+    for name, group in groups.items():
+        seconds = group.pop('seconds')
+        group['medianDecisionSeconds'] = statistics.median(seconds) if seconds else None
+        summary.append({'group': name, **group})
+    summary.sort(key=lambda g: (-g['requests'], str(g['group'])))
+    return summary
+
+def group_lines(summary, group_by):
+    """One line of counts per group"""
+    lines = [f"{group_by:<40}{'Requests':>10}{'Instances':>11}{'Auto':>7}{'Median decision':>17}  Statuses",
+             '-' * 140]
+    for g in summary:
+        median = '' if g['medianDecisionSeconds'] is None else f"{g['medianDecisionSeconds']:.0f}s"
+        statuses = ', '.join(f"{status} {g['statuses'][status]}" for status in (*STATUSES, 'UNKNOWN')
+                             if g['statuses'].get(status))
+        lines.append(f"{str(g['group'])[:39]:<40}{g['requests']:>10}{g['instances']:>11}{g['autoApproved']:>7}"
+                     f"{median:>17}  {statuses}")
+    return lines
+
+def view_requests(targets, email=None, status=None, since=None, until=None, instance_type=None, segments=1,
+                  archive=None, group_by=None, output_format='table', details=False):
+    """
+    List or summarize the requests matching every given filter.
+    
+    The whole report is rendered to a list of lines and written to stdout
+    in one call. Targets that could not be read are listed after the
+    heading, or on stderr for json and ndjson, and the report covers the
+    rest.
+    """
+    requests, errors = load_requests(targets, email, status, since, until, instance_type, segments, archive)
+    failures = [f"⚠️  {name}: {str(error)}" for name, error in errors.items()]
+    
+    if output_format == 'json':
+        rows = group_requests(requests, group_by) if group_by else [r.to_dict() for r in requests]
+        lines = [json.dumps(rows)]
+    elif output_format == 'ndjson':
+        rows = group_requests(requests, group_by) if group_by else (r.to_dict() for r in requests)
+        lines = [json.dumps(row, separators=(',', ':')) for row in rows]
+    else:
+        lines = ['', '=' * 120, f"{title(email, status, instance_type, archive, len(targets))} - Total: {len(requests)}",
+                 '=' * 120, ''] + failures + ([''] if failures else [])
+        if group_by:
+            lines += group_lines(group_requests(requests, group_by), group_by)
+        elif details:
+            for r in requests:
+                lines += detail_lines(r)
+        else:
+            lines += table_lines(requests)
+        lines += [''] + fast_path_lines(requests)
+    
+    if failures and output_format != 'table':
+        sys.stderr.write('\n'.join(failures) + '\n')
+    if lines:
+        sys.stdout.write('\n'.join(lines) + '\n')
+
+def get_stats(keys):
+    """Read counter items by key with BatchGetItem ({statKey: item})"""
+    found = {}
+    keys = list(dict.fromkeys(keys))
+    for start in range(0, len(keys), 100):
+        request = {stats_table.name: {'Keys': [{'statKey': key} for key in keys[start:start + 100]]}}
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response['Responses'].get(stats_table.name, []):
+                found[item['statKey']] = item
+            request = response.get('UnprocessedKeys')
+    return found
+
+def stats_days(since=None, until=None):
+    """Day keys (UTC) from --since/--until, default the last 7 days"""
+    end = datetime.fromtimestamp(until if until is not None else datetime.now().timestamp(), timezone.utc).date()
+    start = datetime.fromtimestamp(since, timezone.utc).date() if since is not None else end - timedelta(days=6)
+    days = []
+    while start <= end:
+        days.append(start.isoformat())
+        start += timedelta(days=1)
+    return days
+
+def format_counts(item):
+    """One line of request and per-status counts"""
+    parts = [f"{decimal_to_int(item.get('requests', 0))} requests"]
+    parts += [f"{status} {decimal_to_int(item[status])}" for status in STATUSES if item.get(status)]
+    if item.get('autoApproved'):
+        parts.append(f"auto-approved {decimal_to_int(item['autoApproved'])}")
+    return ', '.join(parts)
+
+def view_stats(email=None, since=None, until=None):
+    """
+    Print the pre-aggregated counters.
+    
+    Totals, days, latencies and the requester are read by key in one
+    BatchGetItem. The per-instance-type breakdown scans the stats table,
+    which holds one small item per type, never the requests table.
+    """
+    days = stats_days(since, until)
+    keys = ['all'] + [f"day#{day}" for day in days] + [f"latency#{status}" for status in STATUSES[1:]]
+    if email:
+        keys.append(f"requester#{email}")
+    stats = get_stats(keys)
+    
+    print(f"\n{'='*120}")
+    print("EC2 APPROVAL STATS (from EC2ApprovalStats)")
+    print(f"{'='*120}\n")
+    print(f"All time: {format_counts(stats.get('all', {}))}")
+    if email:
+        print(f"{email}: {format_counts(stats.get(f'requester#{email}', {}))}")
+    
+    print("\nBy day (UTC):")
+    for day in days:
+        if f"day#{day}" in stats:
+            print(f"   {day}: {format_counts(stats[f'day#{day}'])}")
+    
+    print("\nBy instance type:")
+    types = scan_items(stats_table, FilterExpression='begins_with(statKey, :prefix)',
+                       ExpressionAttributeValues={':prefix': 'instanceType#'})
+    for item in sorted(types, key=lambda x: x['statKey']):
+        print(f"   {item['statKey'].split('#', 1)[1]}: {format_counts(item)}, "
+              f"{decimal_to_int(item.get('instances', 0))} instances")
+    
+    print("\nSubmission to decision:")
+    for status in STATUSES[1:]:
+        item = stats.get(f"latency#{status}")
+        if not item or not item.get('count'):
+            continue
+        count = decimal_to_int(item['count'])
+        histogram = ', '.join(f"{bucket[3:]}s: {decimal_to_int(item[bucket])}"
+                              for bucket in LATENCY_BUCKETS if item.get(bucket))
+        print(f"   {status}: {count} decided, mean {float(item['sumSeconds']) / count:.0f}s ({histogram})")
+    print()
+
+def metric_percentiles(cloudwatch, metric, dimension, value, start, end):
+    """Sample count and p50/p95/p99 of one metric over the whole range, or None"""
+    # One period spanning the range, so percentiles are not averaged across periods
+    period = max(3600, math.ceil((end - start) / 3600) * 3600)
+    response = cloudwatch.get_metric_statistics(
+        Namespace=METRICS_NAMESPACE,
+        MetricName=metric,
+        Dimensions=[{'Name': dimension, 'Value': value}],
+        StartTime=datetime.fromtimestamp(start, timezone.utc),
+        EndTime=datetime.fromtimestamp(end, timezone.utc),
+        Period=period,
+        Statistics=['SampleCount'],
+        ExtendedStatistics=['p50', 'p95', 'p99']
+    )
+    points = [p for p in response['Datapoints'] if p.get('SampleCount')]
+    if not points:
+        return None
+    point = max(points, key=lambda p: p['SampleCount'])
+    return int(point['SampleCount']), [point['ExtendedStatistics'][p] for p in ('p50', 'p95', 'p99')]
+
+def view_stages(since=None, until=None):
+    """Print per-stage and per-function percentiles from CloudWatch (default: last 7 days)"""
+    cloudwatch = boto3.client('cloudwatch', region_name=dynamodb.meta.client.meta.region_name)
+    end = until if until is not None else int(datetime.now().timestamp())
+    start = since if since is not None else end - 7 * 86400
+    
+    print(f"\n{'='*120}")
+    print(f"PIPELINE TIMING {format_timestamp(start)} - {format_timestamp(end)}")
+    print(f"{'='*120}\n")
+    print(f"{'Stage (since submit)':<24}{'count':>8}{'p50':>12}{'p95':>12}{'p99':>12}")
+    for stage in STAGES:
+        result = metric_percentiles(cloudwatch, 'SinceSubmitSeconds', 'Stage', stage, start, end)
+        if result:
+            count, values = result
+            print(f"{stage:<24}{count:>8}" + ''.join(f"{v:>11.1f}s" for v in values))
+    
+    print(f"\n{'Function duration':<24}{'count':>8}{'p50':>12}{'p95':>12}{'p99':>12}")
+    for function in FUNCTIONS:
+        result = metric_percentiles(cloudwatch, 'DurationMs', 'Function', function, start, end)
+        if result:
+            count, values = result
+            print(f"{function:<24}{count:>8}" + ''.join(f"{v:>10.1f}ms" for v in values))
+    print()
 
 def main():
     parser = argparse.ArgumentParser(description='View EC2 Approval Request Logs')
     parser.add_argument('--user', help='Filter by requester email')
-    parser.add_argument('--status', help='Filter by status (PENDING/APPROVED/REJECTED/EXPIRED)')
+    parser.add_argument('--status', help='Filter by status (PENDING/APPROVED/REJECTED/EXPIRED/FAILED)')
+    parser.add_argument('--instance-type', help='Filter by instance type, e.g. t3.micro')
+    parser.add_argument('--segments', type=int, default=1, help='Parallel scan segments (default: 1)')
+    parser.add_argument('--since', type=parse_time, help='Only requests submitted at or after this time')
+    parser.add_argument('--until', type=parse_time, help='Only requests submitted at or before this time')
+    parser.add_argument('--group-by', choices=sorted(GROUP_KEYS), help='Summarize matching requests per group')
+    parser.add_argument('--format', choices=('table', 'json', 'ndjson'), default='table',
+                        help='Output format (default: table)')
+    parser.add_argument('--details', action='store_true', help='Print every field of each request (table format)')
+    parser.add_argument('--stats', action='store_true', help='Show pre-aggregated counters instead of requests')
+    parser.add_argument('--stages', action='store_true', help='Show p50/p95/p99 per pipeline stage from CloudWatch')
+    parser.add_argument('--archive', metavar='URL',
+                        help='Read requests from the history archive (directory or s3://bucket/prefix)')
+    parser.add_argument('--target', action='append', metavar='REGION[/TABLE][@PROFILE]',
+                        help='Table to read; repeat to merge several regions or accounts '
+                             '(default: $DYNAMODB_TARGETS or the table in $AWS_REGION)')
     
     args = parser.parse_args()
+    if args.target and (args.stats or args.stages or args.archive):
+        parser.error('--target cannot be combined with --stats, --stages or --archive; set AWS_REGION instead')
+    try:
+        targets = parse_targets(args.target)
+    except ValueError as e:
+        parser.error(str(e))
     
     try:
-        if args.user:
-            view_by_user(args.user)
-        elif args.status:
-            view_by_status(args.status)
+        if args.stages:
+            view_stages(args.since, args.until)
+        elif args.stats:
+            view_stats(args.user, args.since, args.until)
         else:
-            view_all_requests()
+            view_requests(targets, args.user, args.status, args.since, args.until, args.instance_type, args.segments,
+                          args.archive, args.group_by, args.format, args.details)
     except Exception as e:
         print(f"Error: {str(e)}")
         print("\nMake sure:")
-        print("1. DynamoDB table 'EC2ApprovalRequests' exists")
+        print(f"1. DynamoDB tables exist: {', '.join(target.name for target in targets)}")
         print("2. You have AWS credentials configured")
         print("3. You have permissions to read from DynamoDB")
 
@@ -16,6 +16,11 @@ const API_CONFIG = {
     }
 };
 
+// Idempotency key for the current submission. Retries of the same form
+// reuse it so the backend never starts a second workflow; it is cleared
+// once the request succeeds or the form changes.
+let idempotencyKey = null;
+
 // Form submission handler
 document.getElementById('ec2RequestForm').addEventListener('submit', async (e) => {
     e.preventDefault();
@@ -65,16 +70,24 @@ document.getElementById('ec2RequestForm').addEventListener('submit', async (e) =
         
         console.log('Submitting request:', formData);
         
+        if (!idempotencyKey) {
+            idempotencyKey = crypto.randomUUID();
+        }
+        
         // Make API call
         const response = await fetch(API_CONFIG.endpoint, {
             method: 'POST',
-            headers: API_CONFIG.getHeaders(),
+            headers: {
+                ...API_CONFIG.getHeaders(),
+                'Idempotency-Key': idempotencyKey
+            },
             body: JSON.stringify(formData)
         });
         
         const result = await response.json();
         
         if (response.ok) {
+            idempotencyKey = null;
             showMessage('success', `
                 ✅ Request submitted successfully!<br>
                 <strong>Execution ARN:</strong> ${result.executionArn || 'N/A'}<br>
@@ -117,8 +130,14 @@ function showMessage(type, message) {
     responseMessage.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
 }
 
+// Any edit makes this a new request
+document.getElementById('ec2RequestForm').addEventListener('input', () => {
+    idempotencyKey = null;
+});
+
 // Form reset handler
 document.getElementById('ec2RequestForm').addEventListener('reset', () => {
+    idempotencyKey = null;
     const responseMessage = document.getElementById('responseMessage');
     responseMessage.className = 'response-message';
     responseMessage.style.display = 'none';
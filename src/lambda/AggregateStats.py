@@ -0,0 +1,54 @@
+"""
+Lambda Function: AggregateStats
+Purpose: Keeps the pre-aggregated counters in EC2ApprovalStats up to date
+Trigger: DynamoDB Stream of EC2ApprovalRequests (NEW_AND_OLD_IMAGES)
+"""
+
+from dynamodb_items import deserialize_item, is_ttl_delete
+import request_stats
+import metrics
+
+@metrics.instrument("AggregateStats")
+def lambda_handler(event, context):
+    """
+    Applies a batch of stream records to the stats counters.
+
+    Each record adds its new image's contribution and subtracts its old
+    image's, so an INSERT counts a new request and a MODIFY that changes
+    the status moves it between status counters. A row deleted by a user
+    or a function (e.g. RequestStarter dropping a request whose execution
+    never started) is subtracted; rows deleted by TTL keep their counts.
+    Deltas are merged across the whole batch and written with one ADD per
+    counter item; updates that do not touch a counted field (e.g. the
+    execution ARN) cancel out and write nothing.
+
+    The flush is keyed on the batch's last sequence number, so when a failed
+    batch is retried the counter items it already updated are skipped (see
+    request_stats.flush).
+
+    Args:
+        event: DynamoDB Streams event
+        context: Lambda context object
+
+    Returns:
+        Records processed and counter items updated
+
+    Environment Variables:
+        STATS_TABLE: Counter table name (default: EC2ApprovalStats)
+    """
+    totals = {}
+    records = event.get("Records", [])
+    for record in records:
+        # TTL deletions keep their counts
+        if is_ttl_delete(record):
+            continue
+        images = record.get("dynamodb", {})
+        new = deserialize_item(images["NewImage"]) if "NewImage" in images else None
+        old = deserialize_item(images["OldImage"]) if "OldImage" in images else None
+        request_stats.accumulate(totals, request_stats.contribution(new))
+        request_stats.accumulate(totals, request_stats.contribution(old), sign=-1)
+
+    batch_id = records[-1].get("dynamodb", {}).get("SequenceNumber") if records else None
+    updated = request_stats.flush(totals, batch_id)
+    print(f"Applied {len(records)} stream records to {updated} counter items")
+    return {"records": len(records), "itemsUpdated": updated}
@@ -1,63 +1,285 @@
 """
 Lambda Function: ApprovalHandler
-Purpose: Handles approval/rejection decisions from email links
-Trigger: API Gateway GET /approval
+Purpose: Handles approval/rejection decisions from email links and the bulk API
+Trigger: API Gateway GET /approval, POST /approval/batch
 """
 
-import boto3
 import json
+import os
+import approval_tokens
+import metrics
+from aws_clients import get_client
 
-sfn = boto3.client("stepfunctions")
+# Concurrent send_task_success/send_task_failure calls for bulk decisions
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "10"))
+# Largest number of decisions accepted by POST /approval/batch
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "100"))
 
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type"
+}
+
+# Step Functions errors that mean the task can no longer be decided
+TASK_ERRORS = {
+    "TaskTimedOut": "TASK_TIMED_OUT",
+    "InvalidToken": "INVALID_TOKEN",
+    "TaskDoesNotExist": "TASK_DOES_NOT_EXIST"
+}
+
+# Outcomes for a link that can no longer be used
+CLOSED_OUTCOMES = set(TASK_ERRORS.values()) | {"ALREADY_DECIDED"}
+
+@metrics.instrument("ApprovalHandler")
 def lambda_handler(event, context):
     """
     Processes approval or rejection from email link and sends task token response.
-    
+
     Args:
-        event: API Gateway event with query parameters (action, token)
+        event: API Gateway event with query parameters (action, token), or a
+            POST /approval/batch body (see handle_batch)
         context: Lambda context object
-        
+
     Returns:
         API Gateway response with success/error message
-        
+
     Query Parameters:
-        action: "approve" or "reject"
-        token: Step Functions task token from email
+        action: "approve", "reject" or "approve-all"
+        token: Short approval ID from the email (or a raw task token from
+            emails sent before short IDs)
+        approver: Address a digest was sent to, used only to find the
+            digest record (approve-all only)
+        digest: Digest record to approve (approve-all only)
+
+    approvedBy is the authorizer's email claim if there is one, otherwise
+    the address the approval email was sent to. An approver named in the
+    query string or a batch body is never recorded.
+
+    Environment Variables:
+        MAX_WORKERS: Concurrent Step Functions calls for bulk decisions (default: 10)
+        MAX_BATCH_SIZE: Most decisions per POST /approval/batch (default: 100)
+        APPROVAL_TOKEN_TABLE: Table mapping short IDs to task tokens (default: EC2ApprovalTokens)
     """
+    method = event.get("httpMethod") or event.get("requestContext", {}).get("http", {}).get("method")
+    if method == "OPTIONS":
+        return {
+            "statusCode": 200,
+            "headers": CORS_HEADERS,
+            "body": ""
+        }
+    if method == "POST":
+        return handle_batch(event)
+
     qs = event.get("queryStringParameters") or {}
     action = qs.get("action")
     token = qs.get("token")
-    
+    approver = approver_identity(event)
+
+    if action == "approve-all":
+        return approve_digest(qs.get("digest"), qs.get("approver"), approver)
+
     # Validate parameters
     if not token or action not in ("approve", "reject"):
         return {
-            "statusCode": 400, 
+            "statusCode": 400,
             "body": "Missing or invalid parameters"
         }
-    
-    # Handle approval
-    if action == "approve":
-        sfn.send_task_success(
+
+    outcome = decide_link(token, action, approver)
+    if outcome in CLOSED_OUTCOMES:
+        return {
+            "statusCode": 410,
+            "body": "This request was already decided or has expired."
+        }
+    if outcome == "ERROR":
+        return {
+            "statusCode": 502,
+            "body": "Could not record your decision. Please try again."
+        }
+
+    return {
+        "statusCode": 200,
+        "body": f"{outcome.capitalize()}. You may close this page."
+    }
+
+def approver_identity(event):
+    """
+    Who is making the decision, as verified by an API Gateway authorizer.
+
+    Only authorizer claims (e.g. Cognito) are trusted. Returns None without
+    them, in which case decide_link() uses the address the approval email
+    was sent to.
+    """
+    authorizer = event.get("requestContext", {}).get("authorizer") or {}
+    claims = (authorizer.get("jwt") or {}).get("claims") or authorizer.get("claims") or {}
+    return claims.get("email")
+
+def decide_link(token, action, approver):
+    """
+    Resolve a token from an approval link and decide it, at most once.
+
+    The short ID is claimed with a conditional write before Step Functions
+    is called, so concurrent clicks cannot both send a decision. A claim
+    whose decision fails with ERROR is released for another try.
+
+    Returns:
+        decide()'s outcome, INVALID_TOKEN for an unknown or expired ID, or
+        ALREADY_DECIDED if the ID was used before
+    """
+    if not approval_tokens.is_short(token):
+        return decide(token, action, approver or "unknown")
+
+    try:
+        record = approval_tokens.resolve(token)
+    except Exception as e:
+        print(f"Failed to resolve approval token: {str(e)}")
+        return "ERROR"
+    if record is None:
+        return "INVALID_TOKEN"
+    if record["usedAt"]:
+        return "ALREADY_DECIDED"
+    try:
+        if not approval_tokens.claim(token):
+            return "ALREADY_DECIDED"
+    except Exception as e:
+        print(f"Failed to claim approval token: {str(e)}")
+        return "ERROR"
+
+    outcome = decide(record["taskToken"], action, approver or record["approverEmail"])
+    if outcome == "ERROR":
+        approval_tokens.release(token)
+    else:
+        approval_tokens.complete(token, outcome)
+    if outcome in ("APPROVED", "REJECTED"):
+        metrics.stage("decision", record["requestId"], record["submittedAt"], outcome=outcome)
+    return outcome
+
+def decide(token, action, approver):
+    """
+    Send one approve/reject decision to Step Functions.
+
+    Returns:
+        APPROVED or REJECTED, one of TASK_ERRORS' outcomes if the task can no
+        longer be decided, or ERROR for anything else
+    """
+    sfn = get_client("stepfunctions")
+    try:
+        if action == "approve":
+            sfn.send_task_success(
+                taskToken=token,
+                output=json.dumps({
+                    "approval": {
+                        "decision": "APPROVED",
+                        "approvedBy": approver
+                    }
+                })
+            )
+            return "APPROVED"
+
+        sfn.send_task_failure(
             taskToken=token,
-            output=json.dumps({
-                "approval": {
-                    "decision": "APPROVED", 
-                    "approvedBy": "manager"
-                }
-            })
+            error="RejectedByApprover",
+            cause=f"Rejected by {approver}"
         )
+        return "REJECTED"
+    except Exception as e:
+        code = getattr(e, "response", {}).get("Error", {}).get("Code", "")
+        if code in TASK_ERRORS:
+            return TASK_ERRORS[code]
+        print(f"Failed to {action} task: {str(e)}")
+        return "ERROR"
+
+def decide_all(decisions, approver):
+    """Run (token, action) decisions with bounded concurrency, in input order"""
+    if len(decisions) == 1:
+        return [decide_link(decisions[0][0], decisions[0][1], approver)]
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(decisions))) as pool:
+        return list(pool.map(lambda decision: decide_link(decision[0], decision[1], approver), decisions))
+
+def handle_batch(event):
+    """
+    POST /approval/batch: decide many requests in one call.
+
+    Body:
+        {"decisions": [{"token": "...", "action": "approve" | "reject"}, ...]}
+
+    An "approver" field in the body is ignored: decisions are recorded
+    under the authorizer's identity or the address each email was sent to.
+
+    Returns:
+        200 with one outcome per decision (by index, in input order) and a
+        count per outcome. approvedBy is null when each decision is recorded
+        under the address its approval email was sent to.
+    """
+    try:
+        body = json.loads(event.get("body") or "{}")
+    except ValueError:
+        return batch_response(400, {"message": "Request body is not valid JSON"})
+
+    decisions = body.get("decisions") if isinstance(body, dict) else None
+    if not isinstance(decisions, list) or not decisions:
+        return batch_response(400, {"message": "decisions must be a non-empty list"})
+    if len(decisions) > MAX_BATCH_SIZE:
+        return batch_response(400, {"message": f"At most {MAX_BATCH_SIZE} decisions per batch"})
+
+    approver = approver_identity(event)
+
+    results = [None] * len(decisions)
+    valid = []
+    for index, entry in enumerate(decisions):
+        if not isinstance(entry, dict) or not entry.get("token") or entry.get("action") not in ("approve", "reject"):
+            results[index] = {"index": index, "outcome": "INVALID_REQUEST"}
+        else:
+            valid.append((index, entry["token"], entry["action"]))
+
+    outcomes = decide_all([(token, action) for _, token, action in valid], approver) if valid else []
+    for (index, _, action), outcome in zip(valid, outcomes):
+        results[index] = {"index": index, "action": action, "outcome": outcome}
+
+    summary = {}
+    for result in results:
+        summary[result["outcome"]] = summary.get(result["outcome"], 0) + 1
+
+    print(f"Batch decision by {approver or 'the emailed approvers'}: {summary}")
+    return batch_response(200, {
+        "approvedBy": approver,
+        "summary": summary,
+        "results": results
+    })
+
+def batch_response(status_code, payload):
+    """Build an API Gateway JSON response with CORS headers"""
+    return {
+        "statusCode": status_code,
+        "headers": {"Content-Type": "application/json", **CORS_HEADERS},
+        "body": json.dumps(payload)
+    }
+
+def approve_digest(digest_id, digest_approver, approver):
+    """Approve every request listed in a digest email (single use)"""
+    if not digest_id or not digest_approver:
+        return {
+            "statusCode": 400,
+            "body": "Missing or invalid parameters"
+        }
+
+    import approval_digest
+
+    token_ids = approval_digest.take_digest(digest_approver, digest_id)
+    if not token_ids:
         return {
-            "statusCode": 200, 
-            "body": "Approved. You may close this page."
+            "statusCode": 410,
+            "body": "This digest was already used or has expired."
         }
-    
-    # Handle rejection
-    sfn.send_task_failure(
-        taskToken=token,
-        error="RejectedByApprover",
-        cause="Rejected via email link"
-    )
+
+    outcomes = decide_all([(token_id, "approve") for token_id in token_ids], approver)
+    approved = outcomes.count("APPROVED")
+    skipped = len(token_ids) - approved
     return {
-        "statusCode": 200, 
-        "body": "Rejected. You may close this page."
+        "statusCode": 200,
+        "body": f"Approved {approved} requests ({skipped} already decided, expired or failed). You may close this page."
     }
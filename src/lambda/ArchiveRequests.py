@@ -0,0 +1,39 @@
+"""
+Lambda Function: ArchiveRequests
+Purpose: Copies requests deleted by TTL to the history archive (gzip JSON Lines by day and status)
+Trigger: DynamoDB Stream of EC2ApprovalRequests (NEW_AND_OLD_IMAGES), filtered to TTL deletes
+"""
+
+from dynamodb_items import deserialize_item, is_ttl_delete
+import metrics
+import request_archive
+
+@metrics.instrument("ArchiveRequests")
+def lambda_handler(event, context):
+    """
+    Archives the old image of every row TTL deleted in a stream batch.
+
+    Rows are written to request_archive, one part file per day and status
+    partition in the batch. Deletes made by a user or another function
+    are not archived. A failed write raises, so the batch is retried;
+    copies archived before the failure are dropped by the archive's readers.
+
+    Args:
+        event: DynamoDB Streams event
+        context: Lambda context object
+
+    Returns:
+        Records processed, rows archived and part files written
+
+    Environment Variables:
+        ARCHIVE_URL: Archive root, s3://bucket/prefix or a local directory
+    """
+    records = event.get("Records", [])
+    rows = [deserialize_item(record["dynamodb"]["OldImage"]) for record in records if is_ttl_delete(record)]
+    if not rows:
+        return {"records": len(records), "archived": 0, "files": 0}
+
+    written = request_archive.write(request_archive.ARCHIVE_URL, rows)
+    metrics.emit({"ArchivedRequests": len(rows)}, {"Function": "ArchiveRequests"})
+    print(f"Archived {len(rows)} of {len(records)} stream records to {len(written)} partitions")
+    return {"records": len(records), "archived": len(rows), "files": len(written)}
@@ -0,0 +1,118 @@
+"""
+Lambda Function: CheckInstanceReadiness
+Purpose: Polls launched instances until they are running (and optionally pass status checks)
+Trigger: Step Functions (Wait loop after LaunchEC2)
+"""
+
+import os
+import random
+import time
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+import metrics
+
+# Backoff between polls, in seconds
+BASE_WAIT_SECONDS = int(os.environ.get("READINESS_BASE_WAIT_SECONDS", "5"))
+MAX_WAIT_SECONDS = int(os.environ.get("READINESS_MAX_WAIT_SECONDS", "60"))
+# Give up waiting after this long since launch
+TIMEOUT_SECONDS = int(os.environ.get("READINESS_TIMEOUT_SECONDS", "900"))
+
+# DescribeInstanceStatus accepts up to 100 instance IDs per call
+DESCRIBE_BATCH_SIZE = 100
+
+@metrics.instrument("CheckInstanceReadiness")
+def lambda_handler(event, context):
+    """
+    Checks every instance of a launch with one DescribeInstanceStatus call per tick.
+
+    The state machine sleeps between ticks in a Wait state (SecondsPath
+    $.readiness.Payload.waitSeconds), so no Lambda time is spent idle. It
+    also waits before the first tick, and instances EC2 does not report yet
+    (freshly launched IDs are eventually consistent) count as pending.
+
+    Args:
+        event: instanceIds, launchedAt (epoch seconds), attempt,
+            waitForStatusOk (also wait for system/instance status checks),
+            and requestId/submittedAt for the running stage metric
+        context: Lambda context object
+
+    Returns:
+        Readiness summary: ready/failed/timedOut flags, counts, IDs not yet
+        ready, next jittered wait, and time-to-running / time-to-status-ok
+        once reached
+
+    Environment Variables:
+        READINESS_BASE_WAIT_SECONDS: First backoff step (default: 5)
+        READINESS_MAX_WAIT_SECONDS: Backoff cap (default: 60)
+        READINESS_TIMEOUT_SECONDS: Stop waiting after this long (default: 900)
+    """
+    instance_ids = event["instanceIds"]
+    launched_at = event["launchedAt"]
+    attempt = event.get("attempt", 0)
+    wait_for_status_ok = event.get("waitForStatusOk", False)
+    previous = event.get("previous") or {}
+
+    statuses = describe(instance_ids)
+    elapsed = int(time.time() - launched_at)
+
+    running = [i for i in instance_ids if statuses.get(i, {}).get("state") == "running"]
+    status_ok = [i for i in running if statuses[i]["statusOk"]]
+    failed = [i for i in instance_ids if statuses.get(i, {}).get("state") in ("shutting-down", "terminated", "stopping", "stopped")]
+
+    result = {
+        "checked": True,
+        "attempt": attempt + 1,
+        "running": len(running),
+        "statusOk": len(status_ok),
+        "total": len(instance_ids),
+        "failedIds": failed,
+        "timeToRunningSeconds": previous.get("timeToRunningSeconds"),
+        "timeToStatusOkSeconds": previous.get("timeToStatusOkSeconds")
+    }
+
+    if len(running) == len(instance_ids) and result["timeToRunningSeconds"] is None:
+        result["timeToRunningSeconds"] = elapsed
+        metrics.emit({"TimeToRunning": elapsed}, unit="Seconds", instanceCount=len(instance_ids))
+        metrics.stage("running", event.get("requestId"), event.get("submittedAt"), instances=len(instance_ids))
+    if len(status_ok) == len(instance_ids) and result["timeToStatusOkSeconds"] is None:
+        result["timeToStatusOkSeconds"] = elapsed
+        metrics.emit({"TimeToStatusOk": elapsed}, unit="Seconds", instanceCount=len(instance_ids))
+
+    target = status_ok if wait_for_status_ok else running
+    result["ready"] = len(target) == len(instance_ids)
+    result["failed"] = bool(failed)
+    result["timedOut"] = not result["ready"] and not failed and elapsed >= TIMEOUT_SECONDS
+    result["notReadyIds"] = [i for i in instance_ids if i not in target][:20]
+    result["waitSeconds"] = next_wait(attempt)
+    return result
+
+def describe(instance_ids):
+    """
+    Return {instanceId: {"state", "statusOk"}} for the instances EC2 reports.
+
+    A batch naming an instance EC2 does not know yet fails with
+    InvalidInstanceID.NotFound; its instances are left out, so they count
+    as pending until a later tick (or the timeout).
+    """
+    statuses = {}
+    ec2 = get_client("ec2")
+    for start in range(0, len(instance_ids), DESCRIBE_BATCH_SIZE):
+        batch = instance_ids[start:start + DESCRIBE_BATCH_SIZE]
+        try:
+            response = ec2.describe_instance_status(InstanceIds=batch, IncludeAllInstances=True)
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "InvalidInstanceID.NotFound":
+                raise
+            print(f"{len(batch)} instances not visible yet, treating them as pending: {str(e)}")
+            continue
+        for status in response["InstanceStatuses"]:
+            statuses[status["InstanceId"]] = {
+                "state": status["InstanceState"]["Name"],
+                "statusOk": status["InstanceStatus"]["Status"] == "ok" and status["SystemStatus"]["Status"] == "ok"
+            }
+    return statuses
+
+def next_wait(attempt):
+    """Exponential backoff with jitter, as whole seconds for the Wait state"""
+    ceiling = min(MAX_WAIT_SECONDS, BASE_WAIT_SECONDS * (2 ** attempt))
+    return int(random.uniform(BASE_WAIT_SECONDS, max(BASE_WAIT_SECONDS, ceiling)))
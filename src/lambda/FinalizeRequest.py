@@ -0,0 +1,146 @@
+"""
+Lambda Function: FinalizeRequest
+Purpose: Records the final status in DynamoDB and notifies the requester (approved/rejected/expired)
+Trigger: Step Functions (terminal state of every path)
+"""
+
+import os
+import time
+import email_templates
+import metrics
+from aws_clients import get_client
+from request_status import update_status
+
+FROM_EMAIL = os.environ["FROM_EMAIL"]
+
+@metrics.instrument("FinalizeRequest")
+def lambda_handler(event, context):
+    """
+    Updates the request's status and sends the requester the decision outcome
+    and instance details.
+    
+    When LaunchEC2 fell short (requested, launchErrors) the email says how
+    many instances are missing and why.
+
+    One invocation replaces the former SendRequesterNotification +
+    UpdateRequestStatus pair. The status is written first: it is idempotent
+    and its failure is only logged, so a retry after a failed email never
+    sends the email twice. A row already removed by TTL is left gone rather
+    than re-created.
+    
+    Also logs the time from submission to this decision as an Embedded
+    Metric Format record (EndToEndSeconds, by Workflow and Decision), so
+    the auto-approved EXPRESS path can be counted and compared with the
+    STANDARD one in CloudWatch, and the "notified" pipeline stage (see the
+    metrics layer module). Expiry is recorded as the "decision" stage here,
+    since no approver acts on it.
+    
+    Args:
+        event: Contains requestId, decision, requester email, instance
+            details, and optional approvedBy/reason/submittedAt/workflow
+        context: Lambda context object
+        
+    Returns:
+        Status with recipient, decision, whether DynamoDB was updated and
+        the instance IDs
+        
+    Environment Variables:
+        FROM_EMAIL: SES verified sender email address
+        EMAIL_RENDERING: "local" or "ses" templates (default: local)
+        DYNAMODB_TABLE: DynamoDB table name (default: EC2ApprovalRequests)
+        STATUS_SHARDS: Write shards per status in StatusIndex (default: 4)
+    """
+    request_id = event.get("requestId")
+    requester_email = event["requesterEmail"]
+    decision = event.get("decision", "UNKNOWN")
+    reason = event.get("reason", "")
+    instance_id = event.get("instanceId", "")
+    instance_ids = event.get("instanceIds") or ([instance_id] if instance_id else [])
+    instance_type = event.get("instanceType", "")
+    instance_name = event.get("instanceName", "")
+    ami_id = event.get("amiId", "")
+    ami_source = event.get("amiSource", "")
+    ebs_volume_size = event.get("ebsVolumeSize", "")
+    ebs_volume_type = event.get("ebsVolumeType", "")
+    private_ip = event.get("privateIpAddress", "")
+    readiness = event.get("readiness") or {}
+    requested = event.get("requested") or len(instance_ids)
+    launch_errors = event.get("launchErrors") or []
+
+    status_updated = False
+    if request_id:
+        try:
+            update_status(
+                request_id,
+                decision,
+                instance_ids=instance_ids,
+                ami_id=ami_id,
+                approved_by=event.get("approvedBy"),
+                reason=reason
+            )
+            status_updated = True
+        except get_client("dynamodb").exceptions.ConditionalCheckFailedException:
+            print(f"Request {request_id} is no longer in DynamoDB (expired by TTL), status not recorded")
+        except Exception as e:
+            print(f"Failed to update DynamoDB: {str(e)}")
+    else:
+        print("No requestId provided, skipping DynamoDB update")
+    
+    data = {
+        "decision": decision,
+        "title": instance_name or "EC2 Provisioning",
+        "reason": reason,
+        "instanceName": instance_name,
+        "instanceType": instance_type,
+        "instanceId": instance_ids[0] if len(instance_ids) == 1 else "",
+        "amiId": ami_id,
+        "amiSource": ami_source,
+        "privateIp": private_ip
+    }
+    
+    if len(instance_ids) > 1:
+        data["fleet"] = {"count": len(instance_ids), "ids": ", ".join(instance_ids)}
+    
+    if decision == "APPROVED" and (launch_errors or len(instance_ids) < requested):
+        data["shortfall"] = {
+            "launched": len(instance_ids),
+            "requested": requested,
+            "errors": "; ".join(launch_errors)
+        }
+    
+    if readiness.get("checked"):
+        data["readiness"] = {
+            "running": readiness["running"],
+            "statusOk": readiness["statusOk"],
+            "total": readiness["total"],
+            "timeToRunning": readiness.get("timeToRunningSeconds"),
+            "failedIds": ", ".join(readiness.get("failedIds") or []),
+            "notReadyIds": ", ".join(readiness["notReadyIds"]) if readiness.get("timedOut") and not readiness.get("failedIds") else ""
+        }
+    
+    if ebs_volume_size or ebs_volume_type:
+        data["storage"] = {"size": ebs_volume_size, "type": ebs_volume_type}
+    
+    # Send email via SES
+    email_templates.send("EC2RequesterNotification", FROM_EMAIL, requester_email, data)
+    
+    workflow = event.get("workflow", "STANDARD")
+    if decision == "EXPIRED":
+        metrics.stage("decision", request_id, event.get("submittedAt"), outcome=decision)
+    metrics.stage("notified", request_id, event.get("submittedAt"), decision=decision, workflow=workflow)
+    if event.get("submittedAt"):
+        metrics.emit(
+            {"EndToEndSeconds": round(time.time() - event["submittedAt"], 3)},
+            {"Workflow": workflow, "Decision": decision},
+            dimension_sets=[["Workflow"], ["Workflow", "Decision"]]
+        )
+    
+    # The execution's output; ReconcilePending recovers the status from it
+    # if the update above failed
+    return {
+        "status": "SENT",
+        "to": requester_email,
+        "decision": decision,
+        "statusUpdated": status_updated,
+        "instanceIds": instance_ids
+    }
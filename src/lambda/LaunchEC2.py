@@ -1,21 +1,62 @@
-import boto3
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+import metrics
 
-ec2 = boto3.client("ec2")
+# Errors that another instance type may avoid
+CAPACITY_ERRORS = ("InsufficientInstanceCapacity", "Unsupported")
 
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "10"))
+# Concurrent Name tag calls; the default matches AWS_CLIENT_MAX_POOL
+TAG_WORKERS = int(os.environ.get("TAG_WORKERS", "25"))
+
+@metrics.instrument("LaunchEC2")
 def lambda_handler(event, context):
     """
-    Launch EC2 with optional private IP and EBS configuration.
+    Launch one or more EC2 instances with optional private IP and EBS configuration.
     If not provided, AWS will auto-assign.
+
+    Fleet launches split Count across SubnetIds (round-robin, for AZ balance)
+    and call run_instances for every subnet concurrently. When a subnet runs
+    short of capacity, the remainder is retried with each of
+    FallbackInstanceTypes in turn.
+
+    Any other error stops only the subnet it happened in, and a subnet that
+    runs out of fallback types reports its shortfall as an error. Instances
+    already launched elsewhere are still returned, with the errors, so the
+    request records every instance it owns; the error is raised only when
+    nothing launched at all. Per-instance Name tags are best-effort.
+
+    Each run_instances call carries a ClientToken derived from requestId,
+    subnet and instance type, so a retried or re-invoked launch returns the
+    instances it already started instead of launching a second fleet.
+
+    Optional params:
+        Count: Number of instances (default: MaxCount, then 1)
+        SubnetIds: Subnets to spread the fleet across (default: [SubnetId])
+        FallbackInstanceTypes: Types to try on capacity errors, in order
+
+    Optional event fields:
+        requestId, submittedAt: Correlation ID and submission time for the
+            launch stage metric
+
+    Returns:
+        Count/Requested, LaunchedAt (epoch seconds), every InstanceId,
+        compact details per instance, and Errors (one message per subnet
+        that failed or fell short; empty when the whole fleet launched)
     """
     params = event["params"]
-    
-    # Build RunInstances parameters
+
+    count = int(params.get("Count") or params.get("MaxCount") or 1)
+    subnet_ids = params.get("SubnetIds") or [params["SubnetId"]]
+    instance_types = [params["InstanceType"]] + list(params.get("FallbackInstanceTypes") or [])
+
+    # Build RunInstances parameters shared by every call
     run_params = {
         "ImageId": params["ImageId"],
-        "InstanceType": params["InstanceType"],
-        "MinCount": params["MinCount"],
-        "MaxCount": params["MaxCount"],
-        "SubnetId": params["SubnetId"],
         "SecurityGroupIds": params["SecurityGroupIds"],
         "TagSpecifications": [
             {
@@ -29,21 +70,23 @@ def lambda_handler(event, context):
             }
         ]
     }
-    
-    # Add PrivateIpAddress only if provided
+
+    # Add PrivateIpAddress only if provided (single instance only)
     private_ip = params.get("PrivateIpAddress", "").strip()
     if private_ip and private_ip != "null" and private_ip != "None":
+        if count > 1:
+            raise ValueError("PrivateIpAddress can only be used when launching a single instance")
         run_params["PrivateIpAddress"] = private_ip
-    
+
     # Add BlockDeviceMappings only if EBS config is provided
     ebs_size = params.get("EbsVolumeSize", "").strip()
     ebs_type = params.get("EbsVolumeType", "").strip()
-    
+
     if ebs_size and ebs_size != "null" and ebs_size != "None":
         try:
             volume_size = int(ebs_size)
             volume_type = ebs_type if ebs_type and ebs_type != "null" else "gp3"
-            
+
             run_params["BlockDeviceMappings"] = [
                 {
                     "DeviceName": "/dev/xvda",
@@ -57,14 +100,44 @@ def lambda_handler(event, context):
         except (ValueError, TypeError):
             # If conversion fails, skip EBS config (use AMI default)
             pass
-    
-    # Launch EC2 instance
-    response = ec2.run_instances(**run_params)
-    
+
+    # Spread the fleet over the subnets as evenly as possible
+    shares = [(subnet_id, count // len(subnet_ids) + (1 if i < count % len(subnet_ids) else 0))
+              for i, subnet_id in enumerate(subnet_ids)]
+    shares = [(subnet_id, n) for subnet_id, n in shares if n]
+
+    # Launch EC2 instances
+    launched_at = int(time.time())
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(shares))) as pool:
+        results = list(pool.map(
+            lambda share: launch_share(run_params, share[0], share[1], instance_types, event.get("requestId")),
+            shares
+        ))
+
+    instances = [instance for launched, _ in results for instance in launched]
+    failures = [(subnet_id, error) for (subnet_id, _), (_, error) in zip(shares, results) if error]
+    if not instances:
+        raise failures[0][1]
+    errors = [f"{subnet_id}: {str(error)}" for subnet_id, error in failures]
+    if errors:
+        print(f"Launched {len(instances)} of {count} instances; failed in {'; '.join(errors)}")
+    metrics.stage("launch", event.get("requestId"), event.get("submittedAt"),
+                  launchCallMs=round((time.perf_counter() - started) * 1000, 1), instances=len(instances))
+
+    # Give each fleet member its own Name tag. CreateTags sets one value per
+    # call, so the calls go out together rather than MAX_WORKERS at a time
+    if count > 1:
+        with ThreadPoolExecutor(max_workers=min(TAG_WORKERS, len(instances))) as pool:
+            list(pool.map(lambda pair: tag_instance(pair[1]["InstanceId"], f"{params['InstanceName']}-{pair[0] + 1}"),
+                          enumerate(instances)))
+
     # Extract only JSON-serializable data
-    instance = response["Instances"][0]
-    
-    return {
+    result = {
+        "Count": len(instances),
+        "Requested": count,
+        "LaunchedAt": launched_at,
+        "InstanceIds": [instance["InstanceId"] for instance in instances],
         "Instances": [{
             "InstanceId": instance["InstanceId"],
             "InstanceType": instance["InstanceType"],
@@ -72,5 +145,68 @@ def lambda_handler(event, context):
             "PrivateIpAddress": instance.get("PrivateIpAddress", ""),
             "SubnetId": instance["SubnetId"],
             "ImageId": instance["ImageId"]
-        }]
+        } for instance in instances],
+        "Errors": errors
     }
+    return result
+
+def client_token(request_id, subnet_id, instance_type):
+    """RunInstances idempotency token for one share of a request (at most 64 characters)"""
+    return hashlib.sha256(f"{request_id}#{subnet_id}#{instance_type}".encode()).hexdigest()
+
+def launch_share(run_params, subnet_id, count, instance_types, request_id=None):
+    """
+    Launch up to count instances in one subnet.
+
+    run_instances is called with MinCount=1 so EC2 returns whatever capacity
+    it has; any shortfall is retried with the next fallback instance type.
+    With a request_id every call carries a ClientToken (see client_token).
+
+    Returns:
+        (instances launched, the error that stopped the share early, or a
+        shortfall error if the fallback types ran out, or None)
+    """
+    launched = []
+    for instance_type in instance_types:
+        remaining = count - len(launched)
+        if remaining <= 0:
+            break
+        if request_id:
+            token = {"ClientToken": client_token(request_id, subnet_id, instance_type)}
+        else:
+            token = {}
+        try:
+            response = get_client("ec2").run_instances(
+                **run_params,
+                **token,
+                InstanceType=instance_type,
+                SubnetId=subnet_id,
+                MinCount=1,
+                MaxCount=remaining
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in CAPACITY_ERRORS:
+                print(f"Failed to launch {instance_type} in {subnet_id}: {str(e)}")
+                return launched, e
+            print(f"No {instance_type} capacity in {subnet_id}: {str(e)}")
+            continue
+        except Exception as e:
+            print(f"Failed to launch {instance_type} in {subnet_id}: {str(e)}")
+            return launched, e
+        launched.extend(response["Instances"])
+
+    if len(launched) < count:
+        message = f"Launched {len(launched)} of {count} instances; no capacity for {', '.join(instance_types)}"
+        print(f"{message} in {subnet_id}")
+        return launched, RuntimeError(message)
+    return launched, None
+
+def tag_instance(instance_id, name):
+    """Overwrite the shared Name tag with a per-instance one; failures keep the shared tag"""
+    try:
+        get_client("ec2").create_tags(
+            Resources=[instance_id],
+            Tags=[{"Key": "Name", "Value": name}]
+        )
+    except Exception as e:
+        print(f"Failed to tag {instance_id} as {name}: {str(e)}")
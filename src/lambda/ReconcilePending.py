@@ -0,0 +1,201 @@
+"""
+Lambda Function: ReconcilePending
+Purpose: Repairs requests left PENDING after their workflow ended (failed status update, failed or lost execution)
+Trigger: EventBridge schedule (e.g. rate(1 hour))
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from aws_clients import get_client
+from dynamodb_items import deserialize_item
+import metrics
+from request_status import STATUS_SHARDS, TABLE_NAME, update_status
+
+# Only rows older than the 4-hour approval timeout plus time to launch,
+# poll readiness and finalize can be stale
+RECONCILE_AFTER_SECONDS = int(os.environ.get("RECONCILE_AFTER_SECONDS", str(4 * 3600 + 1800)))
+RECONCILE_MAX_ROWS = int(os.environ.get("RECONCILE_MAX_ROWS", "1000"))
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "10"))
+# DescribeExecution calls per second, kept under the Step Functions quota
+DESCRIBE_RATE = float(os.environ.get("DESCRIBE_RATE", "20"))
+
+# Earliest time the next DescribeExecution may be sent
+_next_describe = 0.0
+_describe_lock = threading.Lock()
+
+@metrics.instrument("ReconcilePending")
+def lambda_handler(event, context):
+    """
+    Finds stale PENDING requests and records how their workflow ended.
+
+    A row stays PENDING if FinalizeRequest could not update it, if the
+    execution failed before reaching FinalizeRequest, or if no execution
+    survives to finish it. Candidates come from a Query of each PENDING
+    shard of StatusIndex for rows older than RECONCILE_AFTER_SECONDS, oldest
+    first, never a scan. Each one is checked and repaired on a thread pool;
+    DescribeExecution calls are paced to DESCRIBE_RATE across all workers.
+
+    Status written per execution outcome:
+        SUCCEEDED                  the decision FinalizeRequest returned
+        FAILED/TIMED_OUT/ABORTED   FAILED, with the execution's error
+        not found or not recorded  EXPIRED
+        auto-approved              FAILED (Express executions cannot be
+                                   described and last at most 5 minutes)
+        RUNNING                    left alone
+
+    Updates are conditional on the row still being PENDING, so a
+    FinalizeRequest that lands meanwhile always wins.
+
+    Args:
+        event: Scheduled event (unused)
+        context: Lambda context object
+
+    Returns:
+        Rows checked, repairs per status, rows still running, rows decided
+        concurrently and rows that could not be checked
+
+    Environment Variables:
+        RECONCILE_AFTER_SECONDS: Age at which a PENDING row is checked (default: 16200)
+        RECONCILE_MAX_ROWS: Most rows checked per run (default: 1000)
+        MAX_WORKERS: Concurrent checks (default: 10)
+        DESCRIBE_RATE: DescribeExecution calls per second (default: 20)
+        DYNAMODB_TABLE: DynamoDB table name (default: EC2ApprovalRequests)
+        STATUS_SHARDS: Write shards per status in StatusIndex (default: 4)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    started = time.perf_counter()
+    rows = stale_rows(int(time.time()) - RECONCILE_AFTER_SECONDS)
+    if not rows:
+        print("No stale PENDING requests")
+        return {"checked": 0, "repaired": {}, "running": 0, "raced": 0, "errors": 0}
+
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(rows))) as pool:
+        outcomes = list(pool.map(reconcile, rows))
+
+    repaired = {}
+    for outcome in outcomes:
+        if outcome not in ("RUNNING", "RACED", "ERROR"):
+            repaired[outcome] = repaired.get(outcome, 0) + 1
+    for status, count in repaired.items():
+        metrics.emit({"ReconciledRequests": count}, {"Status": status})
+
+    elapsed = time.perf_counter() - started
+    print(f"Reconciled {sum(repaired.values())} of {len(rows)} stale requests in {elapsed:.2f}s: {repaired}")
+    return {
+        "checked": len(rows),
+        "repaired": repaired,
+        "running": outcomes.count("RUNNING"),
+        "raced": outcomes.count("RACED"),
+        "errors": outcomes.count("ERROR")
+    }
+
+def stale_rows(before):
+    """PENDING rows submitted before a time, oldest first from each shard"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    per_shard = math.ceil(RECONCILE_MAX_ROWS / STATUS_SHARDS)
+
+    def query(shard):
+        paginator = get_client("dynamodb").get_paginator("query")
+        pages = paginator.paginate(
+            TableName=TABLE_NAME,
+            IndexName="StatusIndex",
+            KeyConditionExpression="statusShard = :shard AND #ts < :before",
+            ProjectionExpression="requestId, #ts, executionArn, autoApprovalRule",
+            ExpressionAttributeNames={"#ts": "timestamp"},
+            ExpressionAttributeValues={
+                ":shard": {"S": f"PENDING#{shard}"},
+                ":before": {"N": str(before)}
+            },
+            PaginationConfig={"MaxItems": per_shard}
+        )
+        return [deserialize_item(item) for page in pages for item in page["Items"]]
+
+    with ThreadPoolExecutor(max_workers=STATUS_SHARDS) as pool:
+        return [row for rows in pool.map(query, range(STATUS_SHARDS)) for row in rows]
+
+def reconcile(row):
+    """
+    Check one stale row and repair it.
+
+    Returns:
+        The status written, or RUNNING, RACED (decided or expired by TTL
+        meanwhile) or ERROR
+    """
+    request_id = row["requestId"]
+    try:
+        ending = final_status(row)
+    except Exception as e:
+        print(f"Could not check request {request_id}: {str(e)}")
+        return "ERROR"
+    if ending is None:
+        return "RUNNING"
+
+    status, reason, decided_at, instance_ids = ending
+    client = get_client("dynamodb")
+    try:
+        update_status(
+            request_id,
+            status,
+            instance_ids=instance_ids,
+            reason=reason,
+            decided_at=decided_at,
+            expected_status="PENDING"
+        )
+    except client.exceptions.ConditionalCheckFailedException:
+        # Decided by the workflow meanwhile, or the row is gone
+        return "RACED"
+    except Exception as e:
+        print(f"Failed to repair request {request_id}: {str(e)}")
+        return "ERROR"
+    return status
+
+def final_status(row):
+    """
+    How a stale request's workflow ended.
+
+    Returns:
+        (status, reason, decided_at, instance_ids), or None while the
+        execution is still running
+    """
+    if row.get("autoApprovalRule"):
+        return "FAILED", "Auto-approved workflow ended without recording a final status", None, ()
+    if not row.get("executionArn"):
+        return "EXPIRED", "No workflow execution was recorded", None, ()
+
+    try:
+        execution = describe_execution(row["executionArn"])
+    except Exception as e:
+        if getattr(e, "response", {}).get("Error", {}).get("Code") == "ExecutionDoesNotExist":
+            return "EXPIRED", "Workflow execution no longer exists", None, ()
+        raise
+
+    state = execution["status"]
+    if state == "RUNNING":
+        return None
+    stopped = execution.get("stopDate")
+    decided_at = stopped.timestamp() if stopped else None
+
+    if state == "SUCCEEDED":
+        result = json.loads(execution.get("output") or "{}").get("Payload") or {}
+        if result.get("decision"):
+            return result["decision"], None, decided_at, result.get("instanceIds") or ()
+        return "EXPIRED", "Workflow finished without a decision", decided_at, ()
+
+    details = ": ".join(part for part in (execution.get("error"), execution.get("cause")) if part)
+    return "FAILED", f"Workflow {state.lower().replace('_', ' ')}" + (f" ({details})" if details else ""), decided_at, ()
+
+def describe_execution(execution_arn):
+    """DescribeExecution, spaced to DESCRIBE_RATE calls per second across threads"""
+    global _next_describe
+    with _describe_lock:
+        now = time.monotonic()
+        slot = max(now, _next_describe)
+        _next_describe = slot + 1 / DESCRIBE_RATE
+    if slot > now:
+        time.sleep(slot - now)
+    return get_client("stepfunctions").describe_execution(executionArn=execution_arn)
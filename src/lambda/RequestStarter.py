@@ -6,98 +6,457 @@ Trigger: API Gateway POST /request
 
 import os
 import json
-import boto3
+import math
+import time
 import uuid
 from datetime import datetime
+from ami_aliases import alias_error, is_ami_id
+from aws_clients import get_client
+from dynamodb_items import batch_put_items, serialize_item
+import auto_approval
+import idempotency
+import inventory
+import metrics
+import quotas
+import rate_limit
+from request_status import status_shard
 
-sfn = boto3.client("stepfunctions")
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(os.environ.get("DYNAMODB_TABLE", "EC2ApprovalRequests"))
-ARN = os.environ["STATE_MACHINE_ARN"]
+# AWS clients are built on first use, so OPTIONS preflights and requests
+# rejected by validation return without loading boto3
+TABLE_NAME = os.environ.get("DYNAMODB_TABLE", "EC2ApprovalRequests")
 
+# Batch submission limits
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "200"))
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "10"))
+
+# Largest fleet a single request may launch
+MAX_INSTANCES_PER_REQUEST = int(os.environ.get("MAX_INSTANCES_PER_REQUEST", "100"))
+
+# Check subnet/security groups/instance type against EC2 before starting
+PREFLIGHT_VALIDATION = os.environ.get("PREFLIGHT_VALIDATION", "true").lower() == "true"
+
+# Express state machine for auto-approved requests (unset: every request is emailed)
+EXPRESS_STATE_MACHINE_ARN = os.environ.get("EXPRESS_STATE_MACHINE_ARN")
+
+REQUIRED_FIELDS = ("requesterEmail", "instanceName", "instanceType", "subnetId")
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, Idempotency-Key"
+}
+
+@metrics.instrument("RequestStarter")
 def lambda_handler(event, context):
     """
     Starts the EC2 approval workflow Step Functions execution.
-    
+
     Args:
         event: API Gateway event containing request body with EC2 parameters
         context: Lambda context object
-        
+
     Returns:
         API Gateway response with execution ARN
-        
+
+    Batch Mode:
+        If the body is a JSON array, every entry is validated up front and
+        one execution is started per entry. The response lists a
+        requestId/executionArn or an error for each entry, in input order.
+
+    Idempotency:
+        Single submissions are keyed on the requester and the
+        Idempotency-Key header, or on a hash of the body if no header is
+        sent. A duplicate within the TTL gets the original response back and
+        starts nothing; a key reused with a different body gets 422 (see the
+        idempotency layer module).
+
+    Rate Limits and Quotas:
+        Each requester has a token bucket (see the rate_limit layer module)
+        and optional instance/vCPU quotas (see quotas). A submission over
+        either gets 429 before anything is started, logged or emailed; a
+        batch takes one token per entry. Duplicates are answered first, so
+        only a first submission counts against the limits.
+
+    Auto-Approval:
+        Requests matching a rule of AUTO_APPROVAL_POLICY are started on the
+        Express state machine, which launches without asking an approver
+        (see the auto_approval layer module). Their response carries the
+        rule as autoApprovalRule.
+
     Environment Variables:
         STATE_MACHINE_ARN: ARN of the Step Functions state machine
+        EXPRESS_STATE_MACHINE_ARN: ARN of the Express state machine for auto-approved requests (default: none)
+        AUTO_APPROVAL_POLICY: JSON list of auto-approval rules (default: none)
         DYNAMODB_TABLE: DynamoDB table name for logging (default: EC2ApprovalRequests)
+        MAX_BATCH_SIZE: Maximum entries per batch submission (default: 200)
+        MAX_WORKERS: Concurrent start_execution calls in batch mode (default: 10)
+        STATUS_SHARDS: Write shards per status in StatusIndex (default: 4)
+        IDEMPOTENCY_TABLE: Table holding idempotency keys (default: EC2ApprovalIdempotency)
+        IDEMPOTENCY_LEASE_SECONDS: How long an unfinished submission holds its key (default: 30)
+        PREFLIGHT_VALIDATION: Validate against cached EC2 inventories (default: true)
+        MAX_INSTANCES_PER_REQUEST: Largest instanceCount accepted (default: 100)
+        RATE_LIMIT_BURST: Requests per requester before throttling, 0 to disable (default: 10)
+        RATE_LIMIT_PER_MINUTE: Sustained requests per requester per minute (default: 2)
+        QUOTA_MAX_INSTANCES: Instances per requester, 0 for no limit (default: 0)
+        QUOTA_MAX_VCPUS: vCPUs per requester, 0 for no limit (default: 0)
     """
     # Handle OPTIONS preflight request
     if event.get('httpMethod') == 'OPTIONS' or event.get('requestContext', {}).get('http', {}).get('method') == 'OPTIONS':
         return {
             "statusCode": 200,
-            "headers": {
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "POST, OPTIONS",
-                "Access-Control-Allow-Headers": "Content-Type"
-            },
+            "headers": CORS_HEADERS,
             "body": ""
         }
-    
-    body = json.loads(event.get("body") or "{}")
-    
+
+    try:
+        body = json.loads(event.get("body") or "{}")
+    except ValueError:
+        return response(400, {"message": "Request body is not valid JSON"})
+
+    if isinstance(body, list):
+        return handle_batch(body)
+
+    error = validate_request(body)
+    if error:
+        return response(400, {"message": error})
+
+    # Replay the original response for duplicate submissions, before any
+    # limit is applied: a retry costs one round trip and never a token
+    key = idempotency.request_key(event.get("headers"), body)
+    request_hash = idempotency.body_hash(body)
+    try:
+        previous = idempotency.cached_response(key, request_hash)
+        if previous is None:
+            previous = idempotency.claim(key, request_hash)
+    except idempotency.KeyReused:
+        return response(422, {"message": "Idempotency-Key was already used for a different request"})
+    if previous == {}:
+        return response(409, {"message": "An identical request is already being submitted"})
+    if previous is not None:
+        return response(200, previous, replayed=True)
+
+    try:
+        error = preflight(body)
+        rejected = response(400, {"message": error}) if error else check_limits([body])
+        if rejected:
+            idempotency.release(key)
+            return rejected
+
+        rule = auto_approval_rules([body])[0]
+        request_id, out, item = start_request(body, rule)
+    except Exception:
+        idempotency.release(key)
+        raise
+
+    # Log request to DynamoDB (auto-approved requests are logged already)
+    if item is not None:
+        log_item(item)
+
+    payload = {
+        "message": "Submitted",
+        "requestId": request_id,
+        "executionArn": out["executionArn"]
+    }
+    if rule:
+        payload["autoApprovalRule"] = rule
+    idempotency.complete(key, request_hash, payload)
+    return response(200, payload)
+
+def handle_batch(entries):
+    """
+    Validates and submits a list of requests.
+
+    Validation runs over the whole batch before anything is started, so a
+    malformed entry rejects the batch without side effects. Executions are
+    started concurrently and the audit rows are written with BatchWriteItem
+    in chunks of 25 items.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if not entries:
+        return response(400, {"message": "Batch is empty"})
+    if len(entries) > MAX_BATCH_SIZE:
+        return response(400, {"message": f"Batch exceeds maximum of {MAX_BATCH_SIZE} requests"})
+
+    errors = []
+    for index, entry in enumerate(entries):
+        error = validate_request(entry) or preflight(entry)
+        if error:
+            errors.append({"index": index, "error": error})
+    if errors:
+        return response(400, {"message": "Validation failed", "errors": errors})
+
+    rejected = check_limits(entries)
+    if rejected:
+        return rejected
+
+    rules = auto_approval_rules(entries)
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(entries))) as pool:
+        outcomes = list(pool.map(try_start_request, entries, rules))
+
+    # Log successful submissions to DynamoDB
+    try:
+        items = [outcome["item"] for outcome in outcomes if outcome.get("item")]
+        unprocessed = batch_put_items(get_client("dynamodb"), TABLE_NAME, items)
+        if unprocessed:
+            print(f"Failed to log {len(unprocessed)} requests to DynamoDB after retries")
+    except Exception as e:
+        print(f"Failed to log batch to DynamoDB: {str(e)}")
+        # Don't fail the request if logging fails
+
+    results = []
+    for index, (outcome, rule) in enumerate(zip(outcomes, rules)):
+        if "error" in outcome:
+            results.append({"index": index, "error": outcome["error"]})
+        else:
+            result = {
+                "index": index,
+                "requestId": outcome["requestId"],
+                "executionArn": outcome["executionArn"]
+            }
+            if rule:
+                result["autoApprovalRule"] = rule
+            results.append(result)
+
+    submitted = sum(1 for r in results if "executionArn" in r)
+    return response(200, {
+        "message": f"Submitted {submitted} of {len(results)}",
+        "results": results
+    })
+
+def validate_request(body):
+    """Return an error message for an invalid request, or None"""
+    if not isinstance(body, dict):
+        return "Request must be a JSON object"
+
+    missing = [field for field in REQUIRED_FIELDS if not body.get(field)]
+    if missing:
+        return f"Missing required fields: {', '.join(missing)}"
+
+    sg_ids = body.get("securityGroupIds")
+    if not isinstance(sg_ids, list) or not sg_ids:
+        return "At least one security group ID is required"
+
+    count = body.get("instanceCount", 1)
+    if not isinstance(count, int) or isinstance(count, bool) or not 1 <= count <= MAX_INSTANCES_PER_REQUEST:
+        return f"instanceCount must be between 1 and {MAX_INSTANCES_PER_REQUEST}"
+    if count > 1 and body.get("privateIpAddress"):
+        return "privateIpAddress can only be set when instanceCount is 1"
+
+    ebs_size = body.get("ebsVolumeSize")
+    if ebs_size is not None and (not isinstance(ebs_size, int) or isinstance(ebs_size, bool) or ebs_size < 1):
+        return "ebsVolumeSize must be a positive integer (GB)"
+
+    ami_id = body.get("amiId")
+    if ami_id and not is_ami_id(ami_id):
+        return f"Invalid AMI ID: {ami_id}"
+
+    if body.get("osAlias") is not None:
+        error = alias_error(body["osAlias"])
+        if error:
+            return error
+
+    for field in ("waitForReady", "waitForStatusOk"):
+        if not isinstance(body.get(field, False), bool):
+            return f"{field} must be true or false"
+
+    for field in ("subnetIds", "fallbackInstanceTypes"):
+        value = body.get(field)
+        if value is not None and not (isinstance(value, list) and all(isinstance(v, str) and v for v in value)):
+            return f"{field} must be a list of strings"
+
+    return None
+
+def check_limits(entries):
+    """
+    Apply each requester's rate limit and quotas to validated requests.
+
+    Returns:
+        A 429 response for the first requester over a limit, or None. Tokens
+        taken for other requesters of a rejected batch are not returned.
+    """
+    by_requester = {}
+    for body in entries:
+        by_requester.setdefault(body["requesterEmail"], []).append(body)
+
+    for email, bodies in by_requester.items():
+        if rate_limit.enabled():
+            if len(bodies) > rate_limit.BURST:
+                return response(429, {
+                    "message": f"At most {rate_limit.BURST} requests per requester per batch"
+                })
+            wait = rate_limit.acquire(email, len(bodies))
+            if wait:
+                retry_after = math.ceil(wait)
+                print(f"Rate limited {email} ({len(bodies)} requests), retry after {retry_after}s")
+                return response(429, {
+                    "message": f"Too many requests from {email}",
+                    "retryAfterSeconds": retry_after
+                }, retry_after=retry_after)
+
+        if quotas.enabled():
+            error = quotas.check(email, bodies)
+            if error:
+                print(error)
+                return response(429, {"message": error})
+
+    return None
+
+def preflight(body):
+    """
+    Validate a request against cached EC2 inventories.
+
+    Catches a bad subnet, security group or instance type before an
+    approver is emailed rather than at launch time.
+    """
+    if not PREFLIGHT_VALIDATION:
+        return None
+
+    started = time.perf_counter()
+    error = inventory.validate_launch(body)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"Pre-flight validation took {elapsed_ms:.2f} ms (cache: {inventory.inventory_cache.stats})")
+    return error
+
+def auto_approval_rules(entries):
+    """Auto-approval rule name (or None) per entry; none without an Express state machine"""
+    if not EXPRESS_STATE_MACHINE_ARN:
+        return [None] * len(entries)
+    started = time.perf_counter()
+    rules = auto_approval.assign(entries)
+    elapsed_us = (time.perf_counter() - started) * 1e6
+    auto = sum(1 for rule in rules if rule)
+    print(f"Auto-approval policy matched {auto} of {len(entries)} requests in {elapsed_us:.0f} us")
+    return rules
+
+def start_request(body, auto_rule=None):
+    """
+    Starts the Step Functions execution for a single request.
+
+    Args:
+        body: Validated request
+        auto_rule: Auto-approval rule name, to start on the Express state machine
+
+    Returns:
+        Tuple of (request_id, start_execution response, DynamoDB audit item).
+        The item is None for an auto-approved request, which is logged here.
+    """
     # Generate unique request ID
     request_id = str(uuid.uuid4())
     timestamp = int(datetime.utcnow().timestamp())
     readable_date = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
-    
+
     # Add requestId to the request
     body["requestId"] = request_id
     body["timestamp"] = timestamp
-    
-    # Start Step Functions execution
-    out = sfn.start_execution(
-        stateMachineArn=ARN,
-        name=f"request-{request_id}",
-        input=json.dumps(body)
-    )
-    
-    # Log request to DynamoDB
+
+    # Fleet fields always present so the state machine can reference them
+    body.setdefault("instanceCount", 1)
+    body["subnetIds"] = body.get("subnetIds") or [body["subnetId"]]
+    body["fallbackInstanceTypes"] = body.get("fallbackInstanceTypes") or []
+    body.setdefault("waitForReady", False)
+    body.setdefault("waitForStatusOk", False)
+    if auto_rule:
+        body["autoApprovalRule"] = auto_rule
+
+    item = {
+        "requestId": request_id,
+        "timestamp": timestamp,
+        "requestDate": readable_date,
+        "requesterEmail": body.get("requesterEmail", "unknown"),
+        "approverEmail": body.get("approverEmail", "unknown"),
+        "instanceName": body.get("instanceName", ""),
+        "instanceType": body.get("instanceType", ""),
+        "instanceCount": body["instanceCount"],
+        "subnetId": body.get("subnetId", ""),
+        "subnetIds": body["subnetIds"],
+        "securityGroupIds": body.get("securityGroupIds", []),
+        "amiId": body.get("amiId"),
+        "ebsVolumeSize": body.get("ebsVolumeSize"),
+        "ebsVolumeType": body.get("ebsVolumeType"),
+        "privateIpAddress": body.get("privateIpAddress"),
+        "status": "PENDING",
+        "statusShard": status_shard("PENDING", request_id),
+        "expirationTime": timestamp + (4 * 3600)  # 4 hours TTL
+    }
+
+    if not auto_rule:
+        out = get_client("stepfunctions").start_execution(
+            stateMachineArn=os.environ["STATE_MACHINE_ARN"],
+            name=f"request-{request_id}",
+            input=json.dumps(body)
+        )
+        item["executionArn"] = out["executionArn"]
+        metrics.stage("submit", request_id, timestamp, workflow="STANDARD")
+        return request_id, out, item
+
+    # An Express execution can reach FinalizeRequest before a batch is
+    # logged, and a later PutItem would overwrite the final status. Write
+    # the row first; FinalizeRequest's UpdateItem then lands on top of it.
+    item["autoApprovalRule"] = auto_rule
+    log_item(item)
     try:
-        table.put_item(
-            Item={
-                "requestId": request_id,
-                "timestamp": timestamp,
-                "requestDate": readable_date,
-                "requesterEmail": body.get("requesterEmail", "unknown"),
-                "approverEmail": body.get("approverEmail", "unknown"),
-                "instanceName": body.get("instanceName", ""),
-                "instanceType": body.get("instanceType", ""),
-                "subnetId": body.get("subnetId", ""),
-                "securityGroupIds": body.get("securityGroupIds", []),
-                "amiId": body.get("amiId"),
-                "ebsVolumeSize": body.get("ebsVolumeSize"),
-                "ebsVolumeType": body.get("ebsVolumeType"),
-                "privateIpAddress": body.get("privateIpAddress"),
-                "status": "PENDING",
-                "executionArn": out["executionArn"],
-                "expirationTime": timestamp + (4 * 3600)  # 4 hours TTL
-            }
+        out = get_client("stepfunctions").start_execution(
+            stateMachineArn=EXPRESS_STATE_MACHINE_ARN,
+            name=f"request-{request_id}",
+            input=json.dumps(body)
+        )
+    except Exception:
+        forget_item(request_id)
+        raise
+
+    try:
+        get_client("dynamodb").update_item(
+            TableName=TABLE_NAME,
+            Key={"requestId": {"S": request_id}},
+            UpdateExpression="SET executionArn = :arn",
+            ExpressionAttributeValues={":arn": {"S": out["executionArn"]}}
         )
+    except Exception as e:
+        print(f"Failed to record execution ARN: {str(e)}")
+
+    print(f"Auto-approved request {request_id} under rule {auto_rule}")
+    metrics.stage("submit", request_id, timestamp, workflow="EXPRESS")
+    metrics.stage("decision", request_id, timestamp, outcome="AUTO_APPROVED", rule=auto_rule)
+    return request_id, out, None
+
+def log_item(item):
+    """Write one audit row; logging failures never fail the request"""
+    try:
+        get_client("dynamodb").put_item(TableName=TABLE_NAME, Item=serialize_item(item))
     except Exception as e:
         print(f"Failed to log to DynamoDB: {str(e)}")
-        # Don't fail the request if logging fails
-    
+
+def forget_item(request_id):
+    """Remove the audit row of a request whose execution never started"""
+    try:
+        get_client("dynamodb").delete_item(TableName=TABLE_NAME, Key={"requestId": {"S": request_id}})
+    except Exception as e:
+        print(f"Failed to remove audit row for {request_id}: {str(e)}")
+
+def try_start_request(body, auto_rule=None):
+    """Starts a single batch entry, capturing failures per entry"""
+    try:
+        request_id, out, item = start_request(body, auto_rule)
+    except Exception as e:
+        print(f"Failed to start execution: {str(e)}")
+        return {"error": str(e)}
+
     return {
-        "statusCode": 200,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "POST, OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type"
-        },
-        "body": json.dumps({
-            "message": "Submitted",
-            "requestId": request_id,
-            "executionArn": out["executionArn"]
-        })
+        "requestId": request_id,
+        "executionArn": out["executionArn"],
+        "item": item
     }
 
+def response(status_code, payload, replayed=False, retry_after=None):
+    """Build an API Gateway JSON response with CORS headers"""
+    headers = {"Content-Type": "application/json", **CORS_HEADERS}
+    if replayed:
+        headers["Idempotent-Replayed"] = "true"
+    if retry_after is not None:
+        headers["Retry-After"] = str(retry_after)
+    return {
+        "statusCode": status_code,
+        "headers": headers,
+        "body": json.dumps(payload)
+    }
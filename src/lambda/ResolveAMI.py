@@ -0,0 +1,84 @@
+"""
+Lambda Function: ResolveAMI
+Purpose: Resolves the AMI to launch from a user-provided ID or an OS alias
+Trigger: Step Functions (first state of the workflow)
+"""
+
+import os
+from ami_aliases import ALIASES, NAME_PREFIX, alias_error, is_ami_id
+from aws_clients import get_client
+from cache import TwoTierCache
+import metrics
+
+DEFAULT_AMI_ALIAS = os.environ.get("DEFAULT_AMI_ALIAS", "al2023-latest")
+AMI_CACHE_TTL_SECONDS = int(os.environ.get("AMI_CACHE_TTL_SECONDS", "3600"))
+
+ami_cache = TwoTierCache("ami", AMI_CACHE_TTL_SECONDS)
+
+@metrics.instrument("ResolveAMI")
+def lambda_handler(event, context):
+    """
+    Resolves the AMI ID for a request.
+
+    Args:
+        event: Contains the request (amiId and/or osAlias)
+        context: Lambda context object
+
+    Returns:
+        amiId, amiSource and the container's cache counters
+
+    Alias Formats (see the ami_aliases layer module):
+        ami-...             Used as is
+        al2023-latest, ...  Name from ALIASES, resolved through SSM
+        /aws/service/...    Any public SSM parameter holding an AMI ID
+        name:<pattern>      Newest self-owned or Amazon image matching the name pattern
+
+    Environment Variables:
+        DEFAULT_AMI_ALIAS: Alias used when the request has none (default: al2023-latest)
+        AMI_CACHE_TTL_SECONDS: How long a resolved alias is cached (default: 3600)
+        CACHE_TABLE: Shared cache table name (default: EC2ApprovalCache)
+    """
+    req = event.get("request", event)
+
+    if req.get("amiId"):
+        return {
+            "amiId": req["amiId"],
+            "amiSource": "user-provided",
+            "cacheStats": ami_cache.stats
+        }
+
+    alias = req.get("osAlias") or DEFAULT_AMI_ALIAS
+    ami_id = ami_cache.get(alias, resolve_alias)
+    print(f"Resolved {alias} to {ami_id} (cache: {ami_cache.stats})")
+
+    return {
+        "amiId": ami_id,
+        "amiSource": alias,
+        "cacheStats": ami_cache.stats
+    }
+
+def resolve_alias(alias):
+    """Look up an alias with a single SSM or EC2 call; the result is always an AMI ID"""
+    error = alias_error(alias)
+    if error:
+        raise ValueError(error)
+    if alias.startswith("ami-"):
+        return alias
+
+    if alias.startswith(NAME_PREFIX):
+        images = get_client("ec2").describe_images(
+            Owners=["self", "amazon"],
+            Filters=[
+                {"Name": "name", "Values": [alias[len(NAME_PREFIX):]]},
+                {"Name": "state", "Values": ["available"]}
+            ]
+        )["Images"]
+        if not images:
+            raise ValueError(f"No AMI matches {alias}")
+        return max(images, key=lambda image: image["CreationDate"])["ImageId"]
+
+    value = get_client("ssm").get_parameter(Name=ALIASES.get(alias, alias))["Parameter"]["Value"]
+    # Never pass on (or cache) a parameter that is not an AMI ID
+    if not is_ami_id(value):
+        raise ValueError(f"SSM parameter for {alias} does not hold an AMI ID")
+    return value
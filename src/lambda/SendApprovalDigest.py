@@ -0,0 +1,106 @@
+"""
+Lambda Function: SendApprovalDigest
+Purpose: Sends one email per approver listing every buffered approval request
+Trigger: EventBridge schedule (e.g. rate(1 minute)), with SendApprovalEmail in DIGEST_MODE
+"""
+
+import os
+import time
+import urllib.parse
+import approval_digest
+import email_templates
+import metrics
+
+FROM_EMAIL = os.environ["FROM_EMAIL"]
+APPROVAL_BASE_URL = os.environ["APPROVAL_BASE_URL"].rstrip("/")
+DIGEST_WINDOW_SECONDS = int(os.environ.get("DIGEST_WINDOW_SECONDS", "300"))
+# Keeps each digest email a readable length
+DIGEST_MAX_REQUESTS = int(os.environ.get("DIGEST_MAX_REQUESTS", "100"))
+
+@metrics.instrument("SendApprovalDigest")
+def lambda_handler(event, context):
+    """
+    Flushes the digest buffer.
+
+    An approver's digest is sent once their oldest buffered request has waited
+    DIGEST_WINDOW_SECONDS, so requests arriving in a burst share one email.
+    Buffered entries are deleted only after SES accepts the email; anything
+    left over (send failure, more than DIGEST_MAX_REQUESTS) goes out on a
+    later run.
+
+    Args:
+        event: Scheduled event (unused)
+        context: Lambda context object
+
+    Returns:
+        Number of digests sent, requests covered and approvers still waiting
+
+    Environment Variables:
+        FROM_EMAIL: SES verified sender email address
+        APPROVAL_BASE_URL: Base URL for approval API Gateway endpoint
+        DIGEST_WINDOW_SECONDS: How long to collect requests per approver (default: 300)
+        DIGEST_MAX_REQUESTS: Most requests listed in one digest (default: 100)
+        DIGEST_TABLE: Staging table name (default: EC2ApprovalDigest)
+        EMAIL_RENDERING: "local" or "ses" templates (default: local)
+    """
+    now = time.time()
+    due = []
+    waiting = 0
+
+    for approver, entries in approval_digest.pending_by_approver().items():
+        if now - int(entries[0]["timestamp"]) < DIGEST_WINDOW_SECONDS:
+            waiting += 1
+            continue
+        due.append((approver, entries[:DIGEST_MAX_REQUESTS]))
+
+    prepared = []
+    for approver, entries in due:
+        try:
+            prepared.append((approver, entries, digest_data(approver, entries)))
+        except Exception as e:
+            print(f"Failed to prepare digest for {approver}: {str(e)}")
+
+    # One SES call per 50 approvers with EMAIL_RENDERING=ses
+    errors = email_templates.send_bulk(
+        "EC2ApprovalDigest",
+        FROM_EMAIL,
+        [(approver, data) for approver, _, data in prepared]
+    )
+
+    sent = 0
+    requests = 0
+    for (approver, entries, _), error in zip(prepared, errors):
+        if error:
+            print(f"Failed to send digest to {approver}: {error}")
+            continue
+
+        sent += 1
+        requests += len(entries)
+        for entry in entries:
+            metrics.stage("emailSent", entry["requestId"], entry["summary"].get("submittedAt"), digest=True)
+        try:
+            unprocessed = approval_digest.remove(entries)
+            if unprocessed:
+                print(f"Failed to clear {len(unprocessed)} sent entries for {approver} after retries")
+        except Exception as e:
+            print(f"Failed to clear sent entries for {approver}: {str(e)}")
+
+    print(f"Sent {sent} digests covering {requests} requests; {waiting} approvers still collecting")
+    return {"digestsSent": sent, "requests": requests, "approversWaiting": waiting}
+
+def digest_data(approver, entries):
+    """Template data for one approver's digest, with per-request and approve-all links"""
+    digest_id = approval_digest.save_digest(approver, [entry["tokenId"] for entry in entries])
+    approver_q = urllib.parse.quote(approver, safe="")
+
+    return {
+        "count": len(entries),
+        "approveAllUrl": f"{APPROVAL_BASE_URL}/approval?action=approve-all&digest={digest_id}&approver={approver_q}",
+        "requests": [{
+            "n": n,
+            **entry["summary"],
+            "requestId": entry["requestId"],
+            "approveUrl": f"{APPROVAL_BASE_URL}/approval?action=approve&token={entry['tokenId']}",
+            "rejectUrl": f"{APPROVAL_BASE_URL}/approval?action=reject&token={entry['tokenId']}"
+        } for n, entry in enumerate(entries, 1)]
+    }
@@ -5,13 +5,16 @@ Trigger: Step Functions (waitForTaskToken)
 """
 
 import os
-import boto3
-import urllib.parse
+import approval_tokens
+import email_templates
+import metrics
 
-ses = boto3.client("ses")
 FROM_EMAIL = os.environ["FROM_EMAIL"]
 APPROVAL_BASE_URL = os.environ["APPROVAL_BASE_URL"].rstrip("/")
+# Buffer approvals for SendApprovalDigest instead of emailing each one
+DIGEST_MODE = os.environ.get("DIGEST_MODE", "false").lower() == "true"
 
+@metrics.instrument("SendApprovalEmail")
 def lambda_handler(event, context):
     """
     Sends approval email to approver with EC2 request details and action links.
@@ -21,64 +24,68 @@ def lambda_handler(event, context):
         context: Lambda context object
         
     Returns:
-        Status indicating email was sent
+        Status indicating email was sent (or queued for the approver's digest)
         
     Environment Variables:
         FROM_EMAIL: SES verified sender email address
         APPROVAL_BASE_URL: Base URL for approval API Gateway endpoint
+        DIGEST_MODE: "true" to queue the request for a digest email (default: false)
+        APPROVAL_TOKEN_TABLE: Table mapping short IDs to task tokens (default: EC2ApprovalTokens)
+        EMAIL_RENDERING: "local" or "ses" templates (default: local)
     """
     task_token = event["taskToken"]
     req = event["request"]
+    approver = req.get("approverEmail", FROM_EMAIL)
     
-    # Build approval/reject URLs with task token
-    token_q = urllib.parse.quote(task_token, safe="")
-    approve_url = f"{APPROVAL_BASE_URL}/approval?action=approve&token={token_q}"
-    reject_url  = f"{APPROVAL_BASE_URL}/approval?action=reject&token={token_q}"
+    # Links carry a short ID; the task token itself stays in DynamoDB
+    token_id = approval_tokens.issue(task_token, req["requestId"], approver, req.get("timestamp"))
     
-    # Get resolved AMI info
-    resolved_ami = req.get("resolvedAmi", {})
-    ami_id = resolved_ami.get("amiId", req.get("amiId", "N/A"))
-    ami_source = resolved_ami.get("amiSource", "user-provided")
+    if DIGEST_MODE:
+        import approval_digest
+        
+        approval_digest.buffer(
+            approver,
+            req["requestId"],
+            token_id,
+            digest_summary(req)
+        )
+        return {"status": "QUEUED_FOR_DIGEST"}
     
-    subject = f"[Approval Required] EC2 launch: {req.get('instanceName','demo')} ({req['instanceType']})"
+    # Build approval/reject URLs with the short token ID
+    approve_url = f"{APPROVAL_BASE_URL}/approval?action=approve&token={token_id}"
+    reject_url  = f"{APPROVAL_BASE_URL}/approval?action=reject&token={token_id}"
     
-    body = f"""Hi,
-
-An EC2 launch request is pending your approval.
-
-=== Request Details ===
-Requester: {req.get('requesterEmail', 'N/A')}
-Instance Name: {req.get('instanceName', 'N/A')}
-Instance Type: {req['instanceType']}
-
-=== Network Configuration ===
-Subnet ID: {req['subnetId']}
-Private IP: {req.get('privateIpAddress') or 'Auto-assigned'}
-Security Groups: {req['securityGroupIds']}
-
-=== Storage Configuration ===
-EBS Volume Size: {req.get('ebsVolumeSize') or 'AMI default'} GB
-EBS Volume Type: {req.get('ebsVolumeType') or 'AMI default'}
-
-=== AMI ===
-AMI ID: {ami_id}
-Source: {ami_source}
-
-=== Actions ===
-Approve: {approve_url}
-Reject:  {reject_url}
-
-This request will expire in 4 hours.
-"""
+    # Get resolved AMI info
+    resolved_ami = req.get("resolvedAmi", {})
     
-    # Send email via SES
-    ses.send_email(
-        Source=FROM_EMAIL,
-        Destination={"ToAddresses": [req.get("approverEmail", FROM_EMAIL)]},
-        Message={
-            "Subject": {"Data": subject}, 
-            "Body": {"Text": {"Data": body}}
-        }
-    )
+    email_templates.send("EC2ApprovalRequest", FROM_EMAIL, approver, {
+        "requesterEmail": req.get("requesterEmail", "N/A"),
+        "instanceName": req.get("instanceName", "demo"),
+        "instanceType": req["instanceType"],
+        "instanceCount": req.get("instanceCount", 1),
+        "subnetId": ", ".join(req.get("subnetIds") or [req["subnetId"]]),
+        "privateIp": req.get("privateIpAddress") or "Auto-assigned",
+        "securityGroups": ", ".join(req["securityGroupIds"]),
+        "ebsVolumeSize": f"{req['ebsVolumeSize']} GB" if req.get("ebsVolumeSize") else "AMI default",
+        "ebsVolumeType": req.get("ebsVolumeType") or "AMI default",
+        "amiId": resolved_ami.get("amiId", req.get("amiId", "N/A")),
+        "amiSource": resolved_ami.get("amiSource", "user-provided"),
+        "approveUrl": approve_url,
+        "rejectUrl": reject_url
+    })
+    metrics.stage("emailSent", req["requestId"], req.get("timestamp"))
     
     return {"status": "EMAIL_SENT"}
+
+def digest_summary(req):
+    """The request fields listed for it in a digest email"""
+    resolved_ami = req.get("resolvedAmi", {})
+    return {
+        "requesterEmail": req.get("requesterEmail", "N/A"),
+        "instanceName": req.get("instanceName", "N/A"),
+        "instanceType": req["instanceType"],
+        "instanceCount": req.get("instanceCount", 1),
+        "subnetId": req["subnetId"],
+        "amiId": resolved_ami.get("amiId", req.get("amiId") or "N/A"),
+        "submittedAt": req.get("timestamp")
+    }
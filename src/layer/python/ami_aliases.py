@@ -0,0 +1,47 @@
+"""
+OS aliases a request may give instead of an AMI ID.
+
+RequestStarter checks a request's osAlias with alias_error() before anything
+is started, and ResolveAMI resolves it, so both read the same rules:
+    ami-...             Used as is
+    al2023-latest, ...  Name from ALIASES, resolved through SSM
+    /aws/service/...    Any public SSM parameter maintained by AWS
+    name:<pattern>      Newest self-owned or Amazon image matching the name pattern
+
+Whatever an alias resolves to must look like an AMI ID, so a parameter that
+holds anything else is never launched, emailed or cached.
+"""
+
+import re
+
+# Friendly aliases for public SSM parameters maintained by AWS
+ALIASES = {
+    "al2023-latest": "/aws/service/ami-amazon-linux-latest/al2023-ami-kernel-default-x86_64",
+    "al2023-arm64-latest": "/aws/service/ami-amazon-linux-latest/al2023-ami-kernel-default-arm64",
+    "al2-latest": "/aws/service/ami-amazon-linux-latest/amzn2-ami-hvm-x86_64-gp2",
+    "windows-2022-latest": "/aws/service/ami-windows-latest/Windows_Server-2022-English-Full-Base"
+}
+
+# The only SSM parameters an alias may name directly
+SSM_PREFIX = "/aws/service/"
+
+NAME_PREFIX = "name:"
+
+AMI_ID = re.compile(r"ami-(?:[0-9a-f]{8}|[0-9a-f]{17})")
+
+def is_ami_id(value):
+    """True if value is shaped like an AMI ID"""
+    return isinstance(value, str) and AMI_ID.fullmatch(value) is not None
+
+def alias_error(alias):
+    """Return an error message for an alias ResolveAMI would not accept, or None"""
+    if not isinstance(alias, str) or not alias:
+        return "osAlias must be a non-empty string"
+    if alias.startswith("ami-"):
+        return None if is_ami_id(alias) else f"Invalid AMI ID: {alias}"
+    if alias in ALIASES or alias.startswith(SSM_PREFIX):
+        return None
+    if alias.startswith(NAME_PREFIX) and len(alias) > len(NAME_PREFIX):
+        return None
+    return (f"Unknown osAlias {alias}: use an AMI ID, one of {', '.join(sorted(ALIASES))}, "
+            f"an SSM parameter under {SSM_PREFIX} or name:<pattern>")
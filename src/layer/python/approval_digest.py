@@ -0,0 +1,134 @@
+"""
+Staging table for approval digests.
+
+In digest mode SendApprovalEmail does not email the approver. It buffers the
+request and its short approval ID under the approver's address, and the scheduled
+SendApprovalDigest function later sends one email per approver listing every
+buffered request. Each digest also gets an "approve all" record holding the
+short approval IDs (see approval_tokens) it covers; ApprovalHandler consumes
+that record exactly once.
+
+Item layout (partition key approverEmail, sort key entryId):
+    pending#<timestamp>#<requestId>  one buffered request (tokenId, summary)
+    digest#<digestId>                approval IDs covered by a sent digest
+
+Environment Variables:
+    DIGEST_TABLE: Staging table name (default: EC2ApprovalDigest)
+    DIGEST_TTL_SECONDS: Lifetime of staged items (default: 14400, the approval timeout)
+"""
+
+import os
+import time
+import uuid
+
+from aws_clients import get_client
+from dynamodb_items import BATCH_SIZE, deserialize_item, serialize_item
+
+TABLE_NAME = os.environ.get("DIGEST_TABLE", "EC2ApprovalDigest")
+TTL_SECONDS = int(os.environ.get("DIGEST_TTL_SECONDS", "14400"))
+
+PENDING = "pending#"
+DIGEST = "digest#"
+
+def buffer(approver_email, request_id, token_id, summary):
+    """Stage one request (and its short link ID) for the approver's next digest"""
+    now = int(time.time())
+    get_client("dynamodb").put_item(
+        TableName=TABLE_NAME,
+        Item=serialize_item({
+            "approverEmail": approver_email,
+            "entryId": f"{PENDING}{now:010d}#{request_id}",
+            "requestId": request_id,
+            "timestamp": now,
+            "tokenId": token_id,
+            "summary": summary,
+            "expiresAt": now + TTL_SECONDS
+        })
+    )
+
+def pending_by_approver():
+    """
+    Return {approverEmail: [entries oldest first]} for every buffered request.
+
+    The table only ever holds unsent requests and live digests, so one
+    filtered scan covers all approvers.
+    """
+    client = get_client("dynamodb")
+    groups = {}
+    for page in client.get_paginator("scan").paginate(
+        TableName=TABLE_NAME,
+        FilterExpression="begins_with(entryId, :pending)",
+        ExpressionAttributeValues={":pending": {"S": PENDING}}
+    ):
+        for item in page["Items"]:
+            entry = deserialize_item(item)
+            groups.setdefault(entry["approverEmail"], []).append(entry)
+    for entries in groups.values():
+        entries.sort(key=lambda entry: entry["entryId"])
+    return groups
+
+def save_digest(approver_email, token_ids):
+    """Store the approval IDs behind an "approve all" link and return its ID"""
+    digest_id = uuid.uuid4().hex
+    get_client("dynamodb").put_item(
+        TableName=TABLE_NAME,
+        Item=serialize_item({
+            "approverEmail": approver_email,
+            "entryId": f"{DIGEST}{digest_id}",
+            "tokenIds": token_ids,
+            "expiresAt": int(time.time()) + TTL_SECONDS
+        })
+    )
+    return digest_id
+
+def take_digest(approver_email, digest_id):
+    """
+    Delete a digest record and return its approval IDs.
+
+    The delete returns the old item, so a second click on the same link
+    finds nothing and gets an empty list.
+    """
+    item = get_client("dynamodb").delete_item(
+        TableName=TABLE_NAME,
+        Key={
+            "approverEmail": {"S": approver_email},
+            "entryId": {"S": f"{DIGEST}{digest_id}"}
+        },
+        ReturnValues="ALL_OLD"
+    ).get("Attributes")
+    if not item or int(item["expiresAt"]["N"]) < time.time():
+        return []
+    return deserialize_item(item)["tokenIds"]
+
+def remove(entries, max_retries=5):
+    """
+    Delete buffered entries once their digest has been sent.
+
+    Unprocessed deletes are retried with exponential backoff, like
+    dynamodb_items.batch_put_items.
+
+    Returns:
+        List of entries that were still unprocessed after all retries
+    """
+    client = get_client("dynamodb")
+    failed = []
+    for start in range(0, len(entries), BATCH_SIZE):
+        chunk = entries[start:start + BATCH_SIZE]
+        requests = [{
+            "DeleteRequest": {
+                "Key": {
+                    "approverEmail": {"S": entry["approverEmail"]},
+                    "entryId": {"S": entry["entryId"]}
+                }
+            }
+        } for entry in chunk]
+        for attempt in range(max_retries + 1):
+            response = client.batch_write_item(RequestItems={TABLE_NAME: requests})
+            requests = response.get("UnprocessedItems", {}).get(TABLE_NAME, [])
+            if not requests:
+                break
+            if attempt < max_retries:
+                time.sleep(0.05 * (2 ** attempt))
+        left = {r["DeleteRequest"]["Key"]["entryId"]["S"] for r in requests}
+        failed.extend(entry for entry in chunk if entry["entryId"] in left)
+    return failed
@@ -0,0 +1,152 @@
+"""
+Short, opaque approval link tokens.
+
+Step Functions task tokens can be over 1 KB, which bloats approval emails
+and breaks some mail clients' link handling. SendApprovalEmail stores the
+task token under a short random ID instead, and links carry only that ID.
+ApprovalHandler resolves it with one GetItem; warm containers keep resolved
+records in an in-process LRU, and a used ID is remembered there too, so a
+double click costs no AWS call at all.
+
+An ID is single use: ApprovalHandler claims it with a conditional write
+(attribute_not_exists(usedAt)) before calling Step Functions, so of two
+concurrent clicks, in one container or two, only one sends a decision.
+
+Items expire with the approval state's 4-hour timeout.
+
+Environment Variables:
+    APPROVAL_TOKEN_TABLE: Table name (default: EC2ApprovalTokens)
+    APPROVAL_TOKEN_TTL_SECONDS: Lifetime of an ID (default: 14400)
+    APPROVAL_TOKEN_CACHE_SIZE: Records kept in the in-process LRU (default: 1024)
+"""
+
+import os
+import secrets
+import time
+from collections import OrderedDict
+
+from aws_clients import get_client
+
+TABLE_NAME = os.environ.get("APPROVAL_TOKEN_TABLE", "EC2ApprovalTokens")
+TTL_SECONDS = int(os.environ.get("APPROVAL_TOKEN_TTL_SECONDS", "14400"))
+CACHE_SIZE = int(os.environ.get("APPROVAL_TOKEN_CACHE_SIZE", "1024"))
+
+# IDs are 22 characters; anything much longer is a raw task token from an
+# email sent before short IDs were introduced
+MAX_ID_LENGTH = 64
+
+# tokenId -> record
+_cache = OrderedDict()
+
+def is_short(token):
+    """True if token is a short ID rather than a raw task token"""
+    return len(token) <= MAX_ID_LENGTH
+
+def issue(task_token, request_id, approver_email, submitted_at=None):
+    """Store a task token and return the short ID to put in links"""
+    token_id = secrets.token_urlsafe(16)
+    item = {
+        "tokenId": {"S": token_id},
+        "taskToken": {"S": task_token},
+        "requestId": {"S": request_id},
+        "approverEmail": {"S": approver_email},
+        "expiresAt": {"N": str(int(time.time()) + TTL_SECONDS)}
+    }
+    # Lets ApprovalHandler time the decision from submission
+    if submitted_at is not None:
+        item["submittedAt"] = {"N": str(submitted_at)}
+    get_client("dynamodb").put_item(TableName=TABLE_NAME, Item=item)
+    return token_id
+
+def resolve(token_id):
+    """
+    Look up a short ID.
+
+    Returns:
+        {"taskToken", "requestId", "approverEmail", "expiresAt", "usedAt",
+        "submittedAt"}, or None if the ID is unknown or expired
+    """
+    record = _cache.get(token_id)
+    if record is None:
+        item = get_client("dynamodb").get_item(
+            TableName=TABLE_NAME,
+            Key={"tokenId": {"S": token_id}},
+            ConsistentRead=True
+        ).get("Item")
+        if not item:
+            return None
+        record = {
+            "taskToken": item["taskToken"]["S"],
+            "requestId": item["requestId"]["S"],
+            "approverEmail": item["approverEmail"]["S"],
+            "expiresAt": int(item["expiresAt"]["N"]),
+            "usedAt": int(item["usedAt"]["N"]) if "usedAt" in item else None,
+            "submittedAt": int(item["submittedAt"]["N"]) if "submittedAt" in item else None
+        }
+        _remember(token_id, record)
+    else:
+        _cache.move_to_end(token_id)
+
+    # TTL deletion lags, so check expiry ourselves
+    if record["expiresAt"] < time.time():
+        return None
+    return record
+
+def claim(token_id):
+    """
+    Take an ID for one decision before acting on it.
+
+    Returns:
+        True if this caller won the ID, False if it was already used
+    """
+    now = int(time.time())
+    client = get_client("dynamodb")
+    try:
+        client.update_item(
+            TableName=TABLE_NAME,
+            Key={"tokenId": {"S": token_id}},
+            UpdateExpression="SET usedAt = :now",
+            ConditionExpression="attribute_exists(tokenId) AND attribute_not_exists(usedAt)",
+            ExpressionAttributeValues={":now": {"N": str(now)}}
+        )
+    except client.exceptions.ConditionalCheckFailedException:
+        won = False
+    else:
+        won = True
+    record = _cache.get(token_id)
+    if record is not None:
+        record["usedAt"] = record["usedAt"] or now
+    return won
+
+def complete(token_id, outcome):
+    """Record the outcome of a claimed ID"""
+    try:
+        get_client("dynamodb").update_item(
+            TableName=TABLE_NAME,
+            Key={"tokenId": {"S": token_id}},
+            UpdateExpression="SET outcome = :outcome",
+            ExpressionAttributeValues={":outcome": {"S": outcome}}
+        )
+    except Exception as e:
+        # The claim already keeps later clicks out
+        print(f"Failed to record approval token outcome: {str(e)}")
+
+def release(token_id):
+    """Give up a claim after a failed decision so the link can be used again"""
+    record = _cache.get(token_id)
+    if record is not None:
+        record["usedAt"] = None
+    try:
+        get_client("dynamodb").update_item(
+            TableName=TABLE_NAME,
+            Key={"tokenId": {"S": token_id}},
+            UpdateExpression="REMOVE usedAt"
+        )
+    except Exception as e:
+        print(f"Failed to release approval token: {str(e)}")
+
+def _remember(token_id, record):
+    _cache[token_id] = record
+    _cache.move_to_end(token_id)
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
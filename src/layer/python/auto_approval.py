@@ -0,0 +1,142 @@
+"""
+Auto-approval policy for low-risk requests.
+
+RequestStarter routes a request that matches a rule to the Express state
+machine, which launches straight away instead of emailing an approver and
+waiting on the task token. Rules are read from AUTO_APPROVAL_POLICY and
+compiled once per container (instance type patterns into one regex, domains
+into a frozenset), so matching a request is a handful of dict lookups.
+
+Policy format (a JSON list, first matching rule wins):
+    [{
+        "name": "small-dev",
+        "instanceTypes": ["t3.micro", "t3.small", "t4g.*"],
+        "maxEbsVolumeSize": 30,
+        "requesterDomains": ["example.com"],
+        "maxInstances": 1,
+        "maxPerRequester": 5
+    }]
+
+Every field but name is optional; a missing field does not restrict. A
+rule never matches a request with waitForReady, since an Express execution
+cannot outlive the 15-minute readiness wait. maxPerRequester counts the
+requester's auto-approved requests over the quota window, rounded out to
+whole UTC hours, from the autoApproved#<email>#<hour> counter items that
+AggregateStats keeps (see request_stats). Those outlive the requests'
+4-hour TTL, so a daily window really counts a day. If the count cannot be
+read the request takes the normal approval path.
+
+Environment Variables:
+    AUTO_APPROVAL_POLICY: JSON list of rules (default: none, auto-approval off)
+    AUTO_APPROVAL_QUOTA_WINDOW_SECONDS: Window for maxPerRequester (default: 86400)
+    STATS_TABLE: Counter table name (default: EC2ApprovalStats)
+"""
+
+import fnmatch
+import json
+import os
+import re
+import time
+from datetime import datetime, timezone
+
+import request_stats
+
+QUOTA_WINDOW_SECONDS = int(os.environ.get("AUTO_APPROVAL_QUOTA_WINDOW_SECONDS", "86400"))
+
+def compile_policy(rules):
+    """Turn the JSON policy into rule dicts ready for matches()"""
+    compiled = []
+    for rule in rules:
+        types = rule.get("instanceTypes")
+        domains = rule.get("requesterDomains")
+        compiled.append({
+            "name": rule["name"],
+            "types": re.compile("|".join(fnmatch.translate(t) for t in types)) if types else None,
+            "maxEbs": rule.get("maxEbsVolumeSize"),
+            "domains": frozenset(d.lower() for d in domains) if domains else None,
+            "maxInstances": rule.get("maxInstances"),
+            "quota": rule.get("maxPerRequester")
+        })
+    return compiled
+
+def _load_policy():
+    try:
+        return compile_policy(json.loads(os.environ.get("AUTO_APPROVAL_POLICY") or "[]"))
+    except Exception as e:
+        # A broken policy must not approve anything
+        print(f"Invalid AUTO_APPROVAL_POLICY, auto-approval disabled: {str(e)}")
+        return []
+
+RULES = _load_policy()
+
+def matches(rule, body):
+    """True if a validated request satisfies a rule's static conditions"""
+    if body.get("waitForReady"):
+        return False
+    if rule["types"] is not None:
+        for instance_type in [body["instanceType"], *(body.get("fallbackInstanceTypes") or ())]:
+            if not rule["types"].match(instance_type):
+                return False
+    if rule["maxEbs"] is not None:
+        try:
+            if int(body.get("ebsVolumeSize") or 0) > rule["maxEbs"]:
+                return False
+        except (TypeError, ValueError):
+            return False
+    if rule["maxInstances"] is not None and body.get("instanceCount", 1) > rule["maxInstances"]:
+        return False
+    if rule["domains"] is not None:
+        if body["requesterEmail"].rpartition("@")[2].lower() not in rule["domains"]:
+            return False
+    return True
+
+def match(body):
+    """Return the first rule a request satisfies (ignoring quotas), or None"""
+    for rule in RULES:
+        if matches(rule, body):
+            return rule
+    return None
+
+def quota_used(requester_email):
+    """
+    Count the requester's auto-approved requests in the quota window.
+
+    Returns None if the count could not be read.
+    """
+    now = int(time.time())
+    first = (now - QUOTA_WINDOW_SECONDS) // 3600
+    hours = [datetime.fromtimestamp(hour * 3600, timezone.utc).strftime("%Y-%m-%dT%H")
+             for hour in range(first, now // 3600 + 1)]
+    try:
+        counters = request_stats.get_counters([request_stats.auto_approved_key(requester_email, hour)
+                                               for hour in hours])
+    except Exception as e:
+        print(f"Failed to read auto-approval quota for {requester_email}: {str(e)}")
+        return None
+    return sum(item.get("requests", 0) for item in counters.values())
+
+def assign(entries):
+    """
+    Pick the auto-approval rule for each request.
+
+    Entries are evaluated in order, and earlier entries of the same batch
+    count against a requester's quota. The counters are read at most once
+    per requester, and only for requests that already match a rule with a quota.
+
+    Returns:
+        One rule name or None per entry
+    """
+    used = {}
+    names = []
+    for body in entries:
+        rule = match(body)
+        if rule is not None and rule["quota"] is not None:
+            email = body["requesterEmail"]
+            if email not in used:
+                used[email] = quota_used(email)
+            if used[email] is None or used[email] >= rule["quota"]:
+                rule = None
+        if rule is not None and used.get(body["requesterEmail"]) is not None:
+            used[body["requesterEmail"]] += 1
+        names.append(rule["name"] if rule is not None else None)
+    return names
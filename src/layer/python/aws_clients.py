@@ -0,0 +1,65 @@
+"""
+Shared AWS client factory for the Lambda functions (deployed as a Lambda layer).
+
+Clients are created on first use and cached for the life of the container,
+so a warm invocation reuses the same connection pool and an invocation that
+never touches a service never pays to build its client. boto3 itself is only
+imported when the first client is requested.
+
+Environment Variables:
+    AWS_CLIENT_MAX_POOL: Max pooled connections per client (default: 25)
+    AWS_CLIENT_CONNECT_TIMEOUT: Connect timeout in seconds (default: 2)
+    AWS_CLIENT_READ_TIMEOUT: Read timeout in seconds (default: 10)
+    AWS_CLIENT_MAX_ATTEMPTS: Total attempts including retries (default: 5)
+    AWS_CLIENT_RETRY_MODE: standard or adaptive (default: adaptive)
+"""
+
+import os
+import threading
+
+_clients = {}
+_lock = threading.Lock()
+_session = None
+
+def _config():
+    """Build the botocore Config shared by every client"""
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=int(os.environ.get("AWS_CLIENT_MAX_POOL", "25")),
+        connect_timeout=float(os.environ.get("AWS_CLIENT_CONNECT_TIMEOUT", "2")),
+        read_timeout=float(os.environ.get("AWS_CLIENT_READ_TIMEOUT", "10")),
+        retries={
+            "max_attempts": int(os.environ.get("AWS_CLIENT_MAX_ATTEMPTS", "5")),
+            "mode": os.environ.get("AWS_CLIENT_RETRY_MODE", "adaptive")
+        },
+        tcp_keepalive=True
+    )
+
+def _get_session():
+    # Callers hold _lock; boto3 sessions are not safe to create concurrently
+    global _session
+    if _session is None:
+        import boto3
+
+        _session = boto3.session.Session()
+    return _session
+
+def get_client(service_name):
+    """
+    Return the cached low-level client for a service.
+
+    Args:
+        service_name: boto3 service name, e.g. "stepfunctions", "ses", "ec2", "dynamodb"
+
+    Returns:
+        A botocore client, safe to share across threads
+    """
+    client = _clients.get(service_name)
+    if client is None:
+        with _lock:
+            client = _clients.get(service_name)
+            if client is None:
+                client = _get_session().client(service_name, config=_config())
+                _clients[service_name] = client
+    return client
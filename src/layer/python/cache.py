@@ -0,0 +1,146 @@
+"""
+Two-tier TTL cache: an in-memory dict in the warm container, backed by a
+shared DynamoDB table so every container benefits from a single lookup.
+
+Values must be JSON-serializable. The DynamoDB tier is best effort: if the
+table is unavailable the cache falls back to calling the loader.
+
+Misses are single-flight per container: while one thread loads a key, other
+threads asking for it wait for that result instead of calling the loader too.
+
+Environment Variables:
+    CACHE_TABLE: Shared cache table name (default: EC2ApprovalCache)
+"""
+
+import json
+import os
+import threading
+import time
+
+from aws_clients import get_client
+
+CACHE_TABLE = os.environ.get("CACHE_TABLE", "EC2ApprovalCache")
+
+class TwoTierCache:
+    """
+    Cache values under "<namespace>#<key>" for ttl_seconds.
+
+    Hit and miss counters are kept per container in `stats`:
+        memoryHits: served from the container's memory
+        tableHits: served from the DynamoDB cache table
+        misses: the loader had to be called
+        refreshes: refresh() called the loader
+    """
+
+    def __init__(self, namespace, ttl_seconds, table_name=CACHE_TABLE):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.table_name = table_name
+        self.stats = {"memoryHits": 0, "tableHits": 0, "misses": 0, "refreshes": 0}
+        self._memory = {}
+        self._lock = threading.Lock()
+        # key -> lock held while the key is being loaded
+        self._loading = {}
+
+    def get(self, key, loader):
+        """Return the cached value for key, calling loader(key) on a miss"""
+        entry = self._memory.get(key)
+        if entry and entry[0] > time.time():
+            self._count("memoryHits")
+            return entry[1]
+
+        with self._key_lock(key):
+            # Another thread may have loaded it while this one waited
+            now = time.time()
+            entry = self._memory.get(key)
+            if entry and entry[0] > now:
+                self._count("memoryHits")
+                return entry[1]
+
+            if self.table_name:
+                stored = self._read(f"{self.namespace}#{key}", now)
+                if stored is not None:
+                    self._count("tableHits")
+                    self._memory[key] = stored
+                    return stored[1]
+
+            self._count("misses")
+            return self._load(key, loader)
+
+    def refresh(self, key, loader, min_age=0):
+        """
+        Reload key with loader(key), bypassing both tiers, and store the result.
+
+        A value loaded less than min_age seconds ago is returned as is, so a
+        burst of callers that all find it stale cause one reload, not one
+        each. The load time of a value is its expiresAt less ttl_seconds;
+        this container's memory is checked first, then the DynamoDB tier,
+        so values another container just reloaded are reused too.
+        """
+        with self._key_lock(key):
+            now = time.time()
+            entry = self._memory.get(key)
+            if entry and self._fresh(entry, now, min_age):
+                return entry[1]
+            if self.table_name and min_age:
+                stored = self._read(f"{self.namespace}#{key}", now)
+                if stored is not None and self._fresh(stored, now, min_age):
+                    self._count("tableHits")
+                    self._memory[key] = stored
+                    return stored[1]
+            self._count("refreshes")
+            return self._load(key, loader)
+
+    def invalidate(self, key):
+        """Drop a key from this container's memory tier"""
+        self._memory.pop(key, None)
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._loading.setdefault(key, threading.Lock())
+
+    def _fresh(self, entry, now, min_age):
+        """Whether an (expires_at, value) entry was loaded less than min_age seconds ago"""
+        return entry[0] > now and now - (entry[0] - self.ttl_seconds) < min_age
+
+    def _load(self, key, loader):
+        value = loader(key)
+        expires_at = int(time.time()) + self.ttl_seconds
+        self._memory[key] = (expires_at, value)
+        if self.table_name:
+            self._write(f"{self.namespace}#{key}", value, expires_at)
+        return value
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _read(self, cache_key, now):
+        try:
+            item = get_client("dynamodb").get_item(
+                TableName=self.table_name,
+                Key={"cacheKey": {"S": cache_key}}
+            ).get("Item")
+        except Exception as e:
+            print(f"Cache read failed for {cache_key}: {str(e)}")
+            return None
+        if not item:
+            return None
+        # TTL deletion lags, so check expiry ourselves
+        expires_at = int(item["expiresAt"]["N"])
+        if expires_at <= now:
+            return None
+        return expires_at, json.loads(item["value"]["S"])
+
+    def _write(self, cache_key, value, expires_at):
+        try:
+            get_client("dynamodb").put_item(
+                TableName=self.table_name,
+                Item={
+                    "cacheKey": {"S": cache_key},
+                    "value": {"S": json.dumps(value)},
+                    "expiresAt": {"N": str(expires_at)}
+                }
+            )
+        except Exception as e:
+            print(f"Cache write failed for {cache_key}: {str(e)}")
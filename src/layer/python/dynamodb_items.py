@@ -0,0 +1,106 @@
+"""
+Plain-Python <-> DynamoDB attribute value conversion for the low-level client.
+
+The boto3 resource layer loads its resource model and a generic type
+serializer on first use, which is a noticeable share of a cold start.
+Handlers here only ever write a few known shapes, so a direct type-dispatch
+table is enough: it is built once at import and costs one dict lookup per
+value.
+"""
+
+import time
+from decimal import Decimal
+
+# Max items per BatchWriteItem call
+BATCH_SIZE = 25
+
+# TTL deletions are stream REMOVE records made by the DynamoDB service itself
+TTL_PRINCIPAL = "dynamodb.amazonaws.com"
+
+def _number(value):
+    return {"N": str(value)}
+
+def _list(value):
+    return {"L": [to_attribute(v) for v in value]}
+
+def _map(value):
+    return {"M": {k: to_attribute(v) for k, v in value.items()}}
+
+_SERIALIZERS = {
+    str: lambda value: {"S": value},
+    bool: lambda value: {"BOOL": value},
+    int: _number,
+    float: _number,
+    Decimal: _number,
+    type(None): lambda value: {"NULL": True},
+    list: _list,
+    tuple: _list,
+    dict: _map
+}
+
+def to_attribute(value):
+    """Convert one Python value to a DynamoDB attribute value"""
+    try:
+        return _SERIALIZERS[type(value)](value)
+    except KeyError:
+        raise TypeError(f"Unsupported DynamoDB attribute type: {type(value).__name__}")
+
+def serialize_item(item):
+    """Convert a dict of Python values to a DynamoDB item"""
+    return {key: to_attribute(value) for key, value in item.items()}
+
+def from_attribute(attribute):
+    """Convert one DynamoDB attribute value back to Python"""
+    (kind, value), = attribute.items()
+    if kind == "S" or kind == "BOOL":
+        return value
+    if kind == "N":
+        return Decimal(value)
+    if kind == "NULL":
+        return None
+    if kind == "L":
+        return [from_attribute(v) for v in value]
+    if kind == "M":
+        return deserialize_item(value)
+    if kind == "SS":
+        return set(value)
+    if kind == "NS":
+        return {Decimal(v) for v in value}
+    raise TypeError(f"Unsupported DynamoDB attribute type: {kind}")
+
+def deserialize_item(item):
+    """Convert a DynamoDB item back to a dict of Python values"""
+    return {key: from_attribute(value) for key, value in item.items()}
+
+def is_ttl_delete(record):
+    """Whether a DynamoDB Streams record is a row removed by TTL"""
+    identity = record.get("userIdentity") or {}
+    return (
+        record.get("eventName") == "REMOVE"
+        and identity.get("type") == "Service"
+        and identity.get("principalId") == TTL_PRINCIPAL
+        and "OldImage" in record.get("dynamodb", {})
+    )
+
+def batch_put_items(client, table_name, items, max_retries=5):
+    """
+    Write items with BatchWriteItem in chunks of 25.
+
+    Unprocessed items are retried with exponential backoff.
+
+    Returns:
+        List of items (serialized) that were still unprocessed after all retries
+    """
+    failed = []
+    for start in range(0, len(items), BATCH_SIZE):
+        requests = [{"PutRequest": {"Item": serialize_item(item)}}
+                    for item in items[start:start + BATCH_SIZE]]
+        for attempt in range(max_retries + 1):
+            response = client.batch_write_item(RequestItems={table_name: requests})
+            requests = response.get("UnprocessedItems", {}).get(table_name, [])
+            if not requests:
+                break
+            if attempt < max_retries:
+                time.sleep(0.05 * (2 ** attempt))
+        failed.extend(r["PutRequest"]["Item"] for r in requests)
+    return failed
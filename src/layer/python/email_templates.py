@@ -0,0 +1,374 @@
+"""
+Email templates shared by the notification functions, rendered locally or by SES.
+
+Each template has a subject, a text part and an HTML part written in the
+subset of Handlebars that SES templates support:
+
+    {{name}}                      HTML-escaped value (dotted paths allowed)
+    {{{name}}}                    Raw value
+    {{#if name}} ... {{else}} ... {{/if}}
+    {{#each list}} ... {{/each}}  Fields of each item are in scope inside the block
+
+Templates are compiled once per container into nested render functions, so
+an invocation only walks its data. With EMAIL_RENDERING=ses the same sources,
+published by scripts/publish_email_templates.py, are rendered by SES instead:
+a send carries only the template name and its data, and fan-out sends go
+through send_bulk_templated_email, up to 50 recipients per call.
+
+Environment Variables:
+    EMAIL_RENDERING: "local" (send_email with rendered parts) or "ses"
+        (SES templated sends) (default: local)
+"""
+
+import html
+import json
+import os
+import re
+
+from aws_clients import get_client
+
+RENDERING = os.environ.get("EMAIL_RENDERING", "local").lower()
+
+# Most destinations per SendBulkTemplatedEmail call
+BULK_BATCH_SIZE = 50
+
+TEMPLATES = {
+    "EC2ApprovalRequest": {
+        "subject": "[Approval Required] EC2 launch: {{{instanceName}}} ({{{instanceType}}})",
+        "text": """Hi,
+
+An EC2 launch request is pending your approval.
+
+=== Request Details ===
+Requester: {{{requesterEmail}}}
+Instance Name: {{{instanceName}}}
+Instance Type: {{{instanceType}}}
+Instance Count: {{{instanceCount}}}
+
+=== Network Configuration ===
+Subnet ID: {{{subnetId}}}
+Private IP: {{{privateIp}}}
+Security Groups: {{{securityGroups}}}
+
+=== Storage Configuration ===
+EBS Volume Size: {{{ebsVolumeSize}}}
+EBS Volume Type: {{{ebsVolumeType}}}
+
+=== AMI ===
+AMI ID: {{{amiId}}}
+Source: {{{amiSource}}}
+
+=== Actions ===
+Approve: {{{approveUrl}}}
+Reject:  {{{rejectUrl}}}
+
+This request will expire in 4 hours.
+""",
+        "html": """<p>Hi,</p>
+<p>An EC2 launch request is pending your approval.</p>
+<table>
+<tr><th align="left">Requester</th><td>{{requesterEmail}}</td></tr>
+<tr><th align="left">Instance Name</th><td>{{instanceName}}</td></tr>
+<tr><th align="left">Instance Type</th><td>{{instanceType}} &times; {{instanceCount}}</td></tr>
+<tr><th align="left">Subnet ID</th><td>{{subnetId}}</td></tr>
+<tr><th align="left">Private IP</th><td>{{privateIp}}</td></tr>
+<tr><th align="left">Security Groups</th><td>{{securityGroups}}</td></tr>
+<tr><th align="left">EBS Volume</th><td>{{ebsVolumeSize}} / {{ebsVolumeType}}</td></tr>
+<tr><th align="left">AMI</th><td>{{amiId}} ({{amiSource}})</td></tr>
+</table>
+<p><a href="{{approveUrl}}">Approve</a> &nbsp; <a href="{{rejectUrl}}">Reject</a></p>
+<p>This request will expire in 4 hours.</p>
+"""
+    },
+    "EC2ApprovalDigest": {
+        "subject": "[Approval Required] {{{count}}} EC2 launch requests",
+        "text": """Hi,
+
+{{{count}}} EC2 launch requests are pending your approval.
+
+Approve all {{{count}}}: {{{approveAllUrl}}}
+{{#each requests}}
+
+=== {{{n}}}. {{{instanceName}}} ({{{instanceType}}} x {{{instanceCount}}}) ===
+Requester: {{{requesterEmail}}}
+Subnet ID: {{{subnetId}}}
+AMI ID: {{{amiId}}}
+Request ID: {{{requestId}}}
+Approve: {{{approveUrl}}}
+Reject:  {{{rejectUrl}}}
+{{/each}}
+
+Each request expires 4 hours after it was submitted.
+""",
+        "html": """<p>Hi,</p>
+<p>{{count}} EC2 launch requests are pending your approval.</p>
+<p><a href="{{approveAllUrl}}">Approve all {{count}}</a></p>
+<table>
+<tr><th>#</th><th>Instance</th><th>Requester</th><th>Subnet</th><th>AMI</th><th></th></tr>
+{{#each requests}}
+<tr><td>{{n}}</td><td>{{instanceName}} ({{instanceType}} &times; {{instanceCount}})</td><td>{{requesterEmail}}</td><td>{{subnetId}}</td><td>{{amiId}}</td><td><a href="{{approveUrl}}">Approve</a> <a href="{{rejectUrl}}">Reject</a></td></tr>
+{{/each}}
+</table>
+<p>Each request expires 4 hours after it was submitted.</p>
+"""
+    },
+    "EC2RequesterNotification": {
+        "subject": "[Request {{{decision}}}] {{{title}}}",
+        "text": """Decision: {{{decision}}}
+{{#if reason}}
+Reason: {{{reason}}}
+{{/if}}
+
+=== Instance Details ===
+{{#if instanceName}}
+Instance Name: {{{instanceName}}}
+{{/if}}
+{{#if instanceType}}
+Instance Type: {{{instanceType}}}
+{{/if}}
+{{#if instanceId}}
+Instance ID: {{{instanceId}}}
+{{/if}}
+{{#if fleet}}
+Instances Launched: {{{fleet.count}}}
+Instance IDs: {{{fleet.ids}}}
+{{/if}}
+{{#if shortfall}}
+
+=== Incomplete Fleet ===
+Only {{{shortfall.launched}}} of {{{shortfall.requested}}} instances were launched.
+{{#if shortfall.errors}}
+Errors: {{{shortfall.errors}}}
+{{/if}}
+{{/if}}
+{{#if readiness}}
+
+=== Readiness ===
+Running: {{{readiness.running}}} of {{{readiness.total}}}
+Status checks passed: {{{readiness.statusOk}}} of {{{readiness.total}}}
+{{#if readiness.timeToRunning}}
+Time to running: {{{readiness.timeToRunning}}} s
+{{/if}}
+{{#if readiness.failedIds}}
+Stopped or terminated: {{{readiness.failedIds}}}
+{{/if}}
+{{#if readiness.notReadyIds}}
+Still starting: {{{readiness.notReadyIds}}}
+{{/if}}
+{{/if}}
+{{#if amiId}}
+
+=== AMI ===
+AMI ID: {{{amiId}}}
+{{#if amiSource}}
+Source: {{{amiSource}}}
+{{/if}}
+{{/if}}
+{{#if storage}}
+
+=== Storage ===
+{{#if storage.size}}
+EBS Volume Size: {{{storage.size}}} GB
+{{/if}}
+{{#if storage.type}}
+EBS Volume Type: {{{storage.type}}}
+{{/if}}
+{{/if}}
+{{#if privateIp}}
+
+=== Network ===
+Private IP: {{{privateIp}}}
+{{/if}}
+""",
+        "html": """<p><strong>Decision: {{decision}}</strong></p>
+{{#if reason}}
+<p>Reason: {{reason}}</p>
+{{/if}}
+<table>
+{{#if instanceName}}
+<tr><th align="left">Instance Name</th><td>{{instanceName}}</td></tr>
+{{/if}}
+{{#if instanceType}}
+<tr><th align="left">Instance Type</th><td>{{instanceType}}</td></tr>
+{{/if}}
+{{#if instanceId}}
+<tr><th align="left">Instance ID</th><td>{{instanceId}}</td></tr>
+{{/if}}
+{{#if fleet}}
+<tr><th align="left">Instances Launched</th><td>{{fleet.count}}: {{fleet.ids}}</td></tr>
+{{/if}}
+{{#if shortfall}}
+<tr><th align="left">Incomplete Fleet</th><td>Only {{shortfall.launched}} of {{shortfall.requested}} launched. {{shortfall.errors}}</td></tr>
+{{/if}}
+{{#if readiness}}
+<tr><th align="left">Running</th><td>{{readiness.running}} of {{readiness.total}}</td></tr>
+<tr><th align="left">Status checks passed</th><td>{{readiness.statusOk}} of {{readiness.total}}</td></tr>
+{{/if}}
+{{#if amiId}}
+<tr><th align="left">AMI</th><td>{{amiId}} {{amiSource}}</td></tr>
+{{/if}}
+{{#if storage}}
+<tr><th align="left">EBS Volume</th><td>{{storage.size}} GB {{storage.type}}</td></tr>
+{{/if}}
+{{#if privateIp}}
+<tr><th align="left">Private IP</th><td>{{privateIp}}</td></tr>
+{{/if}}
+</table>
+"""
+    }
+}
+
+_TAG = re.compile(r"\{\{\{\s*([\w.]+)\s*\}\}\}|\{\{\s*(#if|#each|/if|/each|else)?\s*([\w.]*)\s*\}\}")
+# A block tag alone on its line renders no line at all (Handlebars "standalone" rule)
+_STANDALONE = re.compile(r"^[ \t]*(\{\{\s*(?:#if|#each|/if|/each|else)[^}]*\}\})[ \t]*\r?\n", re.MULTILINE)
+
+def _lookup(context, path):
+    value = context
+    for key in path:
+        if key == "this":
+            continue
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+def _text(value):
+    return "" if value is None else str(value)
+
+def _parse(source):
+    """Turn a template into nested nodes: str, (var, path, escape), [kind, path, body, else_body]"""
+    root = []
+    stack = [(None, root)]
+    pos = 0
+    for match in _TAG.finditer(source):
+        nodes = stack[-1][1]
+        if match.start() > pos:
+            nodes.append(source[pos:match.start()])
+        pos = match.end()
+
+        raw, keyword, path = match.groups()
+        if raw:
+            nodes.append(("var", raw.split("."), False))
+        elif keyword in ("#if", "#each"):
+            block = [keyword[1:], path.split("."), [], []]
+            nodes.append(block)
+            stack.append((block, block[2]))
+        elif keyword == "else":
+            block = stack[-1][0]
+            if block is None or block[0] != "if":
+                raise ValueError("{{else}} outside {{#if}}")
+            stack[-1] = (block, block[3])
+        elif keyword in ("/if", "/each"):
+            block = stack.pop()[0]
+            if block is None or block[0] != keyword[1:]:
+                raise ValueError(f"Unexpected {{{{{keyword}}}}}")
+        else:
+            nodes.append(("var", path.split("."), True))
+
+    if len(stack) != 1:
+        raise ValueError(f"Unclosed {{{{#{stack[-1][0][0]}}}}}")
+    if pos < len(source):
+        root.append(source[pos:])
+    return root
+
+def _compile_nodes(nodes):
+    parts = []
+    for node in nodes:
+        if isinstance(node, str):
+            parts.append(lambda context, text=node: text)
+        elif node[0] == "var":
+            if node[2]:
+                parts.append(lambda context, path=node[1]: html.escape(_text(_lookup(context, path))))
+            else:
+                parts.append(lambda context, path=node[1]: _text(_lookup(context, path)))
+        elif node[0] == "if":
+            then, otherwise = _compile_nodes(node[2]), _compile_nodes(node[3])
+            parts.append(lambda context, path=node[1], then=then, otherwise=otherwise:
+                         then(context) if _lookup(context, path) else otherwise(context))
+        else:
+            body = _compile_nodes(node[2])
+            parts.append(lambda context, path=node[1], body=body:
+                         "".join(body(item) for item in _lookup(context, path) or ()))
+
+    if len(parts) == 1:
+        return parts[0]
+    return lambda context: "".join(part(context) for part in parts)
+
+def compile_template(source):
+    """Compile one Handlebars-subset template into a render(data) function"""
+    return _compile_nodes(_parse(_STANDALONE.sub(r"\1", source)))
+
+# Compiled once per container
+_compiled = {
+    name: {part: compile_template(source) for part, source in template.items()}
+    for name, template in TEMPLATES.items()
+}
+
+def render(name, data):
+    """Render a template locally; returns {"subject", "text", "html"}"""
+    return {part: render_part(data) for part, render_part in _compiled[name].items()}
+
+def send(name, source, to, data):
+    """Send one templated email to one address"""
+    ses = get_client("ses")
+    if RENDERING == "ses":
+        ses.send_templated_email(
+            Source=source,
+            Destination={"ToAddresses": [to]},
+            Template=name,
+            TemplateData=json.dumps(data, default=str)
+        )
+        return
+
+    rendered = render(name, data)
+    ses.send_email(
+        Source=source,
+        Destination={"ToAddresses": [to]},
+        Message={
+            "Subject": {"Data": rendered["subject"]},
+            "Body": {
+                "Text": {"Data": rendered["text"]},
+                "Html": {"Data": rendered["html"]}
+            }
+        }
+    )
+
+def send_bulk(name, source, messages):
+    """
+    Send one template to many recipients, each with its own data.
+
+    Args:
+        messages: List of (to, data) pairs
+
+    Returns:
+        One error message (or None on success) per message, in input order
+    """
+    errors = []
+    if RENDERING != "ses":
+        for to, data in messages:
+            try:
+                send(name, source, to, data)
+                errors.append(None)
+            except Exception as e:
+                errors.append(str(e))
+        return errors
+
+    ses = get_client("ses")
+    for start in range(0, len(messages), BULK_BATCH_SIZE):
+        chunk = messages[start:start + BULK_BATCH_SIZE]
+        try:
+            statuses = ses.send_bulk_templated_email(
+                Source=source,
+                Template=name,
+                DefaultTemplateData="{}",
+                Destinations=[{
+                    "Destination": {"ToAddresses": [to]},
+                    "ReplacementTemplateData": json.dumps(data, default=str)
+                } for to, data in chunk]
+            )["Status"]
+        except Exception as e:
+            errors.extend([str(e)] * len(chunk))
+            continue
+        errors.extend(None if status["Status"] == "Success" else f"{status['Status']}: {status.get('Error', '')}"
+                      for status in statuses)
+    return errors
@@ -0,0 +1,164 @@
+"""
+Idempotent request handling backed by a DynamoDB table with TTL.
+
+A submission is identified by its Idempotency-Key header, scoped to the
+requester, or without one by a hash of its normalized body. The first caller
+claims the key with a conditional put; later callers get the stored response
+back from the failed condition check (ReturnValuesOnConditionCheckFailure),
+so a duplicate costs one round trip and never starts a second workflow. Warm
+containers also keep recent responses in an in-process LRU and skip DynamoDB
+entirely.
+
+Every claim stores the body hash, and a key sent again with a different body
+raises KeyReused instead of replaying another request's response. A claim is
+only a lease until the response is stored: if the function dies in between,
+the next caller takes the key over once IDEMPOTENCY_LEASE_SECONDS have passed.
+
+Storage errors other than a lost claim are logged and ignored: submissions
+are never blocked because the idempotency table is unavailable.
+
+Environment Variables:
+    IDEMPOTENCY_TABLE: Table name (default: EC2ApprovalIdempotency)
+    IDEMPOTENCY_TTL_SECONDS: How long a key is remembered (default: 900)
+    IDEMPOTENCY_LEASE_SECONDS: How long an unfinished claim holds the key; set it to
+        RequestStarter's timeout (default: 30)
+    IDEMPOTENCY_CACHE_SIZE: Responses kept in the in-process LRU (default: 1024)
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+from aws_clients import get_client
+
+TABLE_NAME = os.environ.get("IDEMPOTENCY_TABLE", "EC2ApprovalIdempotency")
+TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "900"))
+LEASE_SECONDS = int(os.environ.get("IDEMPOTENCY_LEASE_SECONDS", "30"))
+CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "1024"))
+
+HEADER = "idempotency-key"
+
+# key -> (expires_at, body hash, response payload)
+_cache = OrderedDict()
+
+class KeyReused(Exception):
+    """The idempotency key was already used for a different request body"""
+
+def body_hash(body):
+    """sha256 of the normalized request body"""
+    normalized = json.dumps(body, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+def request_key(headers, body):
+    """
+    Derive the idempotency key for a request.
+
+    Args:
+        headers: Request headers (any case)
+        body: Parsed request body
+
+    Returns:
+        "key:<requesterEmail>#<header value>" if the client sent a key,
+        else "hash:<sha256 of body>"
+    """
+    for name, value in (headers or {}).items():
+        if name.lower() == HEADER and value:
+            return f"key:{body.get('requesterEmail', '')}#{value.strip()}"
+    return f"hash:{body_hash(body)}"
+
+def cached_response(key, request_hash):
+    """
+    Return the response remembered by this container, or None.
+
+    Raises:
+        KeyReused: the key was remembered for a different body
+    """
+    entry = _cache.get(key)
+    if entry is None:
+        return None
+    if entry[0] < time.time():
+        del _cache[key]
+        return None
+    if entry[1] != request_hash:
+        raise KeyReused(key)
+    _cache.move_to_end(key)
+    return entry[2]
+
+def _remember(key, request_hash, payload, expires_at):
+    _cache[key] = (expires_at, request_hash, payload)
+    _cache.move_to_end(key)
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+
+def claim(key, request_hash):
+    """
+    Claim a key before starting work.
+
+    The claim expires after LEASE_SECONDS; complete() extends it to the full
+    TTL. A claim whose lease has run out can be taken over.
+
+    Returns:
+        None if the caller owns the key and should proceed. Otherwise the
+        stored response payload of the original submission, or an empty dict
+        if that submission is still in progress.
+
+    Raises:
+        KeyReused: the key is held by a request with a different body
+    """
+    now = int(time.time())
+    client = get_client("dynamodb")
+    try:
+        client.put_item(
+            TableName=TABLE_NAME,
+            Item={
+                "idempotencyKey": {"S": key},
+                "bodyHash": {"S": request_hash},
+                "expiresAt": {"N": str(now + LEASE_SECONDS)}
+            },
+            ConditionExpression="attribute_not_exists(idempotencyKey) OR expiresAt < :now",
+            ExpressionAttributeValues={":now": {"N": str(now)}},
+            ReturnValuesOnConditionCheckFailure="ALL_OLD"
+        )
+        return None
+    except client.exceptions.ConditionalCheckFailedException as e:
+        old = e.response.get("Item", {})
+        if old.get("bodyHash", {}).get("S", request_hash) != request_hash:
+            raise KeyReused(key)
+        if "response" not in old:
+            return {}
+        payload = json.loads(old["response"]["S"])
+        _remember(key, request_hash, payload, int(old["expiresAt"]["N"]))
+        return payload
+    except Exception as e:
+        print(f"Idempotency claim failed, continuing without it: {str(e)}")
+        return None
+
+def complete(key, request_hash, payload):
+    """Store the response for a claimed key so duplicates can replay it"""
+    expires_at = int(time.time()) + TTL_SECONDS
+    _remember(key, request_hash, payload, expires_at)
+    try:
+        get_client("dynamodb").update_item(
+            TableName=TABLE_NAME,
+            Key={"idempotencyKey": {"S": key}},
+            UpdateExpression="SET #response = :response, expiresAt = :expiresAt",
+            ExpressionAttributeNames={"#response": "response"},
+            ExpressionAttributeValues={
+                ":response": {"S": json.dumps(payload)},
+                ":expiresAt": {"N": str(expires_at)}
+            }
+        )
+    except Exception as e:
+        print(f"Failed to store idempotent response: {str(e)}")
+
+def release(key):
+    """Give up a claim after a failure so the client can retry"""
+    try:
+        get_client("dynamodb").delete_item(
+            TableName=TABLE_NAME,
+            Key={"idempotencyKey": {"S": key}}
+        )
+    except Exception as e:
+        print(f"Failed to release idempotency key: {str(e)}")
@@ -0,0 +1,150 @@
+"""
+Pre-flight validation of EC2 launch parameters against cached inventories.
+
+Subnets (with free IP counts), security groups and instance-type offerings
+per Availability Zone are each loaded with one paginated Describe* call and
+cached through TwoTierCache, so a whole TTL window of requests shares a
+single refresh per resource type instead of calling EC2 per request.
+
+A cached inventory can be up to INVENTORY_TTL_SECONDS old, so a request the
+cache would reject (unknown subnet or security group, too few free IPs) is
+checked once more against freshly loaded subnets and security groups before
+it is rejected. At most one such reload per inventory runs every
+INVENTORY_REFRESH_SECONDS, however many bad requests arrive.
+
+If an inventory cannot be loaded (e.g. missing IAM permissions) validation
+is skipped rather than blocking submissions; LaunchEC2 remains the final
+check.
+
+Environment Variables:
+    INVENTORY_TTL_SECONDS: How long each inventory is cached (default: 300)
+    INVENTORY_REFRESH_SECONDS: Least age of an inventory reloaded to confirm a rejection (default: 10)
+"""
+
+import ipaddress
+import os
+
+from aws_clients import get_client
+from cache import TwoTierCache
+
+INVENTORY_TTL_SECONDS = int(os.environ.get("INVENTORY_TTL_SECONDS", "300"))
+INVENTORY_REFRESH_SECONDS = int(os.environ.get("INVENTORY_REFRESH_SECONDS", "10"))
+
+inventory_cache = TwoTierCache("inventory", INVENTORY_TTL_SECONDS)
+
+def load_subnets(_):
+    """subnetId -> [availabilityZone, vpcId, cidrBlock, availableIpCount]"""
+    subnets = {}
+    for page in get_client("ec2").get_paginator("describe_subnets").paginate():
+        for subnet in page["Subnets"]:
+            subnets[subnet["SubnetId"]] = [
+                subnet["AvailabilityZone"],
+                subnet["VpcId"],
+                subnet["CidrBlock"],
+                subnet["AvailableIpAddressCount"]
+            ]
+    return subnets
+
+def load_security_groups(_):
+    """groupId -> vpcId"""
+    groups = {}
+    for page in get_client("ec2").get_paginator("describe_security_groups").paginate():
+        for group in page["SecurityGroups"]:
+            groups[group["GroupId"]] = group.get("VpcId", "")
+    return groups
+
+def load_instance_types(_):
+    """availabilityZone -> sorted list of offered instance types"""
+    offerings = {}
+    paginator = get_client("ec2").get_paginator("describe_instance_type_offerings")
+    for page in paginator.paginate(LocationType="availability-zone"):
+        for offering in page["InstanceTypeOfferings"]:
+            offerings.setdefault(offering["Location"], []).append(offering["InstanceType"])
+    return {zone: sorted(types) for zone, types in offerings.items()}
+
+def load_vcpus(_):
+    """instanceType -> default vCPU count"""
+    vcpus = {}
+    for page in get_client("ec2").get_paginator("describe_instance_types").paginate():
+        for instance_type in page["InstanceTypes"]:
+            vcpus[instance_type["InstanceType"]] = instance_type["VCpuInfo"]["DefaultVCpus"]
+    return vcpus
+
+LOADERS = {
+    "subnets": load_subnets,
+    "securityGroups": load_security_groups,
+    "instanceTypes": load_instance_types,
+    "vcpus": load_vcpus
+}
+
+def get_inventory(name):
+    """Return one cached inventory by name"""
+    return inventory_cache.get(name, LOADERS[name])
+
+def refresh_inventory(name):
+    """Reload one inventory from EC2, unless it was loaded in the last INVENTORY_REFRESH_SECONDS"""
+    return inventory_cache.refresh(name, LOADERS[name], min_age=INVENTORY_REFRESH_SECONDS)
+
+def validate_launch(request):
+    """
+    Check a request's network and instance settings against the inventories.
+
+    A rejection is confirmed against freshly loaded subnets and security
+    groups first, so resources created since the inventories were cached
+    are not refused.
+
+    Returns:
+        Error message, or None if the request is valid (or could not be checked)
+    """
+    try:
+        offerings = get_inventory("instanceTypes")
+        error = check_launch(request, get_inventory("subnets"), get_inventory("securityGroups"), offerings)
+        if error is None:
+            return None
+        print(f"Re-checking against fresh inventories: {error}")
+        return check_launch(request, refresh_inventory("subnets"), refresh_inventory("securityGroups"), offerings)
+    except Exception as e:
+        print(f"Inventory unavailable, skipping pre-flight validation: {str(e)}")
+        return None
+
+def check_launch(request, subnets, groups, offerings):
+    """Error message for a request that the given inventories rule out, or None"""
+    subnet_ids = request.get("subnetIds") or [request["subnetId"]]
+    count = request.get("instanceCount", 1)
+    free_total = 0
+
+    for subnet_id in subnet_ids:
+        subnet = subnets.get(subnet_id)
+        if subnet is None:
+            return f"Subnet {subnet_id} not found"
+        zone, vpc_id, cidr, free_ips = subnet
+
+        if free_ips < 1:
+            return f"Subnet {subnet_id} has no free IP addresses"
+        free_total += free_ips
+
+        for group_id in request["securityGroupIds"]:
+            if group_id not in groups:
+                return f"Security group {group_id} not found"
+            if groups[group_id] != vpc_id:
+                return f"Security group {group_id} is not in {vpc_id} (subnet {subnet_id})"
+
+        instance_type = request["instanceType"]
+        if instance_type not in offerings.get(zone, ()):
+            return f"Instance type {instance_type} is not offered in {zone}"
+
+    if free_total < count:
+        return f"Only {free_total} free IP addresses for {count} instances"
+
+    # A single instance always lands in the first subnet
+    private_ip = request.get("privateIpAddress")
+    if private_ip:
+        subnet_id = subnet_ids[0]
+        cidr = subnets[subnet_id][2]
+        try:
+            if ipaddress.ip_address(private_ip) not in ipaddress.ip_network(cidr):
+                return f"Private IP {private_ip} is outside subnet {subnet_id} ({cidr})"
+        except ValueError:
+            return f"Invalid private IP address: {private_ip}"
+
+    return None
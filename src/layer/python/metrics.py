@@ -0,0 +1,117 @@
+"""
+Pipeline timing instrumentation in CloudWatch Embedded Metric Format.
+
+Each record is one JSON line printed to the function's log; CloudWatch
+extracts the metrics from it asynchronously, so instrumenting a handler
+costs a json.dumps and a print, with no AWS call.
+
+Two kinds of record are written:
+    Stage     One per request per pipeline stage (see STAGES), with
+              SinceSubmitSeconds: time from RequestStarter's timestamp to
+              reaching the stage. Dimension: Stage.
+    Handler   One per invocation from @instrument, with DurationMs.
+              Dimension: Function.
+
+Every record carries the request's ID as the requestId property, the
+correlation ID that ties one request's log lines together across
+functions, e.g. in CloudWatch Logs Insights:
+
+    fields @timestamp, @log, Stage, SinceSubmitSeconds
+    | filter requestId = "<requestId>" | sort @timestamp
+
+Environment Variables:
+    METRICS_NAMESPACE: CloudWatch namespace (default: EC2ApprovalWorkflow)
+"""
+
+import functools
+import json
+import os
+import time
+
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "EC2ApprovalWorkflow")
+
+# Pipeline stages, in order
+STAGES = ("submit", "emailSent", "decision", "launch", "running", "notified")
+
+def _unit(name):
+    if name.endswith("Ms"):
+        return "Milliseconds"
+    if name.endswith("Seconds"):
+        return "Seconds"
+    return "Count"
+
+def emit(values, dimensions=None, dimension_sets=None, unit=None, **properties):
+    """
+    Print one EMF record.
+
+    Args:
+        values: {metric name: value}
+        dimensions: {dimension name: value}
+        dimension_sets: Dimension name lists to aggregate by (default: all
+            of dimensions together)
+        unit: Unit of every value (default: from each name's suffix,
+            ...Ms or ...Seconds, otherwise Count)
+        **properties: Extra fields logged with the record (not metrics)
+    """
+    dimensions = dimensions or {}
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": NAMESPACE,
+                "Dimensions": dimension_sets or [list(dimensions)],
+                "Metrics": [{"Name": name, "Unit": unit or _unit(name)} for name in values]
+            }]
+        },
+        **dimensions,
+        **values,
+        **properties
+    }
+    print(json.dumps(record, default=str))
+
+def stage(name, request_id, submitted_at=None, **properties):
+    """
+    Record that a request reached a pipeline stage.
+
+    Args:
+        name: One of STAGES
+        request_id: Correlation ID of the request
+        submitted_at: The request's submission timestamp (epoch seconds);
+            without it only the log line is written
+        **properties: Extra fields, e.g. outcome or workflow
+    """
+    if submitted_at is None:
+        print(json.dumps({"Stage": name, "requestId": request_id, **properties}, default=str))
+        return
+    emit(
+        {"SinceSubmitSeconds": round(time.time() - float(submitted_at), 3)},
+        {"Stage": name},
+        requestId=request_id,
+        **properties
+    )
+
+def correlation_id(event):
+    """The requestId carried by a handler's event, or None"""
+    if not isinstance(event, dict):
+        return None
+    for source in (event, event.get("request"), event.get("params")):
+        if isinstance(source, dict) and source.get("requestId"):
+            return source["requestId"]
+    return None
+
+def instrument(function_name):
+    """Decorator logging a handler's duration and correlation ID per invocation"""
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            started = time.perf_counter()
+            try:
+                return handler(event, context)
+            finally:
+                emit(
+                    {"DurationMs": round((time.perf_counter() - started) * 1000, 3)},
+                    {"Function": function_name},
+                    requestId=correlation_id(event)
+                )
+        return wrapper
+    return decorate
@@ -0,0 +1,103 @@
+"""
+Per-requester instance and vCPU quotas.
+
+A requester's usage is read from the usage#<email>#<day> counter items that
+AggregateStats keeps in the stats table (see request_stats): one
+BatchGetItem for the days of the lookback window, rounded out to whole UTC
+days. They hold the instances of every PENDING or APPROVED request by day
+of submission: launched instance IDs or, while pending, its instanceCount.
+The counters outlive the requests table's 4-hour TTL, so a launched instance
+keeps counting for the whole lookback window. vCPUs per instance type come
+from DescribeInstanceTypes, cached with the other EC2 inventories (see
+inventory).
+
+The table does not track terminations, so an instance counts against its
+requester until the lookback window has passed. The counters follow the
+table's stream, so requests submitted in the last second or so may not be
+counted yet.
+
+If usage cannot be read the quota is not enforced, as with the other
+pre-flight checks.
+
+Environment Variables:
+    QUOTA_MAX_INSTANCES: Instances per requester, 0 for no limit (default: 0)
+    QUOTA_MAX_VCPUS: vCPUs per requester, 0 for no limit (default: 0)
+    QUOTA_LOOKBACK_SECONDS: How long a launched instance counts (default: 2592000, 30 days)
+    STATS_TABLE: Counter table name (default: EC2ApprovalStats)
+"""
+
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import inventory
+import request_stats
+
+MAX_INSTANCES = int(os.environ.get("QUOTA_MAX_INSTANCES", "0"))
+MAX_VCPUS = int(os.environ.get("QUOTA_MAX_VCPUS", "0"))
+LOOKBACK_SECONDS = int(os.environ.get("QUOTA_LOOKBACK_SECONDS", str(30 * 86400)))
+
+def enabled():
+    """True if any quota is configured"""
+    return bool(MAX_INSTANCES or MAX_VCPUS)
+
+def lookback_days(now=None):
+    """UTC days (YYYY-MM-DD) overlapping the lookback window, oldest first"""
+    now = time.time() if now is None else now
+    first = datetime.fromtimestamp(now - LOOKBACK_SECONDS, timezone.utc).date()
+    last = datetime.fromtimestamp(now, timezone.utc).date()
+    return [(first + timedelta(days=n)).isoformat() for n in range((last - first).days + 1)]
+
+def usage(requester_email):
+    """
+    Instances a requester has pending or launched.
+
+    Returns:
+        List of (instanceType, count), one per instance type and day
+    """
+    keys = [request_stats.usage_key(requester_email, day) for day in lookback_days()]
+    counted = []
+    for counters in request_stats.get_counters(keys).values():
+        for name, count in counters.items():
+            if name.startswith(request_stats.TYPE_PREFIX) and count > 0:
+                counted.append((name[len(request_stats.TYPE_PREFIX):], count))
+    return counted
+
+def check(requester_email, requests):
+    """
+    Check new requests from one requester against the quotas.
+
+    Args:
+        requester_email: Requester of every entry in requests
+        requests: Validated request bodies about to be submitted
+
+    Returns:
+        Error message, or None if the requests fit (or usage is unknown)
+    """
+    try:
+        current = usage(requester_email)
+    except Exception as e:
+        print(f"Quota usage unavailable for {requester_email}, skipping check: {str(e)}")
+        return None
+    new = [(body["instanceType"], body.get("instanceCount", 1)) for body in requests]
+
+    if MAX_INSTANCES:
+        in_use = sum(count for _, count in current)
+        requested = sum(count for _, count in new)
+        if in_use + requested > MAX_INSTANCES:
+            return (f"Instance quota exceeded: {in_use} in use + {requested} requested "
+                    f"> {MAX_INSTANCES} for {requester_email}")
+
+    if MAX_VCPUS:
+        try:
+            vcpus = inventory.get_inventory("vcpus")
+        except Exception as e:
+            print(f"vCPU inventory unavailable, skipping vCPU quota: {str(e)}")
+            return None
+        in_use = sum(vcpus.get(instance_type, 1) * count for instance_type, count in current)
+        requested = sum(vcpus.get(instance_type, 1) * count for instance_type, count in new)
+        if in_use + requested > MAX_VCPUS:
+            return (f"vCPU quota exceeded: {in_use} in use + {requested} requested "
+                    f"> {MAX_VCPUS} for {requester_email}")
+
+    return None
@@ -0,0 +1,128 @@
+"""
+Per-requester token bucket rate limiting backed by DynamoDB.
+
+Each requester has a bucket of RATE_LIMIT_BURST tokens that refills at
+RATE_LIMIT_PER_MINUTE; every submitted request takes one. Instead of a token
+count and a last-refill time, the item stores a single number, fullAt: the
+time the bucket will be full again (the "theoretical arrival time" of the
+generic cell rate algorithm). Taking tokens then never needs a
+read-modify-write:
+
+    idle bucket (fullAt <= now):  SET fullAt = now + count * interval
+    busy bucket:                  ADD fullAt count * interval
+                                  if fullAt <= now + (burst - count) * interval
+
+Both are single conditional UpdateItems, so concurrent containers draining
+the same bucket never lose an update and never overspend it. A failed
+condition returns the current item (ReturnValuesOnConditionCheckFailure);
+the request then either switches to the other update or is rejected, with
+no separate read.
+
+Warm containers remember each requester's last fullAt to pick the right
+update first, and reject a requester whose bucket they know is empty
+without calling DynamoDB at all.
+
+As with idempotency, storage errors are logged and the request is allowed:
+submissions are never blocked because the table is unavailable.
+
+Environment Variables:
+    RATE_LIMIT_TABLE: Table name (default: EC2ApprovalRateLimits)
+    RATE_LIMIT_BURST: Bucket size, 0 disables rate limiting (default: 10)
+    RATE_LIMIT_PER_MINUTE: Refill rate in requests per minute (default: 2)
+    RATE_LIMIT_CACHE_SIZE: Requesters remembered in-process (default: 1024)
+"""
+
+import os
+import time
+from collections import OrderedDict
+
+from aws_clients import get_client
+
+TABLE_NAME = os.environ.get("RATE_LIMIT_TABLE", "EC2ApprovalRateLimits")
+BURST = int(os.environ.get("RATE_LIMIT_BURST", "10"))
+INTERVAL = 60 / float(os.environ.get("RATE_LIMIT_PER_MINUTE", "2"))
+CACHE_SIZE = int(os.environ.get("RATE_LIMIT_CACHE_SIZE", "1024"))
+
+# Updates tried before giving up on a contended bucket
+MAX_ATTEMPTS = 3
+
+# requester -> fullAt as last seen in DynamoDB
+_full_at = OrderedDict()
+# requester -> time before which the bucket cannot hold a token
+_blocked = OrderedDict()
+
+def enabled():
+    """True unless rate limiting is switched off"""
+    return BURST > 0
+
+def acquire(requester, count=1):
+    """
+    Take count tokens from a requester's bucket.
+
+    Args:
+        requester: Requester email (case-insensitive)
+        count: Requests being submitted, at most BURST
+
+    Returns:
+        0 if the requests may proceed, else the seconds until they could
+    """
+    key = requester.lower()
+    now = time.time()
+    blocked_until = _blocked.get(key)
+    if blocked_until is not None:
+        if blocked_until > now:
+            return blocked_until - now
+        del _blocked[key]
+
+    client = get_client("dynamodb")
+    full_at = _full_at.get(key, 0)
+    for _ in range(MAX_ATTEMPTS):
+        limit = now + (BURST - count) * INTERVAL
+        if full_at > limit:
+            _remember(_full_at, key, full_at)
+            _remember(_blocked, key, now + (full_at - limit))
+            return full_at - limit
+
+        values = {
+            ":now": {"N": f"{now:.6f}"},
+            ":expires": {"N": str(int(now + BURST * INTERVAL) + 60)}
+        }
+        if full_at <= now:
+            update = "SET fullAt = :new, expiresAt = :expires"
+            condition = "attribute_not_exists(fullAt) OR fullAt <= :now"
+            values[":new"] = {"N": f"{now + count * INTERVAL:.6f}"}
+        else:
+            update = "SET expiresAt = :expires ADD fullAt :step"
+            condition = "fullAt > :now AND fullAt <= :limit"
+            values[":step"] = {"N": f"{count * INTERVAL:.6f}"}
+            values[":limit"] = {"N": f"{limit:.6f}"}
+
+        try:
+            result = client.update_item(
+                TableName=TABLE_NAME,
+                Key={"requesterEmail": {"S": key}},
+                UpdateExpression=update,
+                ConditionExpression=condition,
+                ExpressionAttributeValues=values,
+                ReturnValues="UPDATED_NEW",
+                ReturnValuesOnConditionCheckFailure="ALL_OLD"
+            )
+            _remember(_full_at, key, float(result["Attributes"]["fullAt"]["N"]))
+            return 0
+        except client.exceptions.ConditionalCheckFailedException as e:
+            old = e.response.get("Item") or {}
+            full_at = float(old["fullAt"]["N"]) if "fullAt" in old else 0
+            now = time.time()
+        except Exception as e:
+            print(f"Rate limit check failed, allowing request: {str(e)}")
+            return 0
+
+    # Only a burst from the same requester straddling an idle bucket gets here
+    print(f"Rate limit bucket for {key} is contended, rejecting")
+    return INTERVAL
+
+def _remember(cache, key, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > CACHE_SIZE:
+        cache.popitem(last=False)
@@ -0,0 +1,273 @@
+"""
+History archive of request rows, partitioned by submission day and status.
+
+Rows in EC2ApprovalRequests expire through TTL (expirationTime) a few hours
+after submission. ArchiveRequests copies each row TTL deletes from the
+table's stream, and scripts/archive_requests.py backfills the rows still in
+the table, so reports over any period read the archive instead of DynamoDB.
+
+Layout (Hive-style partitions, so Athena, DuckDB or Spark can read it too):
+    <root>/date=<YYYY-MM-DD>/status=<STATUS>/part-<ms>-<id>.jsonl.gz
+
+date is the UTC day of the row's timestamp. Each part file is gzip
+compressed JSON Lines: one row per line, compact separators and sorted keys,
+numbers as JSON numbers and lists kept as lists, plus archivedAt (epoch
+seconds). Readers prune partitions by name before opening a file, then skip
+lines that cannot match a requester before parsing them.
+
+A row can be archived more than once (backfilled, then deleted by TTL, or a
+retried stream batch). Copies of a decided row land in the same partition,
+and readers keep the one archived last.
+
+root is a local directory or s3://bucket/prefix. For an S3-compatible store
+set AWS_ENDPOINT_URL_S3 (read by boto3 itself).
+
+Environment Variables:
+    ARCHIVE_URL: Archive root, a local directory or s3://bucket/prefix
+"""
+
+import gzip
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from aws_clients import get_client
+
+ARCHIVE_URL = os.environ.get("ARCHIVE_URL", "")
+
+SUFFIX = ".jsonl.gz"
+
+# Concurrent part file reads and writes
+MAX_WORKERS = 10
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def day(timestamp):
+    """UTC day (YYYY-MM-DD) of an epoch timestamp"""
+    return datetime.fromtimestamp(int(timestamp or 0), timezone.utc).date().isoformat()
+
+def partition(row):
+    """Partition path of a row, e.g. date=2025-01-31/status=APPROVED"""
+    return f"date={day(row.get('timestamp'))}/status={row.get('status') or 'UNKNOWN'}"
+
+def encode(rows):
+    """gzip compressed JSON Lines for a list of rows"""
+    lines = [json.dumps(row, separators=(",", ":"), sort_keys=True, default=_json_value) for row in rows]
+    return gzip.compress(("\n".join(lines) + "\n").encode(), compresslevel=6)
+
+def _part_key(name):
+    return f"{name}/part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}{SUFFIX}"
+
+def _split(root):
+    # (bucket, key prefix) for s3:// roots, (None, directory) otherwise
+    if not root.startswith("s3://"):
+        return None, root
+    bucket, _, prefix = root[5:].partition("/")
+    return bucket, prefix.strip("/") + "/" if prefix.strip("/") else ""
+
+def _put(root, key, data):
+    bucket, base = _split(root)
+    if bucket:
+        get_client("s3").put_object(Bucket=bucket, Key=base + key, Body=data)
+        return
+    path = os.path.join(base, *key.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Never leave a partial part file where readers would see it
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+def _get(root, key):
+    bucket, base = _split(root)
+    if bucket:
+        return get_client("s3").get_object(Bucket=bucket, Key=base + key)["Body"].read()
+    with open(os.path.join(base, *key.split("/")), "rb") as f:
+        return f.read()
+
+def _delete(root, keys):
+    bucket, base = _split(root)
+    if bucket:
+        for start in range(0, len(keys), 1000):
+            get_client("s3").delete_objects(
+                Bucket=bucket,
+                Delete={"Objects": [{"Key": base + key} for key in keys[start:start + 1000]], "Quiet": True}
+            )
+        return
+    for key in keys:
+        os.remove(os.path.join(base, *key.split("/")))
+
+def _list(root, prefix="", children=False):
+    """
+    Keys under a prefix, relative to root.
+
+    With children=True only the names directly below prefix are returned
+    (S3 common prefixes, or directory entries).
+    """
+    bucket, base = _split(root)
+    if bucket:
+        paginator = get_client("s3").get_paginator("list_objects_v2")
+        kwargs = {"Bucket": bucket, "Prefix": base + prefix}
+        if children:
+            kwargs["Delimiter"] = "/"
+        names = []
+        for page in paginator.paginate(**kwargs):
+            if children:
+                names += [p["Prefix"][len(base + prefix):].rstrip("/") for p in page.get("CommonPrefixes", [])]
+            else:
+                names += [obj["Key"][len(base):] for obj in page.get("Contents", [])]
+        return names
+
+    directory = os.path.join(base, *prefix.split("/"))
+    if not os.path.isdir(directory):
+        return []
+    if children:
+        return os.listdir(directory)
+    keys = []
+    for dirpath, _, filenames in os.walk(directory):
+        relative = os.path.relpath(dirpath, base).replace(os.sep, "/")
+        keys += [f"{relative}/{name}" for name in filenames]
+    return keys
+
+def write(root, rows, archived_at=None):
+    """
+    Archive rows, one new part file per partition they fall in.
+
+    Args:
+        root: Archive root (local directory or s3://bucket/prefix)
+        rows: Request items (Decimal numbers and sets are converted)
+        archived_at: Epoch seconds recorded as archivedAt (default: now)
+
+    Returns:
+        {partition: rows written}
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if not root:
+        raise ValueError("No archive location given (set ARCHIVE_URL)")
+    archived_at = int(archived_at if archived_at is not None else time.time())
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(partition(row), []).append({**row, "archivedAt": archived_at})
+
+    def put(item):
+        name, group = item
+        _put(root, _part_key(name), encode(group))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(grouped)))) as pool:
+        list(pool.map(put, grouped.items()))
+    return {name: len(group) for name, group in grouped.items()}
+
+def partitions(root, since=None, until=None, statuses=None):
+    """
+    Partitions that can hold matching rows, pruned by name.
+
+    Args:
+        root: Archive root
+        since, until: Epoch seconds bounding the submission time
+        statuses: Statuses to keep (default: all)
+
+    Returns:
+        [(partition, [part file keys])], newest day first
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    first = day(since) if since is not None else None
+    last = day(until) if until is not None else None
+    statuses = {status.upper() for status in statuses} if statuses else None
+
+    days = sorted((name[5:] for name in _list(root, children=True) if name.startswith("date=")), reverse=True)
+    days = [date for date in days if not (first and date < first) and not (last and date > last)]
+    if not days:
+        return []
+
+    def list_day(date):
+        grouped = {}
+        for key in _list(root, f"date={date}/"):
+            name, _, filename = key.rpartition("/")
+            if not filename.endswith(SUFFIX):
+                continue
+            if statuses and name.rpartition("status=")[2] not in statuses:
+                continue
+            grouped.setdefault(name, []).append(key)
+        return sorted(grouped.items())
+
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(days))) as pool:
+        return [item for items in pool.map(list_day, days) for item in items]
+
+def load(root, keys, since=None, until=None, requester=None):
+    """
+    Rows from the part files of one partition, last archived copy of each.
+
+    Args:
+        root: Archive root
+        keys: Part file keys of a single partition
+        since, until: Epoch seconds bounding the submission time
+        requester: Only rows of this requester email
+    """
+    # Rows are written with sorted keys and compact separators, so a
+    # requester can be matched on the raw line before it is parsed
+    needle = f'"requesterEmail":{json.dumps(requester)}'.encode() if requester else None
+    latest = {}
+    for key in keys:
+        for line in gzip.decompress(_get(root, key)).splitlines():
+            if not line or (needle and needle not in line):
+                continue
+            row = json.loads(line)
+            submitted = row.get("timestamp") or 0
+            if (since is not None and submitted < since) or (until is not None and submitted > until):
+                continue
+            kept = latest.get(row.get("requestId"))
+            if kept is None or row.get("archivedAt", 0) >= kept.get("archivedAt", 0):
+                latest[row.get("requestId")] = row
+    return list(latest.values())
+
+def read(root, since=None, until=None, statuses=None, requester=None):
+    """
+    Yield archived rows matching the filters.
+
+    Partitions outside the day range or statuses are never opened. Up to
+    MAX_WORKERS partitions are read concurrently, a bounded number ahead of
+    the caller; rows come partition by partition, newest day first,
+    unordered within a partition.
+
+    Args:
+        root: Archive root (local directory or s3://bucket/prefix)
+        since, until: Epoch seconds bounding the submission time
+        statuses: Statuses to read (default: all)
+        requester: Only rows of this requester email
+    """
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    found = deque(partitions(root, since, until, statuses))
+    if not found:
+        return
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(found))) as pool:
+        pending = deque()
+        while found or pending:
+            while found and len(pending) < 2 * MAX_WORKERS:
+                pending.append(pool.submit(load, root, found.popleft()[1], since, until, requester))
+            yield from pending.popleft().result()
+
+def compact(root, name, keys):
+    """
+    Merge a partition's part files into one, dropping duplicate copies.
+
+    The merged file is written before the old ones are deleted, so an
+    interrupted compaction leaves duplicates for readers to drop, never a gap.
+
+    Returns:
+        Rows in the merged file
+    """
+    rows = load(root, keys)
+    _put(root, _part_key(name), encode(rows))
+    _delete(root, keys)
+    return len(rows)
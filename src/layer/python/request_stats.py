@@ -0,0 +1,225 @@
+"""
+Pre-aggregated request counters in the EC2ApprovalStats table.
+
+Every request contributes to a handful of counter items:
+    all                      requests, per-status counts, autoApproved
+    day#<YYYY-MM-DD>         the same, for requests submitted that day (UTC)
+    requester#<email>        requests and per-status counts
+    instanceType#<type>      requests, instances and per-status counts
+    latency#<decision>       count, sumSeconds and one le_<n> bucket per
+                             decision time (submission to decision)
+    usage#<email>#<YYYY-MM-DD>
+                             instances, and type#<instanceType> counts, of
+                             the requester's PENDING and APPROVED requests
+                             submitted that day (read by quotas)
+    autoApproved#<email>#<YYYY-MM-DDTHH>
+                             requests auto-approved for the requester in that
+                             hour of submission (read by auto_approval)
+
+contribution() computes one request's counters from its item. The
+AggregateStats function applies the difference between a stream record's
+new and old images, so a status change moves the request from one status
+counter to the other and records its latency once. scripts/rebuild_stats.py
+sums contribution() over the history archive and a scan of the table to
+rebuild the counters.
+
+Rows deleted by TTL are not subtracted: the counters are a history, not a
+mirror of the table. That is what lets quotas and auto-approval limits
+count further back than the rows' 4-hour TTL. Rows deleted by a user or a
+function are subtracted, since those requests never ran.
+
+Every counter item also holds lastBatch, the stream batch that last updated
+it, so a retried batch does not add its deltas twice.
+
+Environment Variables:
+    STATS_TABLE: Counter table name (default: EC2ApprovalStats)
+"""
+
+import os
+import time
+from datetime import datetime, timezone
+
+from aws_clients import get_client
+from dynamodb_items import deserialize_item
+
+TABLE_NAME = os.environ.get("STATS_TABLE", "EC2ApprovalStats")
+
+# Upper bounds (seconds) of the decision latency histogram buckets
+LATENCY_BUCKETS = (10, 60, 300, 900, 3600, 14400)
+
+DECIDED = ("APPROVED", "REJECTED", "EXPIRED")
+
+# Statuses whose instances count against a requester's quota
+IN_USE = ("PENDING", "APPROVED")
+
+# Per-instance-type counters of usage# items: type#<instanceType>
+TYPE_PREFIX = "type#"
+
+# Concurrent UpdateItem calls when flushing counters
+MAX_WORKERS = 10
+
+# Attribute holding the last stream batch applied to a counter item
+BATCH_ATTRIBUTE = "lastBatch"
+
+# Keys per BatchGetItem call, and retries of unprocessed keys
+BATCH_GET_SIZE = 100
+MAX_RETRIES = 5
+
+def usage_key(requester_email, day):
+    """Counter item of a requester's instances in use for a UTC day (YYYY-MM-DD)"""
+    return f"usage#{requester_email}#{day}"
+
+def auto_approved_key(requester_email, hour):
+    """Counter item of a requester's auto-approved requests for a UTC hour (YYYY-MM-DDTHH)"""
+    return f"autoApproved#{requester_email}#{hour}"
+
+def latency_bucket(seconds):
+    """Histogram attribute for a decision latency"""
+    for bound in LATENCY_BUCKETS:
+        if seconds <= bound:
+            return f"le_{bound}"
+    return "le_inf"
+
+def contribution(item):
+    """
+    Counters one request adds to the stats table.
+
+    Args:
+        item: Request item (numbers as int or Decimal), or None
+
+    Returns:
+        {statKey: {counter: value}}
+    """
+    if not item or "timestamp" not in item:
+        return {}
+    status = item.get("status", "UNKNOWN")
+    counts = {"requests": 1, status: 1}
+
+    if status == "APPROVED" and item.get("instanceIds"):
+        instances = len(item["instanceIds"])
+    else:
+        instances = int(item.get("instanceCount") or 1)
+
+    submitted = datetime.fromtimestamp(int(item["timestamp"]), timezone.utc)
+    day = submitted.strftime("%Y-%m-%d")
+    totals = dict(counts, autoApproved=1) if item.get("autoApprovalRule") else counts
+    stats = {
+        "all": totals,
+        f"day#{day}": totals,
+        f"requester#{item.get('requesterEmail', 'unknown')}": counts,
+        f"instanceType#{item.get('instanceType') or 'unknown'}": dict(counts, instances=instances)
+    }
+
+    if status in IN_USE:
+        stats[usage_key(item.get("requesterEmail", "unknown"), day)] = {
+            "instances": instances,
+            TYPE_PREFIX + (item.get("instanceType") or "unknown"): instances
+        }
+
+    if item.get("autoApprovalRule"):
+        hour = submitted.strftime("%Y-%m-%dT%H")
+        stats[auto_approved_key(item.get("requesterEmail", "unknown"), hour)] = {"requests": 1}
+
+    if status in DECIDED and item.get("approvalTimestamp"):
+        seconds = max(0, int(item["approvalTimestamp"]) - int(item["timestamp"]))
+        stats[f"latency#{status}"] = {"count": 1, "sumSeconds": seconds, latency_bucket(seconds): 1}
+    return stats
+
+def accumulate(totals, stats, sign=1):
+    """Add (or with sign=-1 subtract) one contribution into totals"""
+    for key, counters in stats.items():
+        target = totals.setdefault(key, {})
+        for name, value in counters.items():
+            target[name] = target.get(name, 0) + sign * value
+
+def flush(totals, batch_id=None):
+    """
+    Apply accumulated deltas with one ADD UpdateItem per counter item.
+
+    With a batch_id (the stream batch's last sequence number) each update
+    also sets lastBatch, on condition that the item does not hold that
+    batch already; items a failed attempt updated are skipped when the
+    batch is retried. A retry that arrives after another batch updated the
+    same item, or a bisected batch, is still counted twice;
+    scripts/rebuild_stats.py recomputes the counters.
+
+    Returns:
+        Number of items updated
+    """
+    updates = []
+    for key, counters in totals.items():
+        counters = {name: value for name, value in counters.items() if value}
+        if counters:
+            updates.append((key, counters))
+    if not updates:
+        return 0
+
+    client = get_client("dynamodb")
+
+    def add(update):
+        key, counters = update
+        names = {f"#c{i}": name for i, name in enumerate(counters)}
+        values = {f":v{i}": {"N": str(value)} for i, value in enumerate(counters.values())}
+        expression = "ADD " + ", ".join(f"#c{i} :v{i}" for i in range(len(counters)))
+        if batch_id is None:
+            client.update_item(
+                TableName=TABLE_NAME,
+                Key={"statKey": {"S": key}},
+                UpdateExpression=expression,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values
+            )
+            return True
+        names["#batch"] = BATCH_ATTRIBUTE
+        values[":batch"] = {"S": batch_id}
+        try:
+            client.update_item(
+                TableName=TABLE_NAME,
+                Key={"statKey": {"S": key}},
+                UpdateExpression=f"{expression} SET #batch = :batch",
+                ConditionExpression="attribute_not_exists(#batch) OR #batch <> :batch",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values
+            )
+            return True
+        except client.exceptions.ConditionalCheckFailedException:
+            # Already applied by an earlier attempt of this batch
+            return False
+
+    if len(updates) == 1:
+        return int(add(updates[0]))
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(updates))) as pool:
+        return sum(pool.map(add, updates))
+
+def get_counters(keys):
+    """
+    Read counter items with BatchGetItem, 100 keys per call.
+
+    Unprocessed keys are retried with exponential backoff; any still left
+    after MAX_RETRIES raise, so callers never mistake them for zero counts.
+
+    Returns:
+        {statKey: {counter: int}} for the keys that have an item
+    """
+    client = get_client("dynamodb")
+    found = {}
+    for start in range(0, len(keys), BATCH_GET_SIZE):
+        request = {TABLE_NAME: {"Keys": [{"statKey": {"S": key}} for key in keys[start:start + BATCH_GET_SIZE]]}}
+        for attempt in range(MAX_RETRIES + 1):
+            response = client.batch_get_item(RequestItems=request)
+            for item in response.get("Responses", {}).get(TABLE_NAME, []):
+                counters = deserialize_item(item)
+                key = counters.pop("statKey")
+                counters.pop(BATCH_ATTRIBUTE, None)
+                found[key] = {name: int(value) for name, value in counters.items()}
+            request = response.get("UnprocessedKeys") or {}
+            if not request:
+                break
+            if attempt < MAX_RETRIES:
+                time.sleep(0.05 * (2 ** attempt))
+        if request:
+            raise RuntimeError(f"{len(request[TABLE_NAME]['Keys'])} counter items unread after {MAX_RETRIES} retries")
+    return found
@@ -0,0 +1,85 @@
+"""
+Status updates for the EC2ApprovalRequests table.
+
+Writes the final decision of a request together with its StatusIndex shard
+(statusShard), so every writer keeps the two in step. RequestStarter takes
+the shard of a new PENDING row from status_shard() here too.
+
+Environment Variables:
+    DYNAMODB_TABLE: DynamoDB table name (default: EC2ApprovalRequests)
+    STATUS_SHARDS: Write shards per status in StatusIndex (default: 4, same on every function)
+"""
+
+import os
+import time
+import zlib
+
+from aws_clients import get_client
+from dynamodb_items import serialize_item
+
+TABLE_NAME = os.environ.get("DYNAMODB_TABLE", "EC2ApprovalRequests")
+STATUS_SHARDS = int(os.environ.get("STATUS_SHARDS", "4"))
+
+def status_shard(status, request_id):
+    """
+    StatusIndex partition key for a request.
+
+    Spreading each status over several partitions keeps a burst of PENDING
+    writes from throttling a single index partition.
+    """
+    return f"{status}#{zlib.crc32(request_id.encode()) % STATUS_SHARDS}"
+
+def update_status(request_id, decision, instance_ids=(), ami_id=None, approved_by=None, reason=None,
+                  decided_at=None, expected_status=None):
+    """
+    Record a request's decision with a single UpdateItem.
+
+    The row must still exist: once TTL has removed it, the update raises the
+    client's ConditionalCheckFailedException instead of re-creating a stub
+    item that has no timestamp or expirationTime and so would never expire.
+
+    Args:
+        request_id: Request to update
+        decision: New status, e.g. APPROVED | REJECTED | EXPIRED | FAILED
+        instance_ids: Launched instances (approved requests)
+        ami_id: AMI the instances were launched from
+        approved_by: Approver identity
+        reason: Why the request was not approved
+        decided_at: When the decision was made (default: now)
+        expected_status: Only update a row still in this status; otherwise
+            the client's ConditionalCheckFailedException is raised
+    """
+    update_expr = "SET #status = :status, statusShard = :statusShard, approvalTimestamp = :timestamp"
+    expr_attr_values = {
+        ":status": decision,
+        ":statusShard": status_shard(decision, request_id),
+        ":timestamp": int(decided_at if decided_at is not None else time.time())
+    }
+
+    if instance_ids:
+        update_expr += ", instanceId = :instanceId, instanceIds = :instanceIds"
+        expr_attr_values[":instanceId"] = instance_ids[0]
+        expr_attr_values[":instanceIds"] = list(instance_ids)
+    if approved_by:
+        update_expr += ", approvedBy = :approvedBy"
+        expr_attr_values[":approvedBy"] = approved_by
+    if reason:
+        update_expr += ", decisionReason = :reason"
+        expr_attr_values[":reason"] = reason
+    if ami_id:
+        update_expr += ", resolvedAmiId = :amiId"
+        expr_attr_values[":amiId"] = ami_id
+
+    condition = "attribute_exists(requestId)"
+    if expected_status:
+        condition += " AND #status = :expected"
+        expr_attr_values[":expected"] = expected_status
+
+    get_client("dynamodb").update_item(
+        TableName=TABLE_NAME,
+        Key=serialize_item({"requestId": request_id}),
+        UpdateExpression=update_expr,
+        ExpressionAttributeNames={"#status": "status"},
+        ExpressionAttributeValues=serialize_item(expr_attr_values),
+        ConditionExpression=condition
+    )